@@ -1,9 +1,12 @@
 #!/usr/bin/python
 
+import ast
 import collections as c
 import itertools as it
 
+import forgi
 import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.utilities.atom_position_table as ftuat
 import forgi.threedee.utilities.graph_pdb as ftug
 import forgi.threedee.utilities.pdb as ftup
 import forgi.threedee.utilities.vector as ftuv
@@ -13,13 +16,52 @@ import numpy as np
 import sys
 from optparse import OptionParser
 
+def read_generated_module(filename):
+    """
+    Read the positions from an old generated average_atom_positions.py module,
+    without executing it.
+
+    The module consists of lines `avg_atom_poss["<identifier>"] = [x,y,z]`.
+
+    :param filename: The filename of the module.
+    :returns: A dictionary identifier: position
+    """
+    with open(filename) as f:
+        tree = ast.parse(f.read(), filename)
+
+    avg_atom_poss = dict()
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        if (not isinstance(target, ast.Subscript) or not isinstance(target.value, ast.Name)
+                or target.value.id != "avg_atom_poss"):
+            continue
+        key = target.slice
+        if isinstance(key, getattr(ast, "Index", ())):
+            # Python < 3.9
+            key = key.value
+        avg_atom_poss[ast.literal_eval(key)] = ast.literal_eval(node.value)
+    return avg_atom_poss
+
 def main():
     usage = """
     python average_atom_positions.py atom_positions1.csv atom_positions2.csv ... etc
+
+    Average the atom positions and store them in the atom position table
+    used by forgi.threedee.utilities.average_atom_positions.
+
+    With --from-module, convert an old generated average_atom_positions.py
+    module into an atom position table instead.
     """
     num_args= 1
     parser = OptionParser(usage=usage)
 
+    parser.add_option('-o', '--output', dest='output',
+                      default=forgi.data_file('threedee/data/average_atom_positions'),
+                      help="The basename of the output table (without .npy/.index)", type='str')
+    parser.add_option('', '--from-module', dest='from_module', default=False, action='store_true',
+                      help="The argument is a generated average_atom_positions.py module")
     #parser.add_option('-o', '--options', dest='some_option', default='yo', help="Place holder for a real option", type='str')
     #parser.add_option('-u', '--useless', dest='uselesss', default=False, action='store_true', help='Another useless option')
 
@@ -29,6 +71,10 @@ def main():
         parser.print_help()
         sys.exit(1)
 
+    if options.from_module:
+        ftuat.write_atom_position_table(options.output, read_generated_module(args[0]))
+        return
+
     poss = c.defaultdict(list)
     sources = c.defaultdict(list)
 
@@ -50,12 +96,10 @@ def main():
         pos = list(map(float,parts[1].split(',')))
         poss[identifier] += [pos]
 
-    print("import collections as co")
-
-    print("avg_atom_poss = dict()")
+    avg_atom_poss = dict()
     for key in list(poss.keys()):
-        pos = np.mean(poss[key], axis=0)
-        print(('avg_atom_poss["%s"] = [%s] #%d' % (key, ",".join(map(str, pos)), len(poss[key]))))
+        avg_atom_poss[key] = np.mean(poss[key], axis=0)
+    ftuat.write_atom_position_table(options.output, avg_atom_poss)
 
     '''
     print "sources = dict()"
@@ -9,6 +9,10 @@ class Configuration:
     #pdb_base_dir = os.path.expanduser('~/data/ernwin/pdb')
     stats_file = forgi.data_file('threedee/data/stats/temp.stats')
     stem_fragment_dir = os.path.join(base_dir, 'forgi/data')
+    #: A directory where parsed stats files are cached between processes, e.g.
+    #: `os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'forgi')`.
+    #: None (the default) disables this cache.
+    stats_cache_dir = None
     #lric_stats_fn = os.path.join(base_dir, 'fess/stats/temp.energy')
     #template_residue_fn = os.path.join(base_dir, 'fess/stats/residue_template.pdb')
     #longrange_contact_stats_fn = os.path.join(base_dir, 'fess/stats/temp.longrange.contact')
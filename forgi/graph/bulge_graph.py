@@ -25,6 +25,7 @@ from ..aux.k2n_standalone import knotted2nested as fak
 from ..utilities import debug as fud
 from ..utilities import stuff as fus
 from ..threedee.utilities import mcannotate as ftum
+from ..utilities.observedDict import observedDict
 import os, warnings
 import operator as oper
 import numpy as np
@@ -328,14 +329,24 @@ class BulgeGraph(object):
         self.mst = None
         self.build_order = None
         self.name = "untitled"
-        #: The coarse grain element definitions: Keys are for example 's1'/ 'm2'/ 'h3'/ 'f1'/ 't1'
-        #: Values are the positions in the sequence (1D-coordinate) of start , end, ...
+        #: A list with the element name for every residue number (index 0 is unused).
+        #: Built lazily by self._get_residue_index() and reset whenever the defines change.
+        self._residue_index = None
+        #: Two dicts mapping seq_ids and resids (the number in the seq_id)
+        #: to 1-based positions. Reset whenever the seq_ids change.
+        self._seq_id_index = None
         self.defines = dict()
         self.edges = col.defaultdict(set)
         self.longrange = col.defaultdict(set)
         self.weights = dict()
         self.nx_graph = None
-        self.nuc_bp_dists = None
+        #: Cache for self._bp_distances_from(). Element name -> distance array.
+        self._nuc_bp_dists = {}
+        #: Sparse adjacency matrix (backbone + basepairs) used by self._bp_distances_from()
+        self._bp_graph = None
+        #: The nucleotides in any define and their column in self._nuc_bp_dists
+        self._bp_endpoints = None
+        self._bp_endpoint_index = None
         self._elem_bp_dists = {}
 
         # store the coordinate basis for each stem
@@ -358,6 +369,81 @@ class BulgeGraph(object):
         if bg_file is not None:
             self.from_bg_file(bg_file)
 
+    @property
+    def defines(self):
+        """
+        The coarse grain element definitions: Keys are for example 's1'/ 'm2'/ 'h3'/ 'f1'/ 't1'
+        Values are the positions in the sequence (1D-coordinate) of start , end, ...
+
+        Assigning to this attribute (or changing one of its keys) resets the
+        residue to element lookup used by `self.get_node_from_residue_num`.
+        """
+        return self._defines
+
+    @defines.setter
+    def defines(self, value):
+        self._defines = observedDict(value, on_change=self._reset_residue_index)
+        self._reset_residue_index()
+
+    @property
+    def seq_ids(self):
+        """
+        The pdb residue ids (triples) of all nucleotides in the order of the sequence.
+        """
+        return self._seq_ids
+
+    @seq_ids.setter
+    def seq_ids(self, value):
+        # Also called for `self.seq_ids += ...`
+        self._seq_ids = value
+        self._seq_id_index = None
+
+    def _reset_residue_index(self, key=None):
+        """
+        Used as on_change function for the observing of the self.defines dictionary.
+
+        :param key: A coarse grain element name, e.g. "s1" or "m15"
+        """
+        self._residue_index = None
+
+    def _get_residue_index(self):
+        """
+        Get a list, which contains the name of the element every residue belongs to.
+
+        The list is indexed by the (1-based) residue number, index 0 is None.
+        It is built once, and only rebuilt after the defines have changed.
+        """
+        if self._residue_index is None:
+            max_res = 0
+            for define in self.defines.values():
+                if define:
+                    max_res = max(max_res, max(int(d) for d in define))
+            index = [None] * (max_res + 1)
+            for key, define in self.defines.items():
+                for i in range(0, len(define), 2):
+                    a = sorted([int(define[i]), int(define[i + 1])])
+                    for resnum in range(max(a[0], 1), a[1] + 1):
+                        if index[resnum] is None:
+                            index[resnum] = key
+            self._residue_index = index
+        return self._residue_index
+
+    def _get_seq_id_index(self):
+        """
+        :returns: A tuple of two dictionaries. The first maps the seq_ids to
+                  (1-based) positions, the second maps the resids
+                  (the second entry of a seq_id) to positions.
+                  If a key occurs more than once, the lowest position is used.
+        """
+        if self._seq_id_index is None:
+            by_seq_id = {}
+            by_resid = {}
+            for i, seq_id in enumerate(self.seq_ids):
+                by_seq_id.setdefault(seq_id, i + 1)
+                by_resid.setdefault(seq_id[1], i + 1)
+            self._seq_id_index = (by_seq_id, by_resid)
+        return self._seq_id_index
+
     # get an internal index for a named vertex
     # this applies to both stems and edges
     def get_vertex(self, name=None):
@@ -636,8 +722,8 @@ class BulgeGraph(object):
         """
         Iterate over the seq_ids between the start_id and end_id.
         """
-        i1 = self.seq_ids.index(start_id)
-        i2 = self.seq_ids.index(end_id)
+        i1 = self.seq_id_to_pos(start_id) - 1
+        i2 = self.seq_id_to_pos(end_id) - 1
 
         for i in range(i1, i2 + 1):
             yield self.seq_ids[i]
@@ -650,7 +736,10 @@ class BulgeGraph(object):
         """
         if isinstance(seq_id, int):
             seq_id=(" ", seq_id, " ")
-        return self.seq_ids.index(seq_id)+1
+        try:
+            return self._get_seq_id_index()[0][seq_id]
+        except KeyError:
+            raise ValueError("{} is not in the seq_ids".format(seq_id))
 
     def create_bulge_graph(self, stems, bulges):
         """
@@ -814,6 +903,8 @@ class BulgeGraph(object):
                         new_j = 0
 
                         break
+        # The define lists were modified in place, which the observedDict does not notice.
+        self._reset_residue_index()
 
     def _merge_vertices(self, vertices):
         """
@@ -2427,24 +2518,23 @@ class BulgeGraph(object):
 
     def get_node_from_residue_num(self, base_num, seq_id=False):
         """
-        Iterate over the defines and see which one encompasses this base.
-        """
-        for key in list(self.defines.keys()):
-            define = self.defines[key]
+        Find the element which encompasses this base.
 
-            for i in range(0, len(define), 2):
-                a = [int(define[i]), int(define[i + 1])]
-                a.sort()
+        The lookup uses a residue to element index, which is built on the
+        first call and rebuilt only if the defines change.
 
-                if seq_id:
-                    for i in range(a[0], a[1] + 1):
-                        if self.seq_ids[i - 1][1] == base_num:
-                            return key
-                else:
-                    if base_num >= a[0] and base_num <= a[1]:
-                        return key
+        :param base_num: The 1-based residue number.
+        :param seq_id: If True, base_num is interpreted as the resid
+                       (the number in the pdb seq_id) instead.
+        """
+        pos = base_num
+        if seq_id:
+            pos = self._get_seq_id_index()[1].get(base_num)
+        index = self._get_residue_index()
+        if pos is not None and 0 < pos < len(index) and index[pos] is not None:
+            return index[pos]
 
-        raise LookupError("Base number %d not found in the defines." % (base_num))
+        raise LookupError("Base number {} not found in the defines.".format(base_num))
 
     def get_length(self, vertex):
         """
@@ -3233,40 +3323,68 @@ class BulgeGraph(object):
                    the two elements.
         '''
 
-        #flanking1 = self.flanking_nucleotides(e1)
-        #flanking2 = self.flanking_nucleotides(e2)
-
         if (e1,e2) in self._elem_bp_dists: #Shortcut if cached.
             return self._elem_bp_dists[(e1,e2)]
 
         min_bp = sys.maxsize
         max_bp = 0
 
-        if self.nx_graph is None:
-            self.nx_graph = self.to_networkx()
-
-        if self.nuc_bp_dists is None:
-            import networkx as nx
-            self.nuc_bp_dists = np.zeros((self.seq_length+1, self.seq_length+1))#col.defaultdict(dict)
-            self.nuc_bp_dists[0,:]=np.nan
-            self.nuc_bp_dists[:,0]=np.nan
-            dist_matrix = np.array(nx.floyd_warshall_numpy(self.nx_graph))
-            for (i1,n1), (i2,n2) in it.product(enumerate(self.nx_graph.nodes()),
-                                               enumerate(self.nx_graph.nodes())):
-                self.nuc_bp_dists[n1,n2] = dist_matrix[i1][i2]
-
-        for f1, f2 in it.product(set(self.defines[e1]), set(self.defines[e2])):
-            #d =  nx.dijkstra_path_length(self.nx_graph, f1, f2)
-            d = self.nuc_bp_dists[f1,f2]
-
-            if d < min_bp:
-                min_bp = d
-            if d > max_bp:
-                max_bp = d
+        dists = self._bp_distances_from(e1)
+        targets = [ self._bp_endpoint_index[f] for f in set(self.defines[e2]) ]
+        if len(dists) and targets:
+            dists = dists[:, targets].astype(float)
+            dists[dists<0] = np.inf
+            min_bp = np.min(dists)
+            max_bp = np.max(dists)
         self._elem_bp_dists[(e1,e2)] = (min_bp, max_bp)
         self._elem_bp_dists[(e2,e1)] = (min_bp, max_bp)
         return (min_bp, max_bp)
 
+    def _bp_distances_from(self, elem):
+        """
+        The number of backbone links and basepairs between the nucleotides at
+        the ends of elem and the nucleotides at the ends of all elements.
+
+        A breadth first search on the sparse graph described in
+        self.to_networkx() is used. The results are cached per source element.
+
+        :param elem: The element name, e.g. "s0"
+        :returns: An integer array with one row per entry in set(self.defines[elem]) (sorted)
+                  and one column per nucleotide in self._bp_endpoint_index.
+                  Unreachable nucleotides have a distance of -1.
+        """
+        if elem in self._nuc_bp_dists:
+            return self._nuc_bp_dists[elem]
+        import scipy.sparse
+        import scipy.sparse.csgraph
+
+        if self._bp_graph is None:
+            residues = sorted(set(r for d in self.defines
+                                    for r in self.define_residue_num_iterator(d)))
+            # Links along the backbone and along basepairs
+            edges = list(zip(residues[:-1], residues[1:]))
+            for stem in self.stem_iterator():
+                edges += list(self.stem_bp_iterator(stem))
+            edges = np.array(edges, dtype=np.int32).reshape(-1, 2)
+            self._bp_graph = scipy.sparse.coo_matrix((np.ones(len(edges), dtype=np.int8),
+                                                      (edges[:,0], edges[:,1])),
+                                                     shape=(self.seq_length+1, self.seq_length+1)).tocsr()
+            endpoints = sorted(set(f for d in self.defines for f in self.defines[d]))
+            self._bp_endpoints = np.array(endpoints, dtype=np.int32)
+            self._bp_endpoint_index = { f: i for i, f in enumerate(endpoints) }
+
+        sources = sorted(set(self.defines[elem]))
+        if sources:
+            dists = scipy.sparse.csgraph.shortest_path(self._bp_graph, method="D", directed=False,
+                                                       unweighted=True, indices=sources)
+            dists = dists[:, self._bp_endpoints]
+            dists[np.isinf(dists)] = -1
+            dists = dists.astype(np.int32)
+        else:
+            dists = np.zeros((0, len(self._bp_endpoints)), dtype=np.int32)
+        self._nuc_bp_dists[elem] = dists
+        return dists
+
     def nd_define_iterator(self):
         '''
         Iterate over defines which contain some nucleotides.
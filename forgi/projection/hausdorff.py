@@ -1,12 +1,17 @@
 
 import sys, math
 import numpy as np
+import scipy.ndimage
 from ..threedee.utilities import vector as ftuv
 from . import projection2d as fhp
 import random
 import itertools as it
+import multiprocessing as mp
+import threading
 
 __all__=["offsets", "modified_hausdorff_distance", "hausdorff_distance", 
+         "distance_transform", "hausdorff_distance_edt", "modified_hausdorff_distance_edt",
+         "ReferenceImage",
          "locally_minimal_distance", "globally_minimal_distance", "get_box", 
          "get_longest_img_diameter", "try_parameters"]
 __author__ = "Bernhard Thiel"
@@ -41,72 +46,129 @@ def norm(offset):
     """
     return math.sqrt(offset[0]**2+offset[1]**2)
 
-def offsets(skip=0, to_iterate=[], toskip={}): #pylint: disable=W0102
+class _OffsetTable(object):
+    """
+    All integer offsets (dx,dy) with a norm smaller than radius, 
+    sorted by their squared norm (and then by dx and dy). 
+    This is the order of the offsets() generator of earlier versions under Python >= 3.6.
+    (Under older Python versions, the order of offsets with the same norm depended on
+    the iteration order of a dictionary.)
+    
+    The offsets are stored as a structure of arrays. Tables are never modified 
+    after construction, so they can be shared between threads and generators.
+    """
+    def __init__(self, radius):
+        self.radius=int(math.ceil(radius))
+        r=self.radius
+        dx, dy = np.mgrid[-r:r+1, -r:r+1]
+        dx=dx.ravel()
+        dy=dy.ravel()
+        sq_norms=dx*dx+dy*dy
+        inside=sq_norms<r*r
+        dx, dy, sq_norms = dx[inside], dy[inside], sq_norms[inside]
+        order=np.lexsort((dy, dx, sq_norms))
+        self.dx=dx[order]
+        self.dy=dy[order]
+        self.sq_norms=sq_norms[order]
+        self.norms=np.sqrt(self.sq_norms)
+        #: bucket_start[s] is the index of the first offset with a squared norm >= s
+        self.bucket_start=np.searchsorted(self.sq_norms, np.arange(r*r+1), side="left")
+        # For the offsets() generator
+        self.tuples=list(zip(zip(self.dx.tolist(), self.dy.tolist()), self.norms.tolist()))
+
+    def __len__(self):
+        return len(self.sq_norms)
+
+    def start(self, skip):
+        """
+        The index of the first offset with a squared norm >= skip
+        """
+        if skip>=len(self.bucket_start):
+            return len(self)
+        return self.bucket_start[skip]
+
+_offset_table_lock=threading.Lock()
+_offset_tables=[_OffsetTable(32)]
+
+def _offset_table(radius):
+    """
+    The shared _OffsetTable, grown to at least the given radius.
+    """
+    table=_offset_tables[0]
+    if table.radius<radius:
+        with _offset_table_lock:
+            table=_offset_tables[0]
+            if table.radius<radius:
+                table=_OffsetTable(max(radius, 2*table.radius))
+                _offset_tables[0]=table
+    return table
+
+def offsets(skip=0):
     """
     An iterator over offsets and their length ((dx,dy), norm((dx,dy))) in the order 
     of increasing norm((dx,dy))
     dx and dy are integers, starting at (0,0).
 
-    :param skip: A float. The iterator may skip cell up to SKIP away from (0,0) 
-                 before returning the first value.
-    :param to_iterate: Do not use this. The mutable default parameter is used as a hack for caching.
-    :param toskip: Do not use this. The mutable default parameter is used as a hack for caching.
+    :param skip: An integer. The iterator skips all cells with a squared norm
+                 smaller than SKIP before returning the first value.
 
     :yields: A tuple ((dx,dy), n) where dx and dy are integers and n=norm((dx,dy)).
     """
-    # We take advatage of mutable default parameter: to_iterate=[] in the function declaration.
-    # If we iterate several times over offsets(), we only build to_iterate once!
-    if skip==0:
-        i=0
-    else:
-        i=toskip[skip]
+    table=_offset_table(math.sqrt(skip)+1)
+    i=table.start(skip)
     while True:
-        # Iterate over to_iterate.
-        # If we reached the end, increase to_iterate and 
-        # continue iteration with first added element.
-        len_to_iterate=len(to_iterate)
-        while i < len_to_iterate:
-            yield to_iterate[i]            
-            i+=1
-        increase_range(to_iterate, toskip)
-
-def increase_range(to_iterate, to_skip):
-    """
-    Increase the range of offsets, which are ordered by their norm. Used by offsets().
-
-    :param to_iterate: The list of offsets to be increased. 
-                       A list of coordinates and lengths ((dx,dy), norm((dx,dy))),
-                       ordered by increasing norm((dx,dy))
-    """
-    dists={}
-    if to_iterate:
-        length=to_iterate[-1][1]
-        newlength=int(length+25) #25 could be anything.
-        for dx in range(-newlength, newlength+1):
-            for dy in range(-newlength, newlength+1):
-                dd=(dx,dy)
-                if dd not in dists:
-                    dists[dd]=norm(dd)
-        oldlen=to_iterate[-1][0][0]**2+to_iterate[-1][0][1]**2
-        #print ("sorting {} elements for newlength {}".format(len(dists.keys()), newlength))
-        for x in sorted(list(dists.keys()), key=lambda x: dists[x]):
-            if length<dists[x]<newlength:
-                to_iterate.append((x, dists[x]))
-                if x[0]**2+x[1]**2>oldlen:
-                    to_skip[x[0]**2+x[1]**2]=len(to_iterate)-2
-    else:
-        length=25 #25 could be anything.
-        for dx in range(-length, length+1):
-            for dy in range(-length, length+1):
-                dd=(dx,dy)
-                dists[dd]=norm(dd)
-        oldlen=0
-        for x in sorted(list(dists.keys()), key=lambda x: dists[x]):
-            if not dists[x]<length:
-                continue
-            to_iterate.append((x, dists[x]))
-            if x[0]**2+x[1]**2>oldlen:
-                to_skip[x[0]**2+x[1]**2]=len(to_iterate)-2
+        # The smaller table is a prefix of the larger table
+        for i in range(i, len(table)):
+            yield table.tuples[i]
+        i=len(table)
+        table=_offset_table(2*table.radius)
+
+##############################################################################
+# Reference images
+##############################################################################
+
+class ReferenceImage(object):
+    """
+    A boolean image, which is compared to many other images.
+
+    Its distance transform and the list of its non-zero cells are only calculated once.
+    All distance functions of this module accept a ReferenceImage instead
+    of a boolean matrix. For other functions, it behaves like the boolean matrix.
+    """
+    def __init__(self, img):
+        """
+        :param img: A boolean square matrix (or a ReferenceImage).
+        """
+        if isinstance(img, ReferenceImage):
+            img = img.img
+        self.img = np.asarray(img, dtype=bool)
+        #: An array of shape (N x 2). The indices of all non-zero cells
+        self.points = np.transpose(np.where(self.img))
+        #: The distance of every cell to the closest non-zero cell. See distance_transform()
+        self.distance_transform = distance_transform(self.img)
+
+    @property
+    def shape(self):
+        return self.img.shape
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.img
+        return self.img.astype(dtype)
+
+    def __len__(self):
+        return len(self.img)
+
+    def __getitem__(self, key):
+        return self.img[key]
+
+def _points(img):
+    """
+    The indices of all non-zero cells of a boolean matrix or ReferenceImage.
+    """
+    if isinstance(img, ReferenceImage):
+        return img.points
+    return np.transpose(np.where(img))
 
 ##############################################################################
 # Grid based distances
@@ -117,24 +179,51 @@ def hausdorff_helperdist(p, img, cutoff=float("inf"), skip=0):
     Returns the shorthest distance from a given point p to any non-zero cell in img.
     This is used by hausdorff_distance()
 
+    The cells around p are tested in order of increasing distance, 
+    in blocks of offsets from the shared offset table.
+
     :param p: a point in matrix coordinates
     :param img: A binary matrix
     :param cutoff: If the distance is larger cutoff, return float("inf"). 
                    Increases execution speed
     :param skip: The function does not have to search for a distance smaller than skip 
-                 (used for speedup)
+                 (used for speedup). An integer, the squared distance.
     """
-    dpi=len(img)
+    img=np.asarray(img)
+    rows, cols = img.shape[:2]
     p0=p[0]
     p1=p[1]
-    for dd, n in offsets(skip):
-        x=p0+dd[0]
-        y=p1+dd[1]
-        if 0<=x<dpi and 0<=y<dpi and img[x, y]:
+    table=_offset_table(math.sqrt(skip)+1)
+    start=table.start(skip)
+    # Hits close to p are common, so the first offsets are tested one by one.
+    for i in range(start, min(start+9, len(table))):
+        (dx, dy), n = table.tuples[i]
+        x=p0+dx
+        y=p1+dy
+        if 0<=x<rows and 0<=y<cols and img[x, y]:
             return n
         if n>cutoff:
             return float("inf")
-    return float('inf')
+    start=min(start+9, len(table))
+    # No cell of the image is further away than the furthest corner.
+    max_sq_norm=max(p0**2, (rows-1-p0)**2)+max(p1**2, (cols-1-p1)**2)
+    block=64
+    while True:
+        # The first offset with a norm greater than cutoff is still tested.
+        end=min(len(table), np.searchsorted(table.norms, cutoff, side="right")+1)
+        while start<end:
+            stop=min(start+block, end)
+            x=p0+table.dx[start:stop]
+            y=p1+table.dy[start:stop]
+            inside=np.flatnonzero((x>=0) & (x<rows) & (y>=0) & (y<cols))
+            hits=inside[img[x[inside], y[inside]]!=0]
+            if len(hits):
+                return float(table.norms[start+hits[0]])
+            start=stop
+            block*=2
+        if end<len(table) or table.radius**2>max_sq_norm:
+            return float('inf')
+        table=_offset_table(2*table.radius)
 
 def hausdorff_distance(img, ref_img, cutoff=float("inf")):
     """
@@ -144,7 +233,7 @@ def hausdorff_distance(img, ref_img, cutoff=float("inf")):
     :param cutoff: A float. If the distance is greater than cutoff, return float("inf").
                    (Used to increase execution speed in certain cases)
     """
-    return hausdorff_distance_new(img, ref_img, cutoff)
+    return hausdorff_distance_edt(img, ref_img, cutoff)
     ##Source: https://de.wikipedia.org/wiki/Hausdorff-Metrik
     # h1=max(hausdorff_helperdist([x,y], img, cutoff) for x,y in np.transpose(np.where(ref_img) ))
     # if h1==float("inf"):
@@ -165,7 +254,7 @@ def hausdorff_distance_new(img, ref_img, cutoff=float("inf")):
     try:
         maxh=0
         oldh=0
-        for x,y in np.transpose(np.where(ref_img)):
+        for x,y in _points(ref_img):
             if oldh==0:
                 oldh=hausdorff_helperdist([x,y], img, cutoff)
                 oldx=x
@@ -183,7 +272,7 @@ def hausdorff_distance_new(img, ref_img, cutoff=float("inf")):
         h1=maxh
         maxh=0
         oldh=0
-        for x,y in np.transpose(np.where(img)):
+        for x,y in _points(img):
             if oldh==0:
                 oldh=hausdorff_helperdist([x,y], ref_img, cutoff)
                 oldx=x
@@ -216,14 +305,64 @@ def modified_hausdorff_distance( img, ref_img, _=None):
     Return the grid-based Modified Hausdorff distance between two aligned boolean matrices.
     This distance was proposed in the following paper: TODO
     It uses the mean of all distances instead of the max.
-    The current implementation is not optimized
     """
-    #Source: 
-    h1=sum(hausdorff_helperdist([x,y], img) 
-          for x,y in np.transpose(np.where(ref_img)))/np.sum(ref_img)
-    h2=sum(hausdorff_helperdist([x,y], ref_img) 
-           for x,y in np.transpose(np.where(img)))/np.sum(img)
-    return max( h1, h2)
+    return modified_hausdorff_distance_edt(img, ref_img)
+
+##############################################################################
+# Distances based on the euclidean distance transform
+##############################################################################
+
+def distance_transform(img):
+    """
+    The exact euclidean distance transform of a boolean matrix.
+
+    :param img: A boolean 2D matrix or a ReferenceImage (the cached transform is returned)
+    :returns: A float matrix with the same shape as img, containing for every cell
+              the distance to the closest non-zero cell of img.
+              If img has no non-zero cells, all distances are float("inf").
+    """
+    if isinstance(img, ReferenceImage):
+        return img.distance_transform
+    img = np.asarray(img, dtype=bool)
+    if not np.any(img):
+        return np.full(img.shape, float("inf"))
+    return scipy.ndimage.distance_transform_edt(~img)
+
+def _directed_distances(img, ref_img):
+    """
+    The distances from all non-zero cells of ref_img to the closest non-zero cell in img.
+    """
+    return distance_transform(img)[np.asarray(ref_img, dtype=bool)]
+
+def hausdorff_distance_edt(img, ref_img, cutoff=float("inf")):
+    """
+    The same as hausdorff_distance, but calculated from the
+    distance transforms of both images instead of by searching around every cell.
+
+    :param img, ref_img: Two aligned boolean 2D matrices with the same shape.
+    :param cutoff: A float. If the distance is greater than cutoff, return float("inf").
+    """
+    h = 0
+    for distances in (_directed_distances(img, ref_img), _directed_distances(ref_img, img)):
+        if len(distances):
+            h = max(h, np.max(distances))
+    if h > cutoff:
+        return float("inf")
+    return h
+
+def modified_hausdorff_distance_edt(img, ref_img, cutoff=float("inf")):
+    """
+    The same as modified_hausdorff_distance, but calculated from the
+    distance transforms of both images.
+
+    :param img, ref_img: Two aligned boolean 2D matrices with the same shape.
+    :param cutoff: A float. If the distance is greater than cutoff, return float("inf").
+    """
+    h = max(np.mean(_directed_distances(img, ref_img)),
+            np.mean(_directed_distances(ref_img, img)))
+    if h > cutoff:
+        return float("inf")
+    return h
 
 def tp_fp_distance( img, ref_img, _=None):
     tp=np.sum(np.logical_and(img, ref_img))
@@ -267,7 +406,7 @@ def locally_minimal_distance(ref_img, scale, cg,
     different directions, no matter how far one has to walk in that direction before 
     the distance changes. It then follows the deepest decrease (not the steepest decrease!) 
  
-    :param ref_img: The reference image. A boolean square matrix.
+    :param ref_img: The reference image. A boolean square matrix or a ReferenceImage.
     :param scale: The edge length in Angstrom of the reference image.
     :param cg: The coarse grain RNA to match to the projection.
     :param start_rot: The in-plane rotation of the projection.
@@ -283,6 +422,8 @@ def locally_minimal_distance(ref_img, scale, cg,
               Where distance is a float,image a matrix and params is a triple:
               np.array([theta, phi]), degrees, np.array([x_offset, y_offset])
     """
+    if not isinstance(ref_img, ReferenceImage):
+        ref_img=ReferenceImage(ref_img)
     dpi=len(ref_img)
     cell_length=scale/dpi
     ####### Heuristical parameters
@@ -449,7 +590,7 @@ def try_parameters(ref_img, scale, cg,
     (offset, in-plane rotation and projection direction)
     and find the ones with the shorthest Huasdorff distance.
     
-    :param ref_img: The reference image. A boolean square matrix.
+    :param ref_img: The reference image. A boolean square matrix or a ReferenceImage.
     :param scale: The edge length in Angstrom of the reference image.
     :param cg: The coarse grain RNA to match to the projection.
 
@@ -465,6 +606,8 @@ def try_parameters(ref_img, scale, cg,
     """
     if proj_directions is None:
         proj_directions=[to_polar(cg.project_from)[1:]]
+    if not isinstance(ref_img, ReferenceImage):
+        ref_img=ReferenceImage(ref_img)
     best_distance=float("inf")
     params=[ np.array([0,0]), 0, np.array([0,0])]
     best_img=None
@@ -520,15 +663,108 @@ def get_start_points_near(numPoints, ref_theta, ref_phi):
 
 def get_longest_img_diameter(img, scale):
     maxl=0
-    for x1,y1 in np.transpose(np.where(img)):
-        for x2,y2 in np.transpose(np.where(img)):
+    points=_points(img)
+    for x1,y1 in points:
+        for x2,y2 in points:
             l=(x1-x2+1)**2+(y1-y2+1)**2
             if l>maxl:
                 maxl=l
     return math.sqrt(maxl)*scale/len(img)
 
+def _initial_guess(ref_img, scale, cg, project_dir, starting_rotations, starting_offsets,
+                   virtual_atoms, use_heuristic, distance, longest_distance_image):
+    """
+    The best combination of starting rotation and offset for one projection direction.
+
+    :returns: None, if the projection direction is skipped because of the
+              longest-axis heuristic, else a triple (score, rotation, offset)
+    """
+    dpi=len(ref_img)
+    proj=fhp.Projection2D(cg, from_polar([1]+list(project_dir)), 
+                          project_virtual_atoms=virtual_atoms)
+    if use_heuristic:
+        if abs(proj.longest_axis-longest_distance_image)>6*scale/dpi: #4 pixels is arbitrary heuristic
+            return None
+    loc_best_rot=0
+    loc_best_offs=np.array([0,0])           
+    loc_best_score=float("inf")
+    for rot, offset in it.product(starting_rotations, starting_offsets):
+        box=get_box(proj, scale, offset)
+        img,_=proj.rasterize(dpi, bounding_square=box, warn=False, rotate=rot)
+        score = distance(ref_img, img)
+        if score<loc_best_score:
+            loc_best_score=score
+            loc_best_rot=rot
+            loc_best_offs=offset
+    return loc_best_score, loc_best_rot, loc_best_offs
+
+#: The data shared by all start points. Set once per worker process by _init_worker.
+_worker_data={}
+
+def _init_worker(ref_img, scale, cg, virtual_atoms, distance):
+    _worker_data.update(ref_img=ref_img, scale=scale, cg=cg, 
+                        virtual_atoms=virtual_atoms, distance=distance)
+
+def _worker_initial_guess(args):
+    project_dir, starting_rotations, starting_offsets, use_heuristic, longest_distance_image = args
+    d=_worker_data
+    return _initial_guess(d["ref_img"], d["scale"], d["cg"], project_dir, starting_rotations,
+                          starting_offsets, d["virtual_atoms"], use_heuristic, d["distance"],
+                          longest_distance_image)
+
+def _worker_local_optimization(args):
+    project_dir, rot, offset, local_maxiter = args
+    d=_worker_data
+    return locally_minimal_distance(d["ref_img"], d["scale"], d["cg"], rot, offset, project_dir,
+                                    maxiter=local_maxiter, virtual_atoms=d["virtual_atoms"],
+                                    distance=d["distance"])
+
+class _SpeculativeOptimizations(object):
+    """
+    Runs the local optimizations of the start points on a process pool,
+    ahead of the (sequential) decision, which start points are skipped.
+
+    Start points are only submitted, if the score heuristic with the best score
+    found so far predicts that they will be needed. The decision itself is always
+    taken with the exact sequential state, so the result does not depend on the
+    number of workers.
+    """
+    def __init__(self, pool, num_workers, tasks, guesses, use_heuristic):
+        self.pool=pool
+        self.num_workers=num_workers
+        self.tasks=tasks
+        self.guesses=guesses
+        self.use_heuristic=use_heuristic
+        self.pending={}
+        self.next_index=0
+
+    def _needed(self, i, best_score, decrease):
+        guess=self.guesses[i]
+        if guess is None:
+            return False
+        return not (self.use_heuristic and guess[0]>best_score+(decrease*1.75))
+
+    def prefetch(self, best_score, decrease):
+        while len(self.pending)<self.num_workers and self.next_index<len(self.tasks):
+            i=self.next_index
+            self.next_index+=1
+            if self._needed(i, best_score, decrease):
+                self.pending[i]=self.pool.apply_async(_worker_local_optimization, (self.tasks[i],))
+
+    def get(self, i):
+        # Results of skipped start points are never requested. Forget them.
+        for j in [ j for j in self.pending if j<i ]:
+            del self.pending[j]
+        if i not in self.pending:
+            self.pending[i]=self.pool.apply_async(_worker_local_optimization, (self.tasks[i],))
+            self.next_index=max(self.next_index, i+1)
+        return self.pending.pop(i).get()
+
 def _try_startpoints(ref_img, scale, cg, start_points, starting_rotations, 
-                     starting_offsets, local_maxiter, virtual_atoms, use_heuristic, distance, verbose):
+                     starting_offsets, local_maxiter, virtual_atoms, use_heuristic, distance, verbose,
+                     pool=None, num_workers=1):
+    if not isinstance(ref_img, ReferenceImage):
+        ref_img=ReferenceImage(ref_img)
     #Longest extention in the image
     longest_distance_image=get_longest_img_diameter(ref_img, scale)
     if longest_distance_image==0:
@@ -539,61 +775,51 @@ def _try_startpoints(ref_img, scale, cg, start_points, starting_rotations,
     no_heur=0
     score_heur=0
     #
-    dpi=len(ref_img)
     best_score=float('inf')
     decrease=float("inf")
+    if pool is not None:
+        # The initial guesses do not depend on each other. Calculate them all at once.
+        guesses=pool.map(_worker_initial_guess, 
+                         [ (project_dir, starting_rotations, starting_offsets, use_heuristic,
+                            longest_distance_image) for project_dir in start_points ])
+        speculative=_SpeculativeOptimizations(pool, num_workers, 
+                                              [ (project_dir, guess[1], guess[2], local_maxiter)
+                                                if guess is not None else None
+                                                for project_dir, guess in zip(start_points, guesses) ],
+                                              guesses, use_heuristic)
+        speculative.prefetch(best_score, decrease)
     for i, project_dir in enumerate(start_points):
         sys.stdout.write("{:2.0%}\r".format(i/len(start_points)))#Progress
         sys.stdout.flush()
-        proj=fhp.Projection2D(cg, from_polar([1]+list(project_dir)), 
-                              project_virtual_atoms=virtual_atoms)
-        
-        if use_heuristic:
-            if abs(proj.longest_axis-longest_distance_image)>6*scale/dpi: #4 pixels is arbitrary heuristic
-                #print("abs({}-{})={}>{}".format(proj.longest_axis, longest_distance_image, abs(proj.longest_axis-longest_distance_image), 6*scale/dpi))                
-                #proj.plot(show=True)
-                la_heur+=1
-                continue
-        loc_best_rot=0
-        loc_best_offs=np.array([0,0])           
-        loc_best_score=float("inf")
-        for rot, offset in it.product(starting_rotations, starting_offsets):
-            box=get_box(proj, scale, offset)
-            img,_=proj.rasterize(dpi, bounding_square=box, warn=False, rotate=rot)
-            score = distance(ref_img, img)
-            if score<loc_best_score:
-                loc_best_score=score
-                loc_best_rot=rot
-                loc_best_offs=offset
-                #loc_best_img=img
-        #print("HEUR?", loc_best_score, best_score, best_score+(decrease*1.5))
+        if pool is None:
+            guess=_initial_guess(ref_img, scale, cg, project_dir, starting_rotations, starting_offsets,
+                                 virtual_atoms, use_heuristic, distance, longest_distance_image)
+        else:
+            guess=guesses[i]
+        if guess is None:
+            la_heur+=1
+            continue
+        loc_best_score, loc_best_rot, loc_best_offs = guess
         if use_heuristic and loc_best_score>best_score+(decrease*1.75):
             score_heur+=1 
-            #print("Score")
-            #proj.plot(show=True)
             continue
-        #import matplotlib.pyplot as plt
-        #fig, ax=plt.subplots(3)
-        #ax[0].imshow(ref_img, interpolation="none", cmap='gray')
-        #ax[1].imshow(loc_best_img, interpolation="none", cmap='gray')
-        #ax[0].set_title("Reference")
-        #ax[1].set_title("Initial distance {}".format(loc_best_score))
         no_heur+=1
-        score, img, params = locally_minimal_distance(ref_img, scale, cg, 
-                                                      loc_best_rot, loc_best_offs, project_dir,
-                                                      maxiter=local_maxiter, 
-                                                      virtual_atoms=virtual_atoms, distance=distance)
-        #ax[2].imshow(img, interpolation="none", cmap='gray')
-        #ax[2].set_title("Optimized to {}".format(score))
-        #plt.show()
+        if pool is None:
+            score, img, params = locally_minimal_distance(ref_img, scale, cg, 
+                                                          loc_best_rot, loc_best_offs, project_dir,
+                                                          maxiter=local_maxiter, 
+                                                          virtual_atoms=virtual_atoms, distance=distance)
+        else:
+            score, img, params = speculative.get(i)
         if score<best_score:
             best_score=score
             best_img=img
             best_params=params
             decrease=loc_best_score-score #Can increase or decrease
-            #print("Decrease {} to {}".format(loc_best_score, score), decrease)
         if best_score==0: 
             break
+        if pool is not None:
+            speculative.prefetch(best_score, decrease)
     sys.stdout.write("   \r")
     if verbose:
         print(("Global optimization performe!\n"
@@ -612,13 +838,13 @@ def globally_minimal_distance(ref_img, scale, cg,
                               starting_rotations=(0, 180), 
                               starting_offsets=(np.array([0,0]), ), 
                               local_maxiter=5, use_heuristic=True, virtual_atoms=True,
-                              verbose=False, distance=hausdorff_distance):
+                              verbose=False, distance=hausdorff_distance, num_workers=1, seed=1):
     """
     Global minimization of Hausdorff distance.
 
     Uses several Heuristics to speed up the process.
     
-    :param ref_img: The reference image. A boolean square matrix.
+    :param ref_img: The reference image. A boolean square matrix or a ReferenceImage.
     :param scale: The edge length in Angstrom of the reference image.
     :param cg: The coarse grain RNA to match to the projection.
 
@@ -631,39 +857,52 @@ def globally_minimal_distance(ref_img, scale, cg,
     :param use_heuristic: A Boolean
     :param virtual_atoms: Boolean. If False, do not project virtual atoms (faster)
     :param verbose: If True, print a summary at the end.
+    :param distance: a function with signature like hausdorff_distance.
+                     Has to be picklable, if num_workers is not 1.
+    :param num_workers: INT. The number of processes used for the local optimizations.
+                        1 for no multiprocessing, -1 for one less than the number of CPUs.
+                        The result does not depend on the number of workers.
+    :param seed: The seed for shuffling the starting projection directions.
 
     :returns: A triple: (best_distance, best_image, best_parameters)
               Where best_distance is a float, best_image a matrix and best params is a triple:
               np.array([theta, phi]), degrees, np.array([x_offset, y_offset])
     """
 
+    if not isinstance(ref_img, ReferenceImage):
+        ref_img=ReferenceImage(ref_img)
     best_score=float("inf")
     decrease=float("inf")
     sp=get_start_points(start_points)
 
     #We want to cover many different directions with the first few iterations.
     r=random.Random()
-    r.seed(1)
+    r.seed(seed)
     r.shuffle(sp)
     #random.shuffle(sp)
 
-    best_score, best_img, best_params =_try_startpoints(ref_img, scale, cg, sp, 
-                      starting_rotations, starting_offsets, local_maxiter, virtual_atoms, 
-                      use_heuristic, distance, verbose)
-    #import matplotlib.pyplot as plt
-    #fig, ax=plt.subplots(2)
-    #ax[0].imshow(ref_img, interpolation="none", cmap='gray')
-    #ax[1].imshow(best_img, interpolation="none", cmap='gray')
-    #ax[0].set_title("Reference")
-    #ax[1].set_title("distance {}".format(best_score))
-    #plt.show()
-
-    #Global search in vicinity of best match
-    sp = get_start_points_near(10*start_points, best_params[0][0], best_params[0][1])
-    print(("Current best score {}, refining on {} points".format(best_score, len(sp))))
-    best_score1, best_img1, best_params1 =_try_startpoints(ref_img, scale, cg, sp,
-                      [best_params[1]], [best_params[2]], local_maxiter, virtual_atoms,
-                      use_heuristic, distance, verbose)
+    if num_workers==-1:
+        num_workers=max(1, mp.cpu_count()-1)
+    pool=None
+    if num_workers!=1:
+        # The cg and the reference image are sent to every worker only once.
+        pool=mp.Pool(processes=num_workers, initializer=_init_worker, 
+                     initargs=(ref_img, scale, cg, virtual_atoms, distance))
+    try:
+        best_score, best_img, best_params =_try_startpoints(ref_img, scale, cg, sp, 
+                          starting_rotations, starting_offsets, local_maxiter, virtual_atoms, 
+                          use_heuristic, distance, verbose, pool, num_workers)
+
+        #Global search in vicinity of best match
+        sp = get_start_points_near(10*start_points, best_params[0][0], best_params[0][1])
+        print(("Current best score {}, refining on {} points".format(best_score, len(sp))))
+        best_score1, best_img1, best_params1 =_try_startpoints(ref_img, scale, cg, sp,
+                          [best_params[1]], [best_params[2]], local_maxiter, virtual_atoms,
+                          use_heuristic, distance, verbose, pool, num_workers)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
     if best_score1<best_score:
         best_score=best_score1
         best_params=best_params1
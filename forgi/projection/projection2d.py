@@ -10,7 +10,9 @@ from future.builtins.disabled import (apply, cmp, coerce, execfile,
 
 import forgi.threedee.utilities.vector as ftuv
 import forgi.threedee.utilities.graph_pdb as ftug
+import forgi.threedee.model.spatial_index as ftmsi
 import collections as col
+import heapq
 import numpy as np
 import itertools as it
 # import networkx as nx Takes to long. Import only when needed
@@ -62,19 +64,29 @@ def to_grayscale(im):
         newImg[:, :] = (im[:,:,0]/255+im[:,:,1]/255+im[:,:,2]/255)/3
         return newImg
 
+def _rotate_points(points, cosPhi, sinPhi):
+    """
+    Like rotate2D, for an array of shape (..., 2).
+    cosPhi and sinPhi have to broadcast to points.shape[:-1]
+    """
+    x=points[...,0]*cosPhi-points[...,1]*sinPhi
+    y=points[...,0]*sinPhi+points[...,1]*cosPhi
+    return np.stack([x, y], axis=-1)
+
+def _rasterize_points(points, angstrom_per_cell, origin, cosPhi, sinPhi):
+    """
+    The work of rasterized_2d_coordinates, with the rotation given as cosine and sine.
+    All arguments are broadcast against each other, so many projections can be
+    rasterized at once.
+    """
+    rotated = _rotate_points(np.asarray(points, dtype=float), cosPhi, -sinPhi)
+    return ((rotated - origin)//angstrom_per_cell).astype(int)
+
 def rasterized_2d_coordinates(points, angstrom_per_cell = 10, origin = np.array([0,0]), rotate=0):
     angle=math.radians(rotate)
     c=np.cos(angle)
     s=np.sin(angle)
-    rotMat=np.array([[c, -s],[s, c]])
-    #print("FPP: rasterization: rotationmatrix ",rotMat)
-    a = ((np.dot(points, rotMat) - origin)//angstrom_per_cell).astype(int)
-    b = np.dot(points, rotMat)
-    #print("FPP: rasterization: roatated: ", b)
-    b = b - origin
-    #print("FPP: rasterization: roatated and offset: ", b)
-    assert (a==(b//angstrom_per_cell).astype(int)).all()
-    return a
+    return _rasterize_points(points, angstrom_per_cell, origin, c, s)
 
 def crop_coordinates_to_bounds(a, num_cells):
     """
@@ -193,6 +205,205 @@ def bresenham(start,end):
       #print(start, end, points)
     return points
 
+def bresenham_lines(starts, ends):
+    """
+    Rasterize many lines at once. For every line, the pixels are the same
+    as the ones returned by `bresenham(start, end)`, in the same order.
+
+    Instead of accumulating the error step by step, the number of steps along
+    the minor axis after t steps along the major axis is calculated directly
+    (in integer arithmetic, so there are no rounding differences).
+
+    :param starts: An integer array of shape (M,2), the start points of the lines
+    :param ends: An integer array of shape (M,2), the end points of the lines
+    :returns: A tuple (line_indices, pixels). pixels is an integer array of shape (P,2),
+              line_indices an array of length P, holding the index of the line
+              each pixel belongs to.
+    """
+    starts=np.asarray(starts, dtype=int).reshape(-1,2)
+    ends=np.asarray(ends, dtype=int).reshape(-1,2)
+    delta=ends-starts
+    step=np.sign(delta)
+    delta=np.abs(delta)
+    x_major=delta[:,0]>delta[:,1]
+    major=np.where(x_major, delta[:,0], delta[:,1])
+    minor=np.where(x_major, delta[:,1], delta[:,0])
+    lengths=major+1
+    line_indices=np.repeat(np.arange(len(starts)), lengths)
+    t=np.arange(lengths.sum())-np.repeat(np.cumsum(lengths)-lengths, lengths)
+    major=major[line_indices]
+    minor=minor[line_indices]
+    # bresenham starts with err=major/2 and steps along the minor axis
+    # whenever err-t*minor drops below 0, i.e. ceil((2*t*minor-major)/(2*major)) times.
+    minor_steps=-((major-2*t*minor)//np.maximum(2*major, 1))
+    x_major=x_major[line_indices]
+    pixels=np.empty((len(t),2), dtype=int)
+    pixels[:,0]=starts[line_indices,0]+np.where(x_major, t, minor_steps)*step[line_indices,0]
+    pixels[:,1]=starts[line_indices,1]+np.where(x_major, minor_steps, t)*step[line_indices,1]
+    return line_indices, pixels
+
+def _coordinates_3d(cg, project_virtual_atoms, project_virtual_residues):
+    """
+    Collect all 3D coordinates that are projected.
+
+    :returns: A tuple (elements, coords, virtual_atoms, virtual_residues).
+              elements is a list of element names in the order of cg.sorted_element_iterator,
+              coords an array of shape (len(elements), 2, 3) with start and end points,
+              virtual_atoms and virtual_residues are arrays of shape (N,3)
+    """
+    elements=list(cg.sorted_element_iterator())
+    coords=np.array([ cg.coords[key] for key in elements ], dtype=float).reshape(-1,2,3)
+    va_coords=np.zeros((0,3))
+    if project_virtual_atoms:
+        va = ftug.all_virtual_atoms(cg)
+        if project_virtual_atoms=="selected":
+            selected = ["P", "C1'", "C1", "O3'"]
+            mask = np.isin(va.atom_names, selected)
+            rank = np.array([ selected.index(a) for a in va.atom_names[mask] ], dtype=int)
+            order = np.lexsort((rank, va.residues[mask]))
+            va_coords = va.coords[mask][order]
+        else:
+            va_coords = va.coords
+        if not len(va_coords):
+            warnings.warn("No virtual atoms present in {} of length {}!".format(cg.name, len(cg.seq)))
+    vr = [ cg.get_virtual_residue(res, True) for res in project_virtual_residues ]
+    assert len(vr)==len(project_virtual_residues)
+    vr_coords=np.array(vr, dtype=float).reshape(-1,3)
+    return elements, coords, np.asarray(va_coords, dtype=float).reshape(-1,3), vr_coords
+
+def _project_and_normalize(elements, coords, virtual_atoms, virtual_residues, proj_directions):
+    """
+    Project the 3D coordinates along K directions and move every projection
+    into the standard orientation of Projection2D: The longest axis is centered
+    at the origin and vertical, then the mean of the element coordinates is
+    moved to the origin.
+
+    Every projection is calculated on its own, with the same numpy operations
+    as in earlier versions of Projection2D. Reordering them (e.g. replacing
+    np.dot by a broadcast sum) changes the coordinates in the last bit, which
+    is enough to change which segments touch at shared endpoints and thus the
+    projection graph.
+
+    :param elements, coords, virtual_atoms, virtual_residues: As returned by _coordinates_3d
+    :param proj_directions: An array of shape (K,3)
+    :returns: A tuple (coords, virtual_atoms, virtual_residues, longest_axes) with arrays of
+              shapes (K, len(elements), 2, 2), (K, N, 2), (K, R, 2) and (K,)
+    """
+    proj_directions=np.asarray(proj_directions, dtype=float).reshape(-1,3)
+    k=len(proj_directions)
+    projected=np.empty((k, len(elements), 2, 2))
+    projected_va=np.empty((k, len(virtual_atoms), 2))
+    projected_vr=np.empty((k, len(virtual_residues), 2))
+    longest_axes=np.empty(k)
+    # Exclude m and i Elements, as they are always flanked by stems.
+    is_point=[ key[0]!="i" and key[0]!="m" for key in elements ]
+    for i in range(k):
+        # A new array, because BLAS results can depend on the memory alignment.
+        _, unit_vec1, unit_vec2=ftuv.create_orthonormal_basis(np.array(proj_directions[i]))
+        basis=np.array([unit_vec1, unit_vec2]).T
+        element_coords=[ (np.dot(start, basis), np.dot(end, basis)) for start, end in coords ]
+        va=np.dot(virtual_atoms, basis) if len(virtual_atoms) else np.zeros((0,2))
+        vr=np.array([ np.dot(res, basis) for res in virtual_residues ]).reshape(-1,2)
+        v1,v2=diameter([ p for j, edge in enumerate(element_coords) if is_point[j] for p in edge ])
+        longest_axes[i]=ftuv.vec_distance(v1,v2)
+        v1=np.array(v1)
+        v2=np.array(v2)
+        shift=(v1+v2)/2
+        element_coords=[ (edge[0]-shift, edge[1]-shift) for edge in element_coords ]
+        va=va-shift
+        vr=vr-shift
+        angle=math.radians(math.degrees(math.atan2(*(v2-v1))))
+        c=np.cos(angle)
+        s=np.sin(angle)
+        element_coords=[ (rotate2D(edge[0], c, s), rotate2D(edge[1], c, s)) for edge in element_coords ]
+        trans_rot_mat=np.array([[c, s],[-s, c]])
+        if len(va):
+            va=np.dot(va, trans_rot_mat)
+        if len(vr):
+            vr=np.dot(vr, trans_rot_mat)
+        xmean=np.mean([ x[0] for edge in element_coords for x in edge ])
+        ymean=np.mean([ x[1] for edge in element_coords for x in edge ])
+        mean=np.array([xmean, ymean])
+        for j, edge in enumerate(element_coords):
+            projected[i,j,0]=edge[0]-mean
+            projected[i,j,1]=edge[1]-mean
+        projected_va[i]=va-mean
+        projected_vr[i]=vr-mean
+    return projected, projected_va, projected_vr, longest_axes
+
+
+def _rasterize_segments(segments, virtual_atoms, resolution, steplengths, origins, 
+                        cos, sin, warn=True, supersample=1):
+    """
+    Rasterize the projected segments and virtual atoms of K projections.
+
+    Line segments are drawn with bresenham_lines, pixels outside the image are dropped.
+    Virtual atoms outside the image are moved to its border.
+
+    :param segments: An array of shape (K, M, 2, 2): start and end point of M segments
+    :param virtual_atoms: An array of shape (K, N, 2) or None
+    :param steplengths, cos, sin: Arrays of length K. The length of one pixel and the 
+                    cosine and sine of the in-plane rotation for every image
+    :param origins: An array of shape (K,2), the lower left corner of every image
+    :param supersample: An integer. If it is greater than 1, draw onto a grid that is
+                    supersample times finer in each direction and return the fraction 
+                    of set sub-pixels for every pixel. 
+    :returns: An array of shape (K, resolution, resolution)
+    """
+    k=len(steplengths)
+    size=resolution*supersample
+    if supersample!=1:
+        steplengths=steplengths/supersample
+    images=np.zeros((k, size, size), dtype=np.float32)
+    points=_rasterize_points(segments, steplengths[:,np.newaxis,np.newaxis,np.newaxis],
+                             origins[:,np.newaxis,np.newaxis], cos[:,np.newaxis,np.newaxis],
+                             sin[:,np.newaxis,np.newaxis])
+    line_indices, pixels=bresenham_lines(points[:,:,0].reshape(-1,2), points[:,:,1].reshape(-1,2))
+    image_indices=line_indices//max(segments.shape[1], 1)
+    inside=np.all((pixels>=0) & (pixels<size), axis=1)
+    if warn and not np.all(inside):
+        warnings.warn("WARNING during rasterization of the 2D Projection: "
+                      "Parts of the projection are cropped off.")
+    images[image_indices[inside], pixels[inside,0], pixels[inside,1]]=1
+    if virtual_atoms is not None and virtual_atoms.shape[1]:
+        atoms=_rasterize_points(virtual_atoms, steplengths[:,np.newaxis,np.newaxis],
+                                origins[:,np.newaxis], cos[:,np.newaxis], sin[:,np.newaxis])
+        atoms_clip=crop_coordinates_to_bounds(atoms, size)
+        if warn and (atoms_clip!=atoms).any():
+            warnings.warn("WARNING during rasterization of virtual atoms: "
+                          "Parts of the projection are cropped off.")
+        image_indices=np.repeat(np.arange(k), atoms.shape[1])
+        images[image_indices, atoms_clip[:,:,0].ravel(), atoms_clip[:,:,1].ravel()]=1
+    if supersample!=1:
+        images=images.reshape(k, resolution, supersample, resolution, supersample).mean(axis=(2,4))
+    return images
+
+
+def _overlapping_box_pairs(segments, margin=1e-9):
+    """
+    All pairs of 2D line segments whose axis-aligned bounding boxes overlap.
+
+    Sort and sweep: The segments are sorted by the left side of their bounding box,
+    so only segments starting before the right side of a box have to be compared to it.
+
+    :param segments: An array of shape (M,2,2), start and end of every segment
+    :param margin: Enlarge the bounding boxes by this value, to be robust against 
+                   rounding errors.
+    :returns: A sorted list of index pairs (i,j) with i<j
+    """
+    segments=np.asarray(segments, dtype=float).reshape(-1,2,2)
+    lower=np.min(segments, axis=1)-margin
+    upper=np.max(segments, axis=1)+margin
+    order=np.argsort(lower[:,0], kind="mergesort")
+    sweep_end=np.searchsorted(lower[order,0], upper[order,0], side="right")
+    pairs=[]
+    for a, i in enumerate(order):
+        others=order[a+1:sweep_end[a]]
+        others=others[(lower[others,1]<=upper[i,1]) & (upper[others,1]>=lower[i,1])]
+        pairs.extend( (min(i,j), max(i,j)) for j in others )
+    pairs.sort()
+    return pairs
+
 
 class Projection2D(object):
     """
@@ -239,36 +450,6 @@ class Projection2D(object):
         self.virtual_residue_numbers = project_virtual_residues
         self._project(cg, project_virtual_atoms, project_virtual_residues)
 
-
-        #Rotate and translate projection into a standard orientation
-        points=list(self.points)
-        v1,v2=diameter(points)
-        #: The longest distance between any two points of the projection.
-        self.longest_axis=ftuv.vec_distance(v1,v2)
-
-        v1=np.array(v1)
-        v2=np.array(v2)
-        shift=(v1+v2)/2
-        for key,edge in list(self._coords.items()):
-            self._coords[key]=(edge[0]-shift, edge[1]-shift)
-        
-        if project_virtual_atoms:
-            self._virtual_atoms = self._virtual_atoms-shift
-        if project_virtual_residues:
-            self._virtual_residues = self._virtual_residues-shift
-        rot=math.atan2(*(v2-v1))
-        rot=math.degrees(rot)
-        self.rotate(rot)
-        xmean=np.mean([ x[0] for p in list(self._coords.values()) for x in p])
-        ymean=np.mean([ x[1] for p in list(self._coords.values()) for x in p])
-        mean=np.array([xmean,ymean])
-        for key,edge in list(self._coords.items()):
-            self._coords[key]=(edge[0]-mean, edge[1]-mean)
-        #Thanks to numpy broadcasting, this works without a loop.
-        if project_virtual_atoms:
-            self._virtual_atoms=self._virtual_atoms-mean
-        if project_virtual_residues:
-            self._virtual_residues = self._virtual_residues-mean
         #From this, further rotate if requested by the user.
         if rotation!=0:
             self.rotate(rotation)
@@ -307,8 +488,7 @@ class Projection2D(object):
                        A value below 20 is reasonable.
         """
         if cutoff<=0: return
-        while self._condense_one(cutoff):
-            pass
+        self._condense_close_points(cutoff)
         self.proj_graph.remove_edges_from(self.proj_graph.selfloop_edges())
 
     def condense(self, cutoff):
@@ -364,7 +544,11 @@ class Projection2D(object):
         """
         if self._cross_points is None:
             self._cross_points=col.defaultdict(list)
-            for key1, key2 in it.combinations(self._coords, 2):
+            keys=list(self._coords)
+            segments=np.array([ self._coords[key] for key in keys ], dtype=float)
+            # Only segments with overlapping bounding boxes can intersect.
+            for i, j in _overlapping_box_pairs(segments):
+                key1, key2 = keys[i], keys[j]
                 for cr in ftuv.seg_intersect(self._coords[key1], self._coords[key2]):
                     self._cross_points[key1].append((cr, key2))
                     self._cross_points[key2].append((cr, key1))
@@ -583,10 +767,11 @@ class Projection2D(object):
     ### Functions for graphical representations of the projection ###
     @profile
     def rasterize(self, resolution=50, bounding_square=None, warn=True, 
-                  virtual_atoms=True, rotate=0, virtual_residues = True):
+                  virtual_atoms=True, rotate=0, virtual_residues = True, supersample=1):
         """
         Rasterize the projection to a square image of the given resolution.
-        Uses the Bresenham algorithm for line rasterization.
+        Uses the Bresenham algorithm for line rasterization (for all lines at once,
+        see `bresenham_lines`).
 
         :param resolution: 
                         The number of pixels in each direction.
@@ -604,6 +789,12 @@ class Projection2D(object):
   
         :param rot:     The in-plane rotation in degrees, applied before rotation.
 
+        :param supersample: 
+                        An integer. For values greater than 1, the projection is rasterized 
+                        onto a grid that is `supersample` times finer and every pixel 
+                        gets the fraction of set sub-pixels as value (anti-aliasing).
+                        Virtual residues are always drawn at the final resolution.
+
         :returns:       A tuple `(np.array, float)`. The first value is a resolution x resolution
                         numpy 2D array. 
                         The values are floats from 0.0 (black) to 1.0 (white).
@@ -615,47 +806,31 @@ class Projection2D(object):
             bounding_square=self.get_bounding_square()
         box=bounding_square
         steplength=(box[1]-box[0])/resolution
-        image=np.zeros([resolution,resolution], dtype=np.float32)
-        img_length=len(image)
+        img_length=resolution
         angle=math.radians(rotate)
         c=np.cos(angle)
         s=np.sin(angle)
-        starts=[]
-        ends=[]
-        for label in self._coords:
-            if virtual_atoms and len(self._virtual_atoms): 
-                if label[0]=="s": continue
-            starts.append(self._coords[label][0])
-            ends.append(self._coords[label][1])
-        starts=np.array(starts)
-        ends=np.array(ends)
-        starts = rasterized_2d_coordinates(starts, steplength, np.array([box[0],box[2]]), rotate)
-        ends = rasterized_2d_coordinates(ends, steplength, np.array([box[0],box[2]]), rotate)
-        for i in range(len(starts)):
-            points=bresenham(tuple(starts[i]), tuple(ends[i]))
-            for p in points:
-                if 0<=p[0]<img_length and 0<=p[1]<img_length:
-                    image[p[0],p[1]]=1
-                else:
-                    if warn: warnings.warn("WARNING during rasterization of the 2D Projection: "
-                                           "Parts of the projection are cropped off.")
+        atoms=None
         if virtual_atoms and len(self._virtual_atoms):
-            rot_virtual_atoms = rasterized_2d_coordinates(self._virtual_atoms, steplength, np.array([box[0],box[2]]), rotate)
-            rot_virtual_atoms_clip = crop_coordinates_to_bounds(rot_virtual_atoms, img_length )
-            if warn and (rot_virtual_atoms_clip!=rot_virtual_atoms).any():
-                warnings.warn("WARNING during rasterization of virtual atoms: "
-                              "Parts of the projection are cropped off.")
-            image[rot_virtual_atoms_clip[:,0],rot_virtual_atoms_clip[:,1]]=1
+            atoms=self._virtual_atoms[np.newaxis]
+        segments=[ self._coords[label] for label in self._coords 
+                   if atoms is None or label[0]!="s" ]
+        segments=np.array(segments, dtype=float).reshape(1,-1,2,2)
+        image=_rasterize_segments(segments, atoms, resolution, np.array([steplength]),
+                                  np.array([[box[0],box[2]]]), np.array([c]), np.array([s]),
+                                  warn, supersample)[0]
         if virtual_residues and self.virtual_residue_numbers:            
             image = to_rgb(image)
             rot_virtual_res = rasterized_2d_coordinates(self._virtual_residues, steplength, np.array([box[0],box[2]]), rotate)
-            for i, point in enumerate(rot_virtual_res):
-                color = (0,150,255*self.virtual_residue_numbers[i]//max(self.virtual_residue_numbers))
-                if 0<=point[0]<img_length and 0<=point[1]<img_length:
-                    image[point[0],point[1]]=color
-                else:                    
-                    if warn: warnings.warn("WARNING during rasterization of virtual residues: "
-                                           "Parts of the projection are cropped off.")
+            numbers = np.array(self.virtual_residue_numbers)
+            colors = np.zeros((len(numbers), 3), dtype=int)
+            colors[:,1] = 150
+            colors[:,2] = 255*numbers//max(numbers)
+            inside = np.all((rot_virtual_res>=0) & (rot_virtual_res<img_length), axis=1)
+            if warn and not np.all(inside):
+                warnings.warn("WARNING during rasterization of virtual residues: "
+                              "Parts of the projection are cropped off.")
+            image[rot_virtual_res[inside,0],rot_virtual_res[inside,1]]=colors[inside]
         return image, steplength
 
     def plot(self, ax=None, show=False, margin=5, 
@@ -963,101 +1138,146 @@ class Projection2D(object):
     @profile
     def _project(self, cg, project_virtual_atoms, project_virtual_residues):
         """
-        Calculates the 2D coordinates of all coarse grained elements by vector rejection.
+        Calculates the 2D coordinates of all coarse grained elements by vector rejection
+        and moves them into the standard orientation.
         Stores them inside self._coords
         """
+        elements, coords, va, vr = _coordinates_3d(cg, project_virtual_atoms, project_virtual_residues)
+        coords, va, vr, longest_axes = _project_and_normalize(elements, coords, va, vr, 
+                                                              [self._proj_direction])
         self._coords=dict()
+        for i, key in enumerate(elements):
+            self._coords[key]=(coords[0,i,0], coords[0,i,1])
         self._virtual_atoms=[]
-        basis=np.array([self._unit_vec1,self._unit_vec2]).T
-        #Project all coordinates to this plane
-        for key in cg.sorted_element_iterator():
-            val=cg.coords[key]
-            start=np.dot(val[0], basis)
-            end=np.dot(val[1], basis)
-            self._coords[key]=(start, end)
-        va=[]
-        if project_virtual_atoms:        
-            for residuePos in range(1,cg.seq_length+1):
-                residue=cg.virtual_atoms(residuePos)
-                if project_virtual_atoms=="selected":
-                    try:             va.append(residue['P'])
-                    except KeyError: pass
-                    try:             va.append(residue["C1'"])
-                    except KeyError: assert False #Should never happen
-                    try:             va.append(residue['C1'])
-                    except KeyError: pass
-                    try:             va.append(residue["O3'"])
-                    except KeyError: pass
-                else:
-                    for pos in list(residue.values()):
-                        va.append(pos)
-            if va:
-                self._virtual_atoms=np.dot(np.array(va), basis)
-            else:
-                warnings.warn("No virtual atoms present in {} of length {}!".format(cg.name, len(cg.seq)))
-        vr = []
-        for res in project_virtual_residues:
-            vr.append(np.dot(cg.get_virtual_residue(res, True), basis))
-        assert len(vr)==len(project_virtual_residues)
-        if vr:
-            self._virtual_residues = np.array(vr)
+        if len(va[0]):
+            self._virtual_atoms=va[0]
+        if len(vr[0]):
+            self._virtual_residues=vr[0]
+        #: The longest distance between any two points of the projection.
+        self.longest_axis=longest_axes[0]
   
-    def _condense_one(self, cutoff):
+    def _node_grid(self, cutoff):
         """
-        Condenses two adjacent projection points into one.
+        A spatial index of all nodes of the projection graph, used to find nodes
+        that are closer than cutoff to a point or line segment.
 
-        :returns: True if a condensation was done, False if no condenstaion is possible.
-        """        
-        for i,node1 in enumerate(self.proj_graph.nodes_iter()):
-            for j, node2 in enumerate(self.proj_graph.nodes_iter()):
-                if j<=i: continue                
-                if ftuv.vec_distance(node1, node2)<cutoff:
-                    newnode=ftuv.middlepoint(node1, node2)
-                    #self.proj_graph.add_node(newnode)
-                    for neighbor in list(self.proj_graph.edge[node1].keys()):
-                        self.proj_graph.add_edge(newnode, neighbor, 
-                                                attr_dict=self.proj_graph.edge[node1][neighbor])
-                    for neighbor in list(self.proj_graph.edge[node2].keys()):
-                        self.proj_graph.add_edge(newnode, neighbor, 
-                                                 attr_dict=self.proj_graph.edge[node2][neighbor])
-                    if newnode!=node1: #Equality can happen because of floating point inaccuracy
-                        self.proj_graph.remove_node(node1)
-                    if newnode!=node2:
-                        self.proj_graph.remove_node(node2)
-                    return True
-        return False
+        The cells are at least as large as cutoff and large enough to hold about
+        one node each, if the nodes were evenly spread over their bounding box.
+        """
+        nodes=list(self.proj_graph.nodes_iter())
+        cell_size=cutoff
+        if len(nodes)>1:
+            extent=np.max(np.ptp(np.array(nodes, dtype=float), axis=0))
+            cell_size=max(cell_size, extent/math.sqrt(len(nodes)))
+        if not cell_size>0:
+            cell_size=1.
+        grid=ftmsi.SegmentGrid(cell_size=cell_size)
+        for node in nodes:
+            grid.update(node, (node, node))
+        return grid
+
+    def _merge_points(self, node1, node2):
+        """
+        Replace the nodes node1 and node2 by a new node in the middle between them.
+
+        :returns: The new node
+        """
+        newnode=ftuv.middlepoint(node1, node2)
+        for neighbor in list(self.proj_graph.edge[node1].keys()):
+            self.proj_graph.add_edge(newnode, neighbor, 
+                                    attr_dict=self.proj_graph.edge[node1][neighbor])
+        for neighbor in list(self.proj_graph.edge[node2].keys()):
+            self.proj_graph.add_edge(newnode, neighbor, 
+                                     attr_dict=self.proj_graph.edge[node2][neighbor])
+        if newnode!=node1: #Equality can happen because of floating point inaccuracy
+            self.proj_graph.remove_node(node1)
+        if newnode!=node2:
+            self.proj_graph.remove_node(node2)
+        return newnode
+
+    def _condense_close_points(self, cutoff):
+        """
+        Used by `self.condense_points(cutoff)`. 
+
+        Repeatedly merges the first pair of nodes (in the order of `proj_graph.nodes_iter()`)
+        that are closer than cutoff, until no such pair is left. Close pairs are found 
+        with a spatial index and kept in a heap ordered like the nodes, so only the pairs 
+        involving a newly created node have to be searched after every merge.
+        """
+        graph=self.proj_graph
+        grid=self._node_grid(cutoff)
+        order={}
+        heap=[]
+        def push_close_pairs(node):
+            for other in grid.elements_near(node, cutoff+10**-9):
+                if other!=node and ftuv.vec_distance(node, other)<cutoff:
+                    pair=sorted([(order[node], node), (order[other], other)])
+                    heapq.heappush(heap, (pair[0][0], pair[1][0], pair[0][1], pair[1][1]))
+        for node in graph.nodes_iter():
+            order[node]=len(order)
+        for node in graph.nodes_iter():
+            push_close_pairs(node)
+        next_index=len(order)
+        while heap:
+            i, j, node1, node2 = heapq.heappop(heap)
+            if order.get(node1)!=i or order.get(node2)!=j:
+                continue # At least one of the nodes was merged already
+            newnode=self._merge_points(node1, node2)
+            for node in (node1, node2):
+                if node not in graph:
+                    del order[node]
+                    grid.remove(node)
+            if newnode in graph and newnode not in order:
+                order[newnode]=next_index
+                next_index+=1
+                grid.update(newnode, (newnode, newnode))
+                push_close_pairs(newnode)
 
     def _condense_pointWithLine_step(self, cutoff):
         """
         Used by `self.condense(cutoff)` as a single condensation step of a point 
         with a line segment.
+
+        Condenses the first edge (source, target) and node (in the order of 
+        `proj_graph.nodes_iter()`), where the node is closer than cutoff to the edge.
+        Only nodes close to the bounding box of the edge are tested.
+
+        :returns: True if a condensation was done, False if no condenstaion is possible.
         """
-        for i,source in enumerate(self.proj_graph.nodes_iter()):
-            for j,target in enumerate(self.proj_graph.nodes_iter()):
-                if j>i and self.proj_graph.has_edge(source,target):
-                    for k, node in enumerate(self.proj_graph.nodes_iter()):
-                        if k==i or k==j:
-                            continue
-                        nearest=ftuv.closest_point_on_seg( source, target, node)
-                        nearest=tuple(nearest)
-                        if nearest==source or nearest==target: 
-                            continue   
-                        if (ftuv.vec_distance(nearest, node)<cutoff):
-                            newnode=ftuv.middlepoint(node, tuple(nearest))
-                            attr_dict=self.proj_graph.edge[source][target]
-                            self.proj_graph.remove_edge(source, target)
-                            if source!=newnode:
-                                self.proj_graph.add_edge(source, newnode, attr_dict=attr_dict)
-                            if target!=newnode:
-                                self.proj_graph.add_edge(target, newnode,
-                                                         attr_dict=attr_dict)             
-                            if newnode!=node: #Equality possible bcse of floating point inaccuracy
-                                for neighbor in list(self.proj_graph.edge[node].keys()):
-                                    attr_dict=self.proj_graph.edge[node][neighbor]
-                                    self.proj_graph.add_edge(newnode, neighbor, 
-                                                             attr_dict=attr_dict)
-                                self.proj_graph.remove_node(node)
-                            return True
+        nodes=list(self.proj_graph.nodes_iter())
+        index={ node: i for i, node in enumerate(nodes) }
+        grid=self._node_grid(cutoff)
+        edges=sorted( (min(index[u], index[v]), max(index[u], index[v])) 
+                      for u, v in self.proj_graph.edges_iter() if u!=v )
+        for i, j in edges:
+            source=nodes[i]
+            target=nodes[j]
+            lower=np.minimum(source, target)-cutoff-10**-9
+            upper=np.maximum(source, target)+cutoff+10**-9
+            for k in sorted(index[node] for node in grid.candidates(lower, upper)):
+                if k==i or k==j:
+                    continue
+                node=nodes[k]
+                nearest=ftuv.closest_point_on_seg( source, target, node)
+                nearest=tuple(nearest)
+                if nearest==source or nearest==target: 
+                    continue   
+                if (ftuv.vec_distance(nearest, node)<cutoff):
+                    newnode=ftuv.middlepoint(node, tuple(nearest))
+                    attr_dict=self.proj_graph.edge[source][target]
+                    self.proj_graph.remove_edge(source, target)
+                    if source!=newnode:
+                        self.proj_graph.add_edge(source, newnode, attr_dict=attr_dict)
+                    if target!=newnode:
+                        self.proj_graph.add_edge(target, newnode,
+                                                 attr_dict=attr_dict)             
+                    if newnode!=node: #Equality possible bcse of floating point inaccuracy
+                        for neighbor in list(self.proj_graph.edge[node].keys()):
+                            attr_dict=self.proj_graph.edge[node][neighbor]
+                            self.proj_graph.add_edge(newnode, neighbor, 
+                                                     attr_dict=attr_dict)
+                        self.proj_graph.remove_node(node)
+                    return True
         return False
 
     def _get_path_length(self, path):
@@ -1068,3 +1288,100 @@ class Projection2D(object):
         for i in range(len(path)-1):
             l+=ftuv.vec_distance(path[i], path[i+1])
         return l
+
+
+class ProjectionBatch(object):
+    """
+    The 2D projections of one CoarseGrainRNA along many directions.
+
+    Every projection is the same as the corresponding Projection2D, but all 
+    directions are projected at once and `rasterize` draws all images at once
+    with vectorized line rasterization. Use this instead of a list of 
+    Projection2D objects, if only rasterized images are needed.
+    """
+    @profile
+    def __init__(self, cg, proj_directions, project_virtual_atoms=False):
+        """
+        :param cg: a CoarseGrainRNA object with 3D coordinates for every element
+        :param proj_directions: An array of shape (K,3) with carthesian vectors 
+                                in the direction of projection.
+        :param project_virtual_atoms: See Projection2D
+        """
+        self.proj_directions=np.array(proj_directions, dtype=float).reshape(-1,3)
+        elements, coords, va, vr = _coordinates_3d(cg, project_virtual_atoms, [])
+        #: The element names, in the order of the second axis of self.coords
+        self.elements=elements
+        #: An array of shape (K, len(elements), 2, 2): The projected start and end points
+        self.coords=None
+        #: An array of shape (K, N, 2): The projected virtual atoms
+        self.virtual_atoms=None
+        #: The longest distance between any two points for every projection.
+        self.longest_axes=None
+        (self.coords, self.virtual_atoms, 
+         _, self.longest_axes) = _project_and_normalize(elements, coords, va, vr, 
+                                                        self.proj_directions)
+
+    def __len__(self):
+        return len(self.proj_directions)
+
+    def get_bounding_squares(self, margin=0.):
+        """
+        Like Projection2D.get_bounding_square, for all projections.
+
+        :returns: An array of shape (K,4). Every row is left, right, bottom, top
+        """
+        points=self.coords.reshape(len(self), -1, 2)
+        left=np.min(points[:,:,0], axis=1)
+        right=np.max(points[:,:,0], axis=1)
+        bottom=np.min(points[:,:,1], axis=1)
+        top=np.max(points[:,:,1], axis=1)
+        length=np.maximum(right-left, top-bottom)/2+margin
+        x=(left+right)/2
+        y=(bottom+top)/2
+        return np.stack([x-length, x+length, y-length, y+length], axis=1)
+
+    @profile
+    def rasterize(self, resolution=50, bounding_squares=None, rotations=0, warn=True,
+                  virtual_atoms=True, supersample=1):
+        """
+        Rasterize all projections. 
+        The k-th image is the same as `Projection2D.rasterize` of the k-th projection 
+        direction with `bounding_square=bounding_squares[k]` and `rotate=rotations[k]`.
+        Virtual residues are not supported.
+
+        :param resolution: The number of pixels in each direction.
+        :param bounding_squares: An array of shape (K,4) or a single bounding square 
+                        used for all projections. If `None`, use get_bounding_squares()
+        :param rotations: The in-plane rotation in degrees. 
+                        A single number or one rotation per projection.
+        :param warn:    If True, raise a warning if parts of a projection are not inside 
+                        its bounding square.
+        :param virtual_atoms: If True, virtual atoms are also rasterized.
+        :param supersample: See Projection2D.rasterize
+        :returns:       A tuple `(np.array, np.array)`. The first array has the shape
+                        (K, resolution, resolution) and contains the images,
+                        the second array holds the length of one pixel in angstrom
+                        for every image.
+        """
+        k=len(self)
+        if bounding_squares is None:
+            bounding_squares=self.get_bounding_squares()
+        boxes=np.broadcast_to(np.asarray(bounding_squares, dtype=float), (k,4))
+        rotations=np.broadcast_to(np.asarray(rotations, dtype=float), (k,))
+        steplengths=(boxes[:,1]-boxes[:,0])/resolution
+        origins=boxes[:,[0,2]]
+        cos=np.empty(k)
+        sin=np.empty(k)
+        for i, rot in enumerate(rotations):
+            angle=math.radians(rot)
+            cos[i]=np.cos(angle)
+            sin[i]=np.sin(angle)
+        if virtual_atoms and self.virtual_atoms.shape[1]>0:
+            selected=[ i for i, label in enumerate(self.elements) if label[0]!="s" ]
+            atoms=self.virtual_atoms
+        else:
+            selected=list(range(len(self.elements)))
+            atoms=None
+        images=_rasterize_segments(self.coords[:,selected], atoms, resolution, steplengths,
+                                   origins, cos, sin, warn, supersample)
+        return images, steplengths
@@ -23,12 +23,15 @@ class CoordinateStorage(Mapping):
         self._coords_per_key = 2 
         self._coordinates = np.ones((self._coords_per_key*len(element_names),self._dimensions))*np.nan
         self._elem_names = list(element_names)
+        self._elem_index = { elem: i for i, elem in enumerate(self._elem_names) }
+        #: One counter per element, increased whenever the element's coordinates change.
+        self._versions = [0]*len(self._elem_names)
         #: on-change function is called whenever coordinates are modified.
         self.on_change = on_change
     def _indices_for(self, elem_name):
         try:
-            i = self._elem_names.index(elem_name)
-        except ValueError:
+            i = self._elem_index[elem_name]
+        except (KeyError, TypeError):
             raise KeyError("Invalid index {}".format(elem_name))
         ret = []
         for j in range(self._coords_per_key):
@@ -44,7 +47,11 @@ class CoordinateStorage(Mapping):
                   If elem_name is a single string, return a tuple of coordinates.
                   If elem_name is a sequence of strings, return a 2*len(elem_name)x3 numpy array.
         """
-        if elem_name in self._elem_names: #Single element name
+        try:
+            single = elem_name in self._elem_index
+        except TypeError: #Unhashable, e.g. a list of element names
+            single = False
+        if single: #Single element name
             indices = self._indices_for(elem_name)
             return tuple(self._coordinates[i] for i in indices)
         else: # Sequence of element names or invalid
@@ -75,9 +82,25 @@ class CoordinateStorage(Mapping):
         indices = self._indices_for(key)
         for i, index in enumerate(indices):
             self._coordinates[index] = value[i]
+        self._versions[self._elem_index[key]] += 1
         self.on_change(key)
+    def version(self, elem_name):
+        """
+        A counter that is increased whenever the coordinates of the element change.
+
+        :param elem_name: The element name, e.g. "s1"
+        :returns: An integer. Compare it to a previously retrieved version to
+                  find out, whether the element has moved in the meantime.
+        """
+        try:
+            return self._versions[self._elem_index[elem_name]]
+        except (KeyError, TypeError):
+            raise KeyError("Invalid index {}".format(elem_name))
     def __contains__(self, key):
-        return key in self._elem_names
+        try:
+            return key in self._elem_index
+        except TypeError:
+            return False
     def __iter__(self):
         return iter(self._elem_names)
     def __len__(self):
@@ -90,10 +113,26 @@ class CoordinateStorage(Mapping):
         if rotation_matrix.shape != (3,3):            
             raise ValueError("Rotation matrix does not have the correct shape!")
         self._coordinates = np.dot(self._coordinates, rotation_matrix.T)
-        for key in self._elem_names:
+        for i, key in enumerate(self._elem_names):
+            self._versions[i] += 1
             self.on_change(key)
     def get_array(self):
         return np.copy(self._coordinates)
+    def load_array(self, coordinates):
+        """
+        Replace all coordinates at once.
+
+        :param coordinates: An array with the same shape and order as the one
+                            returned by self.get_array()
+        """
+        coordinates = np.asarray(coordinates, dtype=float)
+        if coordinates.shape != self._coordinates.shape:
+            raise ValueError("Expected coordinates of shape {}, "
+                             "found {}".format(self._coordinates.shape, coordinates.shape))
+        self._coordinates = np.array(coordinates)
+        for i, key in enumerate(self._elem_names):
+            self._versions[i] += 1
+            self.on_change(key)
 
     def __str__(self):
         lines=[]
@@ -35,6 +35,8 @@ import math
 import warnings
 import itertools as it
 import io
+import json
+import struct
 import logging
 from pprint import pprint
 log = logging.getLogger(__name__)
@@ -45,6 +47,16 @@ except:
   def profile(x):
     return x
 
+#: The version of the file format written by CoarseGrainRNA.to_binary_file
+BINARY_FORMAT_VERSION = 1
+_BINARY_MAGIC = b"\x89FORGICG"
+#: magic bytes, format version, length of the topology in bytes
+_BINARY_HEADER = struct.Struct("<8sII")
+
+def _is_binary_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(_BINARY_MAGIC)) == _BINARY_MAGIC
+
 def remove_hetatm(lines):
     '''
     Go through the lines of a pdb file and remove any which refer to a
@@ -86,8 +98,8 @@ def add_longrange_interactions(cg, lines):
     for line in ftum.iterate_over_interactions(lines):
         (from_chain, from_base, to_chain, to_base) =  ftum.get_interacting_base_pairs(line)
 
-        seq_id1 = cg.seq_ids.index(ftum.parse_resid(from_base)) + 1
-        seq_id2 = cg.seq_ids.index(ftum.parse_resid(to_base)) + 1
+        seq_id1 = cg.seq_id_to_pos(ftum.parse_resid(from_base))
+        seq_id2 = cg.seq_id_to_pos(ftum.parse_resid(to_base))
 
         node1 = cg.get_node_from_residue_num(seq_id1)
         node2 = cg.get_node_from_residue_num(seq_id2)
@@ -295,9 +307,16 @@ class CoarseGrainRNA(fgb.BulgeGraph):
         '''
         Initialize the new structure.
         '''
-        super(CoarseGrainRNA, self).__init__(cg_file, dotbracket_str, seq)
+        if cg_file is not None and _is_binary_file(cg_file):
+            # The BulgeGraph cannot parse the binary format.
+            super(CoarseGrainRNA, self).__init__(None, dotbracket_str, seq)
+        else:
+            super(CoarseGrainRNA, self).__init__(cg_file, dotbracket_str, seq)
 
-        self._virtual_atom_cache={}
+        #: Values derived from the coordinates. See self.get_cached()
+        self._derived_cache = {}
+        #: Element name -> set of keys in self._derived_cache that depend on this element.
+        self._cache_dependencies = c.defaultdict(set)
         #: Keys are element identifiers (e.g.: "s1" or "i3"), values are 2-tuples of vectors
         #: The first value of stem coordinates corresponds to the start of the stem
         #: (the one with the lowest nucleotide number),
@@ -326,6 +345,10 @@ class CoarseGrainRNA(fgb.BulgeGraph):
         self.v3dposs = c.defaultdict( dict )
         #: generated by self.add_all_virtual_residues()
         self.vinvs = c.defaultdict( dict )
+        #: The virtual residues of all stems in contiguous arrays (a
+        #: ftug.VirtualResidueArrays instance). The dictionaries above are views into it.
+        #: generated by self.add_all_virtual_residues()
+        self.vres_arrays = None
 
         #: A 3D vector. Used as hint, from what direction the Projection2D object
         #: should be generated in the default case.
@@ -396,16 +419,16 @@ class CoarseGrainRNA(fgb.BulgeGraph):
            The position of residues in loops is much more flexible, which is why virtual
            residue positions for loops usually do not make sense.
         """
-        for stem in self.stem_iterator():
-            try:
-                ftug.add_virtual_residues(self, stem)
-            except KeyError:
+        stems = list(self.sorted_stem_iterator())
+        try:
+            ftug.add_virtual_residues_batch(self, stems)
+        except KeyError:
+            for stem in stems:
                 if stem not in self.coords:
                     raise RnaMissing3dError("No 3D coordinates available for stem {}".format(stem))
                 elif stem not in self.twists:
                     raise RnaMissing3dError("No twists available for stem {}".format(stem))
-                else:
-                    raise
+            raise
     def get_virtual_residue(self, pos, allow_single_stranded = False):
         """
         Get the virtual residue for the nmucleotide at position pos (1-based)
@@ -467,14 +490,22 @@ class CoarseGrainRNA(fgb.BulgeGraph):
 
         :returns: A numpy array.
         """
-        if not self.v3dposs:
+        stems = list(self.sorted_stem_iterator())
+        missing = [s for s in stems if not self.v3dposs.get(s)]
+        if len(missing) == len(stems):
             self.add_all_virtual_residues()
-        vress = []
-        for s in self.sorted_stem_iterator():
-            for i in range(self.stem_length(s)):
-                vres=self.v3dposs[s][i]
-                vress += [vres[0] + vres[2], vres[0] + vres[3]]
-        return np.array(vress)
+        elif missing:
+            ftug.add_virtual_residues_batch(self, missing)
+        if self.vres_arrays is not None and all(s in self.vres_arrays.offsets for s in stems):
+            rows = [ self.vres_arrays.offsets[s] + np.arange(self.stem_length(s)) for s in stems ]
+            v3dposs = self.vres_arrays.v3dposs[np.concatenate(rows + [np.zeros(0, dtype=int)])]
+        else:
+            v3dposs = np.array([ self.v3dposs[s][i] for s in stems
+                                 for i in range(self.stem_length(s)) ]).reshape(-1, 4, 3)
+        vress = np.empty((2 * len(v3dposs), 3))
+        vress[0::2] = v3dposs[:, 0] + v3dposs[:, 2]
+        vress[1::2] = v3dposs[:, 0] + v3dposs[:, 3]
+        return vress
 
     def get_poss_for_domain(self, elements, mode="fast"):
         """
@@ -492,8 +523,9 @@ class CoarseGrainRNA(fgb.BulgeGraph):
                 points += list(self.coords[e])
                 return np.array(points)
         elif mode=="vres":
-            if not self.v3dposs:
-                self.add_all_virtual_residues()
+            missing = [ s for s in elements if s[0]=="s" and not self.v3dposs.get(s) ]
+            if missing:
+                ftug.add_virtual_residues_batch(self, missing)
             vress = []
             for s in sorted(elements):
                 if s[0]!="s": continue
@@ -515,43 +547,23 @@ class CoarseGrainRNA(fgb.BulgeGraph):
             center = elements
         else: assert False, repr(elements)
 
+        all_vas = ftug.all_virtual_atoms(self).coords
         if method == "kde":
         #print(center)
-            all_vas = []
-            for pos in range(1,self.seq_length+1):
-                for va in list(self.virtual_atoms(pos).values()):
-                    all_vas.append(va)
-
-            all_vas = np.array(all_vas).T
+            all_vas = all_vas.T
             log.debug("Shape of all atoms {}".format(all_vas.shape))
             kde = scipy.stats.gaussian_kde(all_vas, 50) #randomly take 50 Angstrom bandwidth
             return kde(center)
-        elif method == "r**-3":
-            value = 0
-            for pos in range(1,self.seq_length+1):
-                for va in list(self.virtual_atoms(pos).values()):
-                    value+=1/(1+ftuv.vec_distance(va, center))**3
-            return value
+        distances = np.sqrt(np.sum((all_vas - center)**2, axis=1))
+        if method == "r**-3":
+            return np.sum(1/(1+distances)**3)
         elif method == "r**-2":
-            value = 0
-            for pos in range(1,self.seq_length+1):
-                for va in list(self.virtual_atoms(pos).values()):
-                    value+=1/(1+ftuv.vec_distance(va, center))**2
-            return value
+            return np.sum(1/(1+distances)**2)
         elif method == "r**-1":
-            value = 0
-            for pos in range(1,self.seq_length+1):
-                for va in list(self.virtual_atoms(pos).values()):
-                    value+=1/(1+ftuv.vec_distance(va, center))
-            return value
+            return np.sum(1/(1+distances))
         elif method.startswith("cutoff"):
             cutoff = float(method.split()[1])
-            value = 0
-            for pos in range(1,self.seq_length+1):
-                for va in list(self.virtual_atoms(pos).values()):
-                    if ftuv.vec_distance(va, center)< cutoff:
-                        value+=1
-            return value
+            return np.sum(distances < cutoff)
     def get_twist_str(self):
         '''
         Place the twist vectors into a string.
@@ -614,6 +626,40 @@ class CoarseGrainRNA(fgb.BulgeGraph):
             cg_str = self.to_cg_string()
             f.write(cg_str)
 
+    def to_binary_file(self, filename):
+        """
+        Save this structure in a compact binary format.
+
+        The file holds the same information as the .cg format. After a short header
+        (magic bytes and the format version, the length of the topology part),
+        the topology (defines, edges, sequence, seq_ids,...) is stored as utf-8
+        encoded JSON, followed by the raw float64 arrays of coordinates and twists.
+        This allows for loading without per-token parsing and coordinates
+        round-trip exactly. Use `from_binary_file` (or `from_file`) to load it.
+
+        :param filename: The filename to save it to.
+        """
+        topology = {
+            "name": self.name,
+            "seq": self.seq,
+            "seq_length": self.seq_length,
+            "seq_ids": [ [resid[1], resid[2]] for resid in self.seq_ids ],
+            "defines": [ [d, list(map(int, self.defines[d]))] for d in self.defines ],
+            "edges": sorted(set( tuple(sorted((e1, e2))) for e1 in self.edges for e2 in self.edges[e1] )),
+            "longrange": sorted(set( tuple(sorted((e1, e2))) for e1 in self.longrange for e2 in self.longrange[e1] )),
+            "sampled": [ [key, self.sampled[key][0], list(map(int, self.sampled[key][1:]))] for key in self.sampled ],
+            "infos": [ [key, value] for key in self.infos for value in self.infos[key] ],
+            "project_from": None if self.project_from is None else list(map(float, self.project_from)),
+            "coord_names": list(self.coords.keys()),
+            "twist_names": list(self.twists.keys()),
+        }
+        topology = json.dumps(topology).encode("utf-8")
+        with open(filename, 'wb') as f:
+            f.write(_BINARY_HEADER.pack(_BINARY_MAGIC, BINARY_FORMAT_VERSION, len(topology)))
+            f.write(topology)
+            f.write(self.coords.get_array().astype("<f8").tobytes())
+            f.write(self.twists.get_array().astype("<f8").tobytes())
+
     def get_bulge_angle_stats_core(self, define, connections):
         '''
         Return the angle stats for a particular bulge. These stats describe the
@@ -863,6 +909,9 @@ class CoarseGrainRNA(fgb.BulgeGraph):
 
     #def get_loop_from_residue(self, residue) ->  use BulgeGraph.get_node_from_residue_num()!
     def _init_coords(self):
+        self.vres_arrays = None
+        self._derived_cache = {}
+        self._cache_dependencies = c.defaultdict(set)
         self.coords = CoordinateStorage(list(self.defines.keys()), on_change = self.reset_vatom_cache)
         self.twists = CoordinateStorage([x for x in self.defines if x[0] =="s"], on_change = self.reset_vatom_cache)
     def from_fasta(self, fasta):
@@ -878,11 +927,60 @@ class CoarseGrainRNA(fgb.BulgeGraph):
         '''
         Load this data structure from a file.
         '''
+        if _is_binary_file(cg_filename):
+            self.from_binary_file(cg_filename)
+            return
+
         with open(cg_filename, 'r') as f:
             lines = "".join(f.readlines())
 
             self.from_cg_string(lines)
 
+    def from_binary_file(self, filename):
+        """
+        Load this data structure from a file written by `to_binary_file`.
+        """
+        with open(filename, 'rb') as f:
+            content = f.read()
+        magic, version, topology_length = _BINARY_HEADER.unpack_from(content)
+        if magic != _BINARY_MAGIC:
+            raise ValueError("{} is not a binary coarse grain file.".format(filename))
+        if version != BINARY_FORMAT_VERSION:
+            raise ValueError("Unsupported version {} of the binary "
+                             "file format.".format(version))
+        offset = _BINARY_HEADER.size
+        topology = json.loads(content[offset:offset+topology_length].decode("utf-8"))
+        offset += topology_length
+
+        self.name = topology["name"]
+        self.seq = topology["seq"]
+        self.seq_length = topology["seq_length"]
+        self.seq_ids = [ (' ', num, icode) for num, icode in topology["seq_ids"] ]
+        self.defines = { d: define for d, define in topology["defines"] }
+        self.edges = c.defaultdict(set)
+        for e1, e2 in topology["edges"]:
+            self.edges[e1].add(e2)
+            self.edges[e2].add(e1)
+        self.longrange = c.defaultdict(set)
+        for e1, e2 in topology["longrange"]:
+            self.longrange[e1].add(e2)
+            self.longrange[e2].add(e1)
+        self.sampled = { key: [pdb] + values for key, pdb, values in topology["sampled"] }
+        for key, value in topology["infos"]:
+            self.infos[key].append(value)
+        if topology["project_from"] is not None:
+            self.project_from = np.array(topology["project_from"])
+
+        self._init_coords()
+        for attr in ["coords", "twists"]:
+            names = topology[attr[:-1] + "_names"]
+            storage = CoordinateStorage(names, on_change = self.reset_vatom_cache)
+            count = 2 * 3 * len(names)
+            storage.load_array(np.frombuffer(content, dtype="<f8", count=count,
+                                             offset=offset).reshape(-1, 3))
+            offset += 8 * count
+            setattr(self, attr, storage)
+
     def from_cg_string(self, cg_string):
         '''
         Populate this structure from the string
@@ -939,14 +1037,14 @@ class CoarseGrainRNA(fgb.BulgeGraph):
         :return: A number with the radius of gyration of this structure.
         '''
         if method=="fast":
-            coords=self.get_ordered_stem_poss()
+            get_coords = self.get_ordered_stem_poss
         elif method=="vres":
-            coords = self.get_ordered_virtual_residue_poss()
+            get_coords = self.get_ordered_virtual_residue_poss
         else:
             raise ValueError("Wrong method {}. Choose one of 'fast' and 'vres'".format(method))
 
-        rog = ftud.radius_of_gyration(coords)
-        return rog
+        return self.get_cached(("radius_of_gyration", method), list(self.stem_iterator()),
+                               lambda: ftud.radius_of_gyration(get_coords()))
 
     def get_coordinates_list(self):
         warnings.warn("CoarseGrainRNA.get_coordinates_list is deprecated and being "
@@ -1027,6 +1125,11 @@ class CoarseGrainRNA(fgb.BulgeGraph):
         :param element2: The name of the first element (e.g. 's2')
         :return: The closest distance between the two elements.
         '''
+        return self.get_cached(("element_physical_distance", element1, element2),
+                               [element1, element2], self._calc_element_physical_distance,
+                               element1, element2)
+
+    def _calc_element_physical_distance(self, element1, element2):
         (i1, i2) = ftuv.line_segment_distance(self.coords[element1][0],
                                               self.coords[element1][1],
                                               self.coords[element2][0],
@@ -1155,16 +1258,51 @@ class CoarseGrainRNA(fgb.BulgeGraph):
                     Returns a dict {"C8":np.array([x,y,z]), ...}
         """
         if isinstance(key, int):
-             if key not in self._virtual_atom_cache:
-                try:
-                    self._virtual_atom_cache[key]=ftug.virtual_atoms(self)[key]
-                except KeyError:
-                    self.add_all_virtual_residues()
-                    self._virtual_atom_cache[key]=ftug.virtual_atoms(self)[key]
-             return self._virtual_atom_cache[key]
+            elem = self.get_node_from_residue_num(key)
+            # Loop atoms are placed relative to the adjacent stems.
+            depends_on = [elem]
+            if elem[0] != "s":
+                depends_on += list(self.edges[elem])
+            return self.get_cached(("virtual_atoms", key), depends_on, self._calc_virtual_atoms, key)
         else:
             raise ValueError("Expected an int, found {}".format(key))
 
+    def _calc_virtual_atoms(self, key):
+        try:
+            return ftug.virtual_atoms(self)[key]
+        except KeyError:
+            self.add_all_virtual_residues()
+            return ftug.virtual_atoms(self)[key]
+
+    def get_cached(self, key, depends_on, function, *args):
+        """
+        Get a value derived from the coordinates and twists of some elements.
+
+        The value is calculated using `function(*args)` only if it is not cached.
+        It stays cached until the coordinates or twists of any of the elements
+        in `depends_on` change.
+
+        Only changes made through self.coords and self.twists (item assignment,
+        rotate(), load_array(), ...) are noticed. `self.coords[elem]` returns views
+        of the stored arrays, so in-place edits like `self.coords["s1"][0][:] = x`
+        leave the cached values stale. After such an edit, call
+        `self.reset_vatom_cache(elem)`.
+
+        :param key: A hashable, unique for the cached value, e.g. ("rog", "fast")
+        :param depends_on: A list of element names (e.g. ["s1", "m0"])
+        :param function: The function used to calculate the value.
+        :returns: The (cached) value
+        """
+        try:
+            return self._derived_cache[key]
+        except KeyError:
+            pass
+        value = function(*args)
+        self._derived_cache[key] = value
+        for elem in depends_on:
+            self._cache_dependencies[elem].add(key)
+        return value
+
     def reset_vatom_cache(self, key):
         """
         Used as on_call function for the observing of the self.coords dictionary.
@@ -1172,13 +1310,10 @@ class CoarseGrainRNA(fgb.BulgeGraph):
         :param key: A coarse grain element name, e.g. "s1" or "m15"
         """
         try:
-            if not self._virtual_atom_cache:
-                return
+            dependent_keys = self._cache_dependencies.pop(key, ())
         except AttributeError: #Happens during deepcopy
             return
 
-        define=self.defines[key]
-
         #Delete virtual residues
         try: del self.vposs[key]
         except KeyError: pass
@@ -1191,15 +1326,9 @@ class CoarseGrainRNA(fgb.BulgeGraph):
         try: del self.vinvs[key]
         except KeyError: pass
 
-        #Delete virtual atoms
-        if len(define)>1:
-            for i in range(define[0], define[1]+1):
-                if i in self._virtual_atom_cache:
-                    del self._virtual_atom_cache[i]
-        if len(define)>3:
-            for i in range(define[2], define[3]+1):
-                if i in self._virtual_atom_cache:
-                    del self._virtual_atom_cache[i]
+        #Delete virtual atoms and other derived values
+        for dependent_key in dependent_keys:
+            self._derived_cache.pop(dependent_key, None)
     #def __deepcopy__(self, memo):
 
     def rotate(self, angle, axis="x", unit="radians"):
@@ -11,13 +11,9 @@ def radius_of_gyration(coords):
     '''
     Calculate the radius of gyration, given a set of coordinates.
     '''
-    centroid = sum(coords) / float(len(coords))
-    diff_vecs = coords - centroid
-    #cud.pv('diff_vecs')
-    sums = np.sum(diff_vecs * diff_vecs, axis=1)
-    #cud.pv('sums')
-    total = sum(sums)
-    total /= len(coords)
+    coords = np.asarray(coords)
+    diff_vecs = coords - np.mean(coords, axis=0)
+    total = np.sum(diff_vecs * diff_vecs) / len(coords)
     rmsd = math.sqrt(total)
 
     return rmsd
@@ -30,17 +26,11 @@ def gyration_tensor(coords, diagonalize = True):
 
     :param diagonalize: Diagonalize the tensor to diag(lambda1, lambda2, lambda3)
     '''
+    coords = np.asarray(coords)
     if len(coords[0])!=3:
         raise ValueError("Coordinates for Gyration Tensor must be in 3D space")
-    centroid = sum(coords) / float(len(coords))
-    diff_vecs = coords - centroid
-    tensor = np.zeros((3,3))
-    tensor[0,0]=sum(diff_vecs[:,0]**2)
-    tensor[1,1]=sum(diff_vecs[:,1]**2)
-    tensor[2,2]=sum(diff_vecs[:,2]**2)
-    tensor[0,1]=tensor[1,0]=sum(diff_vecs[:,0]*diff_vecs[:,1])
-    tensor[0,2]=tensor[2,0]=sum(diff_vecs[:,0]*diff_vecs[:,2])
-    tensor[1,2]=tensor[2,1]=sum(diff_vecs[:,1]*diff_vecs[:,2])
+    diff_vecs = coords - np.mean(coords, axis=0)
+    tensor = np.dot(diff_vecs.T, diff_vecs)
     if not diagonalize:
         return tensor
     tensor/=len(coords)
@@ -73,3 +63,31 @@ def asphericity(coords):
     """
     g_tensor = gyration_tensor(coords)
     return g_tensor[0,0]-(g_tensor[1,1]+g_tensor[2,2])/2
+
+def batch_descriptors(coords):
+    """
+    Calculate the descriptors of many point-clouds (of equal size) at once.
+
+    :param coords: A numpy array of shape (frames x points x 3)
+    :returns: A dictionary with the following numpy arrays:
+
+              * "rog": The radius of gyration (frames)
+              * "eigenvalues": The eigenvalues of the normalized gyration tensor,
+                in descending order (frames x 3)
+              * "anisotropy": The anisotropy (frames)
+              * "asphericity": The asphericity (frames)
+    """
+    coords = np.asarray(coords, dtype=float)
+    if coords.ndim != 3 or coords.shape[2] != 3:
+        raise ValueError("Expected an array of shape (frames x points x 3), "
+                         "found {}".format(coords.shape))
+    diff_vecs = coords - np.mean(coords, axis=1, keepdims=True)
+    tensors = np.einsum('fpi,fpj->fij', diff_vecs, diff_vecs) / coords.shape[1]
+    eigenvalues = np.linalg.eigvalsh(tensors)[:, ::-1]
+    trace = np.sum(eigenvalues, axis=1)
+    pp = (eigenvalues[:,0]*eigenvalues[:,1] + eigenvalues[:,0]*eigenvalues[:,2] +
+          eigenvalues[:,1]*eigenvalues[:,2])
+    return { "rog": np.sqrt(np.einsum('fii->f', tensors)),
+             "eigenvalues": eigenvalues,
+             "anisotropy": 1-3*pp/trace**2,
+             "asphericity": eigenvalues[:,0]-(eigenvalues[:,1]+eigenvalues[:,2])/2 }
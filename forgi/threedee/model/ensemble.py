@@ -11,6 +11,12 @@ import sys, math
 import numpy as np
 import forgi.threedee.model.coarse_grain as ftmc
 import forgi.threedee.model.descriptors as ftmd
+import forgi.threedee.model.similarity as ftms
+from forgi.threedee.model.Element import CoordinateStorage
+import collections as col
+import copy
+import functools
+import multiprocessing as mp
 import scipy.stats
 import matplotlib.pyplot as plt
 import warnings
@@ -652,11 +658,228 @@ def blocked_average_reverse(x, bin_width):
             raise
 
 ############################### Ensembles of CG-Objects ###########################################
-def ensemble_from_filenames(filenames):
-    cgs=[]
-    for fn in filenames:
-        cgs.append(ftmc.CoarseGrainRNA(fn))
-    return Ensemble(cgs)
+def ensemble_from_filenames(filenames, memmap_filename=None, num_workers=1, chunksize=16):
+    """
+    Load an Ensemble from a list of cg files.
+
+    :param filenames: A list of filenames. All files have to contain the same 2D structure.
+    :param memmap_filename: None or a filename.
+                    If this is None, all CoarseGrainRNA objects are kept in memory.
+                    Otherwise the coordinates are written to a memory-mapped
+                    array in this file (see `MemmapTrajectory`) and structures
+                    are only created on demand. Use this for long trajectories.
+    :param num_workers: The number of processes used for loading. See `iter_load_cgs`
+    :param chunksize: The number of files sent to a worker at once.
+    """
+    filenames = list(filenames)
+    cgs = iter_load_cgs(filenames, num_workers, chunksize)
+    if memmap_filename is not None:
+        trajectory = None
+        for i, cg in enumerate(cgs):
+            if trajectory is None:
+                trajectory = MemmapTrajectory.create(memmap_filename, cg, len(filenames))
+            trajectory.set_frame(i, cg)
+        if trajectory is None:
+            raise ValueError("Cannot create a memory-mapped Ensemble without structures.")
+        trajectory.flush()
+        return Ensemble(trajectory)
+    return Ensemble(list(cgs))
+
+def _imap(function, iterable, num_workers, chunksize):
+    """
+    Like the builtin map, but uses a pool of num_workers processes.
+
+    The results are yielded in input order, as soon as they are available.
+
+    :param num_workers: INT. 1 for no multiprocessing, -1 for one less than the number of CPUs.
+    """
+    if num_workers == -1:
+        num_workers = max(1, mp.cpu_count() - 1)
+    if num_workers == 1:
+        for result in map(function, iterable):
+            yield result
+        return
+    pool = mp.Pool(processes = num_workers)
+    try:
+        for result in pool.imap(function, iterable, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def iter_load_cgs(filenames, num_workers=-1, chunksize=16):
+    """
+    Load cg files, using several processes.
+
+    This is a generator, which yields the CoarseGrainRNA objects in the order of
+    the filenames as soon as they are loaded. This way, not all structures have
+    to be kept in memory at once.
+
+    :param filenames: An iterable of filenames
+    :param num_workers: INT. The number of processes.
+                        1 for no multiprocessing, -1 for one less than the number of CPUs.
+    :param chunksize: The number of files sent to a worker process at once.
+    """
+    return _imap(ftmc.CoarseGrainRNA, filenames, num_workers, chunksize)
+
+def _descriptor_points(filename, domain):
+    cg = ftmc.CoarseGrainRNA(filename)
+    if domain:
+        return cg.get_poss_for_domain(domain, "vres")
+    else:
+        return cg.get_ordered_stem_poss()
+
+def descriptors_from_filenames(filenames, domain=None, num_workers=-1, chunksize=16):
+    """
+    Calculate all descriptors in `Ensemble.AVAILABLE_DESCRIPTORS` for many cg files,
+    using several processes and without keeping the structures in memory.
+
+    The files are loaded by the worker processes, which only return the
+    points used for calculating the descriptors.
+
+    :param filenames: An iterable of filenames. All files have to contain the same 2D structure.
+    :param domain: None (whole RNA) or a collection of cg. elements.
+    :param num_workers: INT. The number of processes.
+                        1 for no multiprocessing, -1 for one less than the number of CPUs.
+    :param chunksize: The number of files sent to a worker process at once.
+    :returns: A dictionary descriptor name: np.array, in the order of the filenames.
+              See `ftmd.batch_descriptors`
+    """
+    points = list(_imap(functools.partial(_descriptor_points, domain=domain),
+                        filenames, num_workers, chunksize))
+    if not points:
+        return { descriptor: np.zeros(0) for descriptor in Ensemble.AVAILABLE_DESCRIPTORS }
+    return ftmd.batch_descriptors(np.array(points))
+
+class MemmapTrajectory(Sequence):
+    """
+    A sequence of coarse grained structures with the same 2D structure, where only
+    the coordinates and twists of each frame are stored in a memory-mapped array.
+
+    The array has the shape (frames x elements x 2 x 3). The first elements are
+    the elements in `template.coords`, followed by the stems in `template.twists`.
+    The 2D structure is stored only once (`template`, saved to `filename + ".cgb"`).
+
+    CoarseGrainRNA objects are only created when a frame is accessed via
+    `__getitem__`. They share the 2D structure (defines, edges, sequence,...)
+    with the template, which therefore must not be modified.
+    """
+    def __init__(self, filename, template=None, mode="r"):
+        """
+        :param filename: The .npy file holding the coordinates.
+        :param template: A CoarseGrainRNA with the 2D structure or None.
+                         If it is None, it is loaded from `filename + ".cgb"`.
+        :param mode: The mode used for np.load's memory mapping. "r" or "r+"
+        """
+        if template is None:
+            template = ftmc.CoarseGrainRNA(filename + ".cgb")
+        self.filename = filename
+        self.template = template
+        self._coord_names = list(template.coords.keys())
+        self._twist_names = list(template.twists.keys())
+        self._frames = np.load(filename, mmap_mode=mode)
+        expected_shape = (len(self._coord_names)+len(self._twist_names), 2, 3)
+        if self._frames.shape[1:] != expected_shape:
+            raise ValueError("The array in {} has the shape {}, expected (frames, {}, {}, {})"
+                             "".format(filename, self._frames.shape, *expected_shape))
+
+    @classmethod
+    def create(cls, filename, template, num_frames):
+        """
+        Create a new memory-mapped file for num_frames structures with the 2D
+        structure of template. The coordinates of all frames are initialized to NaN.
+
+        :returns: A writable MemmapTrajectory. Use `set_frame` to fill it.
+        """
+        num_elements = len(template.coords) + len(template.twists)
+        frames = np.lib.format.open_memmap(filename, mode="w+", dtype=float,
+                                           shape=(num_frames, num_elements, 2, 3))
+        frames[:] = np.nan
+        frames.flush()
+        del frames
+        template.to_binary_file(filename + ".cgb")
+        return cls(filename, template, mode="r+")
+
+    @property
+    def coords(self):
+        """
+        The (memory-mapped) array of coarse grain coordinates with the shape
+        (frames x len(template.coords) x 2 x 3)
+        """
+        return self._frames[:, :len(self._coord_names)]
+
+    @property
+    def twists(self):
+        """
+        The (memory-mapped) array of twists with the shape
+        (frames x len(template.twists) x 2 x 3)
+        """
+        return self._frames[:, len(self._coord_names):]
+
+    def get_ordered_stem_poss(self):
+        """
+        The coordinates of all stems for all frames, in the order used by
+        CoarseGrainRNA.get_ordered_stem_poss
+
+        :returns: A numpy array of shape (frames x 2*number of stems x 3)
+        """
+        indices = [ self._coord_names.index(s) for s in self.template.sorted_stem_iterator() ]
+        return self._frames[:, indices].reshape((len(self), -1, 3))
+
+    def set_frame(self, i, cg):
+        """
+        Store the coordinates and twists of cg as the i'th frame.
+
+        :param cg: A CoarseGrainRNA with the same 2D structure as the template.
+        """
+        if cg.defines != self.template.defines:
+            raise ValueError("All structures of a trajectory need to have the same 2D structure.")
+        num_coords = len(self._coord_names)
+        self._frames[i, :num_coords] = cg.coords[self._coord_names].reshape((-1, 2, 3))
+        self._frames[i, num_coords:] = cg.twists[self._twist_names].reshape((-1, 2, 3))
+
+    def flush(self):
+        """
+        Write changes to the disk.
+        """
+        self._frames.flush()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [ self[j] for j in range(*i.indices(len(self))) ]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Frame {} out of range".format(i))
+        num_coords = len(self._coord_names)
+        cg = copy.copy(self.template)
+        # The copy shares the 2D structure with the template, but everything
+        # derived from coordinates has to be specific for the frame.
+        cg.vposs = col.defaultdict( dict )
+        cg.vbases = col.defaultdict( dict )
+        cg.vvecs = col.defaultdict( dict )
+        cg.v3dposs = col.defaultdict( dict )
+        cg.vinvs = col.defaultdict( dict )
+        cg.bases = dict()
+        cg.stem_invs = dict()
+        cg._init_coords()
+        cg.coords = CoordinateStorage(self._coord_names, on_change=cg.reset_vatom_cache)
+        cg.coords.load_array(self._frames[i, :num_coords].reshape((-1, 3)))
+        cg.twists = CoordinateStorage(self._twist_names, on_change=cg.reset_vatom_cache)
+        cg.twists.load_array(self._frames[i, num_coords:].reshape((-1, 3)))
+        return cg
+
+def _descriptor_key(descriptor, domain):
+    """
+    The key used for caching descriptors in Ensemble._descriptors
+    """
+    if domain is None:
+        return descriptor
+    return (descriptor, tuple(sorted(domain)))
 
 class EnsembleBase(Sequence):
     """
@@ -674,21 +897,41 @@ class EnsembleBase(Sequence):
         """
         if descriptor not in self.AVAILABLE_DESCRIPTORS:
             raise ValueError("Descriptor {} not available.".format(descriptor))
-        if descriptor == "rog":
-            if domain:
-                return np.array([ ftmd.radius_of_gyration(cg.get_poss_for_domain(domain, "vres")) for cg in self ])
-            else:
-                return np.array([ cg.radius_of_gyration() for cg in self ])
-        elif descriptor == "anisotropy":
-            if domain:
-                return np.array([ ftmd.anisotropy(cg.get_poss_for_domain(domain, "vres")) for cg in self ])
-            else:
-                return np.array([ ftmd.anisotropy(cg.get_ordered_stem_poss()) for cg in self ])
-        elif descriptor == "asphericity":
-            if domain:
-                return np.array([ ftmd.asphericity(cg.get_poss_for_domain(domain, "vres")) for cg in self ])
-            else:
-                return np.array([ ftmd.asphericity(cg.get_ordered_stem_poss()) for cg in self ])
+        return self._get_all_descriptors(domain)[descriptor]
+
+    def _get_all_descriptors(self, domain=None):
+        """
+        Calculate all AVAILABLE_DESCRIPTORS at once.
+
+        :param domain: An iterable of cg element names or None (whole cg)
+        :returns: A dictionary descriptor name: np.array
+        """
+        if len(self)==0:
+            return { descriptor: np.zeros(0) for descriptor in self.AVAILABLE_DESCRIPTORS }
+        return ftmd.batch_descriptors(self._get_stacked_coords(domain))
+
+    def _get_stacked_coords(self, domain=None):
+        """
+        The points used for calculating descriptors for all structures.
+
+        :param domain: An iterable of cg element names or None (whole cg)
+        :returns: An np.array of shape (structures x points x 3)
+        """
+        if domain:
+            return np.array([ cg.get_poss_for_domain(domain, "vres") for cg in self ])
+        else:
+            return np.array([ cg.get_ordered_stem_poss() for cg in self ])
+
+    def rmsd_matrix(self, tile_size=256, num_workers=1, memmap_filename=None):
+        """
+        The pairwise RMSD between all structures of the ensemble,
+        using the virtual residue positions (like ftms.cg_rmsd).
+
+        See ftms.cg_rmsd_matrix for the parameters.
+
+        :returns: A condensed distance matrix (like scipy.spatial.distance.pdist)
+        """
+        return ftms.cg_rmsd_matrix(self, tile_size, num_workers, memmap_filename)
 
     def autocorrelation(self, descriptor = "rog", domain = None, mean = None):
         """
@@ -755,12 +998,20 @@ class Ensemble(EnsembleBase):
         :param domain: None (whole RNA) or a collection of cg. elements.
                        If domain is present, calculate the descriptor only for these cg-elements.   
         """
-        if domain is None:
-            if descriptor not in self._descriptors:
-                self._descriptors[descriptor] = self._get_descriptor(descriptor, domain)
-            return self._descriptors[descriptor]
-        else: #No caching with domains.
-            return self._get_descriptor(descriptor, domain)
+        if descriptor not in self.AVAILABLE_DESCRIPTORS:
+            raise ValueError("Descriptor {} not available.".format(descriptor))
+        key = _descriptor_key(descriptor, domain)
+        if key not in self._descriptors:
+            descriptors = self._get_all_descriptors(domain)
+            for name in self.AVAILABLE_DESCRIPTORS:
+                self._descriptors[_descriptor_key(name, domain)] = descriptors[name]
+        return self._descriptors[key]
+
+    def _get_stacked_coords(self, domain=None):
+        if not domain and isinstance(self._cgs, MemmapTrajectory):
+            # Read the stem coordinates directly from the memory-mapped array.
+            return self._cgs.get_ordered_stem_poss()
+        return super(Ensemble, self)._get_stacked_coords(domain)
 
 class EnsembleView(EnsembleBase):
     def __init__(self, ens, start, end):
@@ -795,13 +1046,11 @@ class EnsembleView(EnsembleBase):
 
         Gets the descriptor only for part of the ensemble that is in this view.
         """
-        if domain is None:
-            if descriptor not in self._ensemble._descriptors:
-                return self._get_descriptor(descriptor, domain)
-            else:
-                return self._ensemble._descriptors[descriptor][self._start:self._end]
-        else: #No caching with domains.
+        key = _descriptor_key(descriptor, domain)
+        if key not in self._ensemble._descriptors:
             return self._get_descriptor(descriptor, domain)
+        else:
+            return self._ensemble._descriptors[key][self._start:self._end]
 
 
 
@@ -1,4 +1,5 @@
 import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.model.spatial_index as ftmsi
 import forgi.utilities.debug as fud
 
 import forgi.threedee.utilities.vector as ftuv
@@ -6,9 +7,10 @@ import forgi.threedee.utilities.graph_pdb as ftug
 
 import itertools as it 
 import math
+import multiprocessing as mp
 import numpy as np
 
-__all__ = ['AdjacencyCorrelation', 'cg_rmsd', 'rmsd', 'drmsd']
+__all__ = ['AdjacencyCorrelation', 'cg_rmsd', 'rmsd', 'drmsd', 'rmsd_matrix', 'cg_rmsd_matrix']
 
 """
 This module contains functions for the comparison of two cg objects or two ordered point-clouds.
@@ -64,32 +66,55 @@ class AdjacencyCorrelation(object):
 
     This is significantly faster than the confusion_matrix function, if 
     many structures will be compared to the same reference structure.
+    For many structures with the same 2D structure (e.g. a sampling trajectory),
+    evaluate_batch() or evaluate_coordinates() are faster still.
     """
     def __init__(self, reference_cg, distance=25.0, bp_distance=16):
         self._distance=distance        
         self._bp_distance=bp_distance
         self._reference_interactions=self.get_interactions(reference_cg)
+        #: The sorted element names of the reference. The order used by evaluate_coordinates.
+        self.elements = sorted(reference_cg.defines.keys())
+        self._allowed_pairs, self._reference_mask = self._get_allowed_pairs(reference_cg)
+
+    def _get_allowed_pairs(self, cg):
+        """
+        The pairs of elements that are considered by evaluate,
+        based on the 2D structure of the reference.
+
+        :returns: A tuple (pairs, reference_mask).
+                  pairs is a tuple of two integer arrays (indices into self.elements),
+                  reference_mask is True for pairs that interact in the reference.
+        """
+        pairs = []
+        for i, j in it.combinations(range(len(self.elements)), r=2):
+            n1, n2 = self.elements[i], self.elements[j]
+            if cg.connected(n1, n2):
+                continue
+            if cg.min_max_bp_distance(n1, n2)[0] < self._bp_distance:
+                continue
+            pairs.append((i,j))
+        pairs = np.array(pairs, dtype=int).reshape((-1, 2))
+        reference_mask = np.array([ (self.elements[i], self.elements[j]) in self._reference_interactions
+                                    for i, j in pairs ], dtype=bool)
+        return (pairs[:,0], pairs[:,1]), reference_mask
 
     def get_interactions(self, cg):
         """
         :return: A set of 2-tuples containing elements that pair.
         """
         interactions=set()
-        nodes=set(cg.defines.keys())
-        for n1, n2 in it.combinations(nodes, r=2):
-            n1,n2=sorted((n1,n2)) #TODO: Read itertools documentation, if this is necessary.
+        # Only look at pairs of elements that are close in space.
+        grid = ftmsi.SegmentGrid(cg.coords)
+        for n1, n2 in grid.pairs_within(self._distance):
+            if n1 not in cg.defines or n2 not in cg.defines:
+                continue
             if cg.connected(n1, n2):
                 continue
             bp_dist = cg.min_max_bp_distance(n1, n2)[0]
             if bp_dist < self._bp_distance:
                 continue
-            if ftuv.elements_closer_than(cg.coords[n1][0],
-                                       cg.coords[n1][1],
-                                       cg.coords[n2][0],
-                                       cg.coords[n2][1], self._distance):
-            #dist = cg.element_physical_distance(n1, n2)
-            #if dist < self._distance:
-                interactions.add((n1,n2))
+            interactions.add((n1,n2))
         return interactions
     
     def evaluate(self, cg):
@@ -119,6 +144,57 @@ class AdjacencyCorrelation(object):
         d["tn"]=len(allIA - (self._reference_interactions | interactions) )
         return d
 
+    def evaluate_batch(self, cgs):
+        '''
+        Like evaluate, but for many structures with the same 2D structure
+        as the reference (e.g. an Ensemble).
+
+        :param cgs: A sequence of coarse grain models
+        :return: A dictionary with the keys "tp", "tn", "fp", "fn" and "mcc".
+                 Each value is an array with one entry per structure.
+        '''
+        coords = np.array([ cg.coords[self.elements] for cg in cgs ])
+        return self.evaluate_coordinates(coords.reshape((len(coords), -1, 2, 3)))
+
+    def evaluate_coordinates(self, coords, elements=None):
+        '''
+        Like evaluate_batch, but using the coordinates of the coarse grain elements directly.
+
+        The allowed pairs of elements are taken from the reference structure.
+
+        :param coords: An array of shape (structures x elements x 2 x 3).
+                       Start and end of each coarse grained element for all structures.
+        :param elements: The element names corresponding to the second axis of coords.
+                         If None, the order of self.elements is assumed.
+        :return: A dictionary with the keys "tp", "tn", "fp", "fn" and "mcc".
+                 Each value is an array with one entry per structure.
+                 The "mcc" is calculated like in the function mcc(), but is
+                 NaN where it is undefined.
+        '''
+        coords = np.asarray(coords, dtype=float)
+        if elements is not None:
+            elem_index = { elem: i for i, elem in enumerate(elements) }
+            coords = coords[:, [ elem_index[elem] for elem in self.elements ]]
+        if coords.shape[1:] != (len(self.elements), 2, 3):
+            raise ValueError("Expected coordinates of shape (structures, {}, 2, 3), "
+                             "found {}".format(len(self.elements), coords.shape))
+        ind1, ind2 = self._allowed_pairs
+        num_frames = len(coords)
+        closer = ftuv.elements_closer_than_array(coords[:, ind1].reshape((-1, 2, 3)),
+                                                 coords[:, ind2].reshape((-1, 2, 3)),
+                                                 self._distance, paired=True)
+        closer = closer.reshape((num_frames, len(ind1)))
+        reference = self._reference_mask
+        d = {}
+        d["tp"] = np.sum(closer & reference, axis=1)
+        d["fp"] = np.sum(closer & ~reference, axis=1)
+        d["fn"] = np.sum(~closer & reference, axis=1)
+        d["tn"] = np.sum(~closer & ~reference, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d["mcc"] = np.sqrt(d["tp"] / (d["tp"] + d["fp"]).astype(float) *
+                               d["tp"] / (d["tp"] + d["fn"]).astype(float))
+        return d
+
 #NOTE: could be deprecated in the future. Use AdjacencyCorrelation.
 def confusion_matrix(cg1, cg2, distance=25, bp_distance=16):
     '''
@@ -147,7 +223,12 @@ def confusion_matrix(cg1, cg2, distance=25, bp_distance=16):
 
     assert(nodes1 == nodes2)
 
-    for n1, n2 in it.combinations(nodes1, r=2):
+    nodes = sorted(nodes1)
+    node_index = { node: i for i, node in enumerate(nodes) }
+    distances1 = ftug.element_distances(cg1, nodes)
+    distances2 = ftug.element_distances(cg2, nodes)
+
+    for n1, n2 in it.combinations(nodes, r=2):
         if cg1.connected(n1, n2):
             continue
 
@@ -159,8 +240,8 @@ def confusion_matrix(cg1, cg2, distance=25, bp_distance=16):
         if bp_dist < bp_distance:
             continue
 
-        dist1 = cg1.element_physical_distance(n1, n2)
-        dist2 = cg2.element_physical_distance(n1, n2)
+        dist1 = distances1[node_index[n1], node_index[n2]]
+        dist2 = distances2[node_index[n1], node_index[n2]]
 
         if dist1 < distance:
             # positive
@@ -253,6 +334,115 @@ def rmsd(crds1, crds2):
 
     return math.sqrt(sum(vec_lengths) / len(vec_lengths))
 
+def _rmsd_tile(crds1, crds2):
+    '''
+    The RMSD after optimal superposition between every structure in crds1
+    and every structure in crds2, using a stacked SVD (Kabsch algorithm).
+
+    :param crds1: An array of shape (I x points x 3), each structure centered on its centroid
+    :param crds2: An array of shape (J x points x 3), each structure centered on its centroid
+    :return: An array of shape (I x J)
+    '''
+    # The correlation matrices for all pairs (I x J x 3 x 3)
+    correlation_matrices = np.tensordot(crds1, crds2, axes=([1], [1])).transpose(0, 2, 1, 3)
+    v, s, w_tr = np.linalg.svd(correlation_matrices)
+    is_reflection = (np.linalg.det(v) * np.linalg.det(w_tr)) < 0.0
+    s[is_reflection, -1] = -s[is_reflection, -1]
+    sq1 = np.einsum('ipk,ipk->i', crds1, crds1)
+    sq2 = np.einsum('jpk,jpk->j', crds2, crds2)
+    sq_sum = sq1[:, np.newaxis] + sq2[np.newaxis, :]
+    msd = (sq_sum - 2 * np.sum(s, axis=-1)) / crds1.shape[1]
+    # For (almost) identical structures, the difference above suffers from
+    # cancellation. Superimpose these pairs explicitly.
+    for i, j in zip(*np.nonzero(msd < 1e-6 * sq_sum / crds1.shape[1])):
+        if is_reflection[i, j]:
+            v[i, j, :, -1] = -v[i, j, :, -1]
+        diff_vecs = crds2[j] - np.dot(crds1[i], np.dot(v[i, j], w_tr[i, j]))
+        msd[i, j] = np.sum(diff_vecs * diff_vecs) / crds1.shape[1]
+    return np.sqrt(np.maximum(msd, 0))
+
+def _rmsd_matrix_tile(coords, tile):
+    (i0, i1), (j0, j1) = tile
+    return tile, _rmsd_tile(coords[i0:i1], coords[j0:j1])
+
+#: The coordinates of the current rmsd_matrix call, in every worker process.
+_rmsd_matrix_coords = None
+
+def _init_rmsd_matrix_worker(coords):
+    global _rmsd_matrix_coords
+    _rmsd_matrix_coords = coords
+
+def _rmsd_matrix_worker(tile):
+    return _rmsd_matrix_tile(_rmsd_matrix_coords, tile)
+
+def rmsd_matrix(coords, tile_size=256, num_workers=1, memmap_filename=None):
+    '''
+    Calculate the RMSD between all pairs of structures (like `rmsd`, but in one go).
+
+    The structures are centered once. The matrix is then filled in tiles of
+    tile_size x tile_size structures, using stacked SVDs.
+
+    :param coords: An array of shape (structures x points x 3),
+                   e.g. the virtual residue positions of an ensemble.
+    :param tile_size: The number of structures per tile.
+    :param num_workers: INT. The number of processes used.
+                        1 for no multiprocessing, -1 for one less than the number of CPUs.
+    :param memmap_filename: None or a filename. If this is given, the result is
+                        written to a memory-mapped .npy file instead of being kept in memory.
+    :return: The condensed distance matrix (1D, in the order used by
+             scipy.spatial.distance.pdist, i.e. (0,1), (0,2),..., (1,2),...)
+    '''
+    coords = np.asarray(coords, dtype=float)
+    n = len(coords)
+    if n:
+        coords = coords - np.mean(coords, axis=1, keepdims=True)
+    size = n * (n - 1) // 2
+    if memmap_filename is not None:
+        out = np.lib.format.open_memmap(memmap_filename, mode="w+", dtype=float, shape=(size,))
+    else:
+        out = np.empty(size)
+    starts = list(range(0, n, tile_size))
+    tiles = [ ((i0, min(i0+tile_size, n)), (j0, min(j0+tile_size, n)))
+              for i0 in starts for j0 in starts if j0 >= i0 ]
+
+    if num_workers == -1:
+        num_workers = max(1, mp.cpu_count() - 1)
+    if num_workers == 1:
+        _fill_condensed(out, n, ( _rmsd_matrix_tile(coords, tile) for tile in tiles ))
+    else:
+        pool = mp.Pool(processes=num_workers, initializer=_init_rmsd_matrix_worker,
+                       initargs=(coords,))
+        try:
+            _fill_condensed(out, n, pool.imap_unordered(_rmsd_matrix_worker, tiles))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    if memmap_filename is not None:
+        out.flush()
+    return out
+
+def _fill_condensed(out, n, results):
+    for ((i0, i1), (j0, j1)), tile in results:
+        i, j = np.meshgrid(np.arange(i0, i1), np.arange(j0, j1), indexing="ij")
+        mask = i < j
+        i = i[mask]
+        j = j[mask]
+        out[n * i - i * (i + 1) // 2 + j - i - 1] = tile[mask]
+
+def cg_rmsd_matrix(cgs, tile_size=256, num_workers=1, memmap_filename=None):
+    '''
+    The RMSD (like in `cg_rmsd`) between all pairs of coarse grain models.
+
+    The virtual residue positions of every structure are calculated only once.
+    See `rmsd_matrix` for the parameters.
+
+    :param cgs: A sequence of coarse grain models (e.g. an Ensemble) with the same 2D structure.
+    :return: The condensed distance matrix (as returned by scipy.spatial.distance.pdist)
+    '''
+    coords = np.array([ cg.get_ordered_virtual_residue_poss() for cg in cgs ])
+    return rmsd_matrix(coords, tile_size, num_workers, memmap_filename)
+
 def drmsd(coords1, coords2):
     '''
     Calculate the dRMSD measure.
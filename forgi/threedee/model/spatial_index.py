@@ -0,0 +1,200 @@
+"""
+A spatial index for the line segments of coarse grained elements.
+
+The index is a uniform grid. Every segment is registered in all grid cells
+that are touched by its axis-aligned bounding box, so neighborhood queries
+only have to look at segments in nearby cells instead of at all pairs of segments.
+"""
+
+from __future__ import division
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import collections as col
+import itertools as it
+import math
+
+import numpy as np
+
+import forgi.threedee.utilities.vector as ftuv
+
+__all__ = ["SegmentGrid"]
+
+class SegmentGrid(object):
+    def __init__(self, coords=None, cell_size=None):
+        """
+        :param coords: A dictionary-like object (e.g. cg.coords) mapping element names
+                       to a tuple of start and end point, or None for an empty grid.
+                       Elements with NaN-coordinates are not added.
+        :param cell_size: The edge length of the (cubic) grid cells in Angstrom.
+                       If None, use the median extent of the segment's bounding boxes
+                       (or 1, if there are no valid coordinates).
+                       Has to be set explicitly, if coords is None.
+        """
+        if coords is None:
+            coords = {}
+        self._segments = {}
+        self._cells = col.defaultdict(set)
+        self._versions = {}
+        if cell_size is None:
+            cell_size = self._guess_cell_size(coords)
+        if cell_size <= 0:
+            raise ValueError("cell_size has to be positive, not {}".format(cell_size))
+        self.cell_size = float(cell_size)
+        for elem in coords:
+            self.update(elem, coords[elem])
+        self._remember_versions(coords)
+
+    @staticmethod
+    def _guess_cell_size(coords):
+        extents = []
+        for elem in coords:
+            p0, p1 = coords[elem]
+            extent = np.max(np.abs(np.asarray(p1, dtype=float) - np.asarray(p0, dtype=float)))
+            if not math.isnan(extent):
+                extents.append(extent)
+        if not extents:
+            # No segment will be added to the grid, so any cell size works.
+            return 1.
+        return max(np.median(extents), 1.)
+
+    def _remember_versions(self, coords):
+        if hasattr(coords, "version"):
+            self._versions = { elem: coords.version(elem) for elem in coords }
+
+    def _cell_range(self, lower, upper):
+        """
+        All cells touched by the box between the points lower and upper.
+        """
+        lo = np.floor(lower / self.cell_size).astype(int)
+        hi = np.floor(upper / self.cell_size).astype(int)
+        return it.product(*[ range(l, h+1) for l, h in zip(lo, hi) ])
+
+    def _occupied_cells_in_range(self, lower, upper):
+        """
+        All non-empty cells touched by the box between the points lower and upper.
+
+        If the box spans more cells than are occupied, only the occupied cells are tested.
+        """
+        lo = np.floor(lower / self.cell_size).astype(int)
+        hi = np.floor(upper / self.cell_size).astype(int)
+        num_cells = 1
+        for l, h in zip(lo, hi):
+            num_cells *= int(h) - int(l) + 1 # Python integers, which do not overflow
+        if num_cells <= len(self._cells):
+            return [ cell for cell in self._cell_range(lower, upper) if cell in self._cells ]
+        return [ cell for cell in self._cells
+                 if all(l <= c <= h for c, l, h in zip(cell, lo, hi)) ]
+
+    def __contains__(self, elem):
+        return elem in self._segments
+
+    def __len__(self):
+        return len(self._segments)
+
+    def __iter__(self):
+        return iter(self._segments)
+
+    def update(self, elem, segment):
+        """
+        Add an element to the index or update its position.
+
+        :param elem: The element name, e.g. "s1"
+        :param segment: A tuple start point, end point
+        """
+        self.remove(elem)
+        p0, p1 = (np.array(p, dtype=float) for p in segment)
+        if np.any(np.isnan(p0)) or np.any(np.isnan(p1)):
+            return
+        lower = np.minimum(p0, p1)
+        upper = np.maximum(p0, p1)
+        cells = list(self._cell_range(lower, upper))
+        for cell in cells:
+            self._cells[cell].add(elem)
+        self._segments[elem] = (p0, p1, lower, upper, cells)
+
+    def remove(self, elem):
+        """
+        Remove an element from the index, if it is present.
+        """
+        try:
+            p0, p1, lower, upper, cells = self._segments.pop(elem)
+        except KeyError:
+            return
+        for cell in cells:
+            self._cells[cell].discard(elem)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def sync(self, coords):
+        """
+        Update all elements that have moved since the index was built
+        or last synchronized.
+
+        :param coords: A forgi.threedee.model.Element.CoordinateStorage, e.g. cg.coords
+        :returns: A list of the element names that were updated.
+        """
+        changed = [ elem for elem in coords if self._versions.get(elem) != coords.version(elem) ]
+        for elem in changed:
+            self.update(elem, coords[elem])
+        for elem in list(self._segments):
+            if elem not in coords:
+                self.remove(elem)
+        self._remember_versions(coords)
+        return changed
+
+    def candidates(self, lower, upper):
+        """
+        All elements whose bounding box intersects the box between lower and upper.
+        """
+        found = set()
+        for cell in self._occupied_cells_in_range(lower, upper):
+            found.update(self._cells[cell])
+        return set( elem for elem in found
+                    if np.all(self._segments[elem][2] <= upper) and
+                       np.all(self._segments[elem][3] >= lower) )
+
+    def pairs_within(self, distance):
+        """
+        All pairs of elements whose segments are closer than distance.
+
+        The exact test is ftuv.elements_closer_than(_array), so the result is the
+        same as comparing all pairs of elements.
+
+        :param distance: A distance in Angstrom
+        :returns: A set of sorted tuples of element names
+        """
+        candidate_pairs = []
+        for elem1, (p0, p1, lower, upper, _) in self._segments.items():
+            for elem2 in self.candidates(lower - distance, upper + distance):
+                if elem2 > elem1:
+                    candidate_pairs.append((elem1, elem2))
+        if not candidate_pairs:
+            return set()
+        segs1 = np.array([ self._segments[elem1][:2] for elem1, _ in candidate_pairs ])
+        segs2 = np.array([ self._segments[elem2][:2] for _, elem2 in candidate_pairs ])
+        closer = ftuv.elements_closer_than_array(segs1, segs2, distance, paired=True)
+        return set( pair for pair, is_close in zip(candidate_pairs, closer) if is_close )
+
+    def elements_near(self, point, distance):
+        """
+        All elements whose segment is closer than distance to point.
+
+        :param point: A point in 3D space
+        :param distance: A distance in Angstrom
+        :returns: A set of element names
+        """
+        point = np.asarray(point, dtype=float)
+        near = set()
+        for elem in self.candidates(point - distance, point + distance):
+            p0, p1 = self._segments[elem][:2]
+            seg = p1 - p0
+            length2 = np.dot(seg, seg)
+            if length2 == 0:
+                closest = p0
+            else:
+                closest = p0 + min(max(np.dot(point - p0, seg) / length2, 0.), 1.) * seg
+            if ftuv.vec_distance(point, closest) < distance:
+                near.add(elem)
+        return near
@@ -1,8 +1,13 @@
 #!/usr/bin/python
 
 import csv
+import hashlib
 import itertools as it
+import logging
+import os
+import pickle
 import sys, warnings
+import tempfile
 
 import random as rand
 import numpy as np
@@ -17,6 +22,8 @@ import forgi.utilities.debug as fud
 import forgi.threedee.utilities.vector as ftuv
 import forgi.threedee.utilities.graph_pdb as ftug
 
+log = logging.getLogger(__name__)
+
 # The two constants seem to be unused.
 avg_stem_bp_length = 2.24 
 avg_twist_rotation_per_bp = 360 / 11.
@@ -312,6 +319,218 @@ class AngleStat:
         '''
         return ftuv.vec_angle(np.array([-1.,0.,0.]), ftuv.spherical_polar_to_cartesian([1, self.u, self.v]))
     
+class AngleStatList(object):
+    '''
+    A read-only list of the AngleStats with the given rows of an AngleStatTable.
+
+    The AngleStat objects are only created when they are accessed.
+    '''
+    def __init__(self, table, rows):
+        self._table = table
+        #: The indices of the stats in table.data
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return AngleStatList(self._table, self.rows[i])
+        return self._table.stat(self.rows[i])
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self._table.stat(row)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return "<AngleStatList with {} stats>".format(len(self))
+
+    @property
+    def array(self):
+        """
+        The rows of the structured array of the table (see AngleStatTable.dtype).
+        """
+        return self._table.data[self.rows]
+
+    def params(self):
+        '''
+        :returns: An array of shape N x 6, with the columns u, v, t, r1, u1, v1
+        '''
+        data = self.array
+        return np.column_stack([data[field] for field in ["u", "v", "t", "r1", "u1", "v1"]])
+
+    def diff(self, other_angle, next_stem_length = 1):
+        '''
+        Like AngleStat.diff, but for all stats in the list at once.
+
+        :param other_angle: An AngleStat
+        :param next_stem_length: the length of the stem that is attached to this angle.
+        :returns: An array of length N
+        '''
+        data = self.array
+        this_stem_start = ftuv.spherical_polar_to_cartesian_array(
+                                np.column_stack([data["r1"], data["u1"], data["v1"]]))
+        this_stem_end = ftuv.spherical_polar_to_cartesian_array(
+                                np.column_stack([np.full(len(data), float(next_stem_length)),
+                                                 data["u"], data["v"]]))
+        other_stem_start = ftuv.spherical_polar_to_cartesian([other_angle.r1, other_angle.u1, other_angle.v1])
+        other_stem_end = ftuv.spherical_polar_to_cartesian([next_stem_length, other_angle.u, other_angle.v])
+        return (np.sqrt(np.sum((this_stem_start - other_stem_start)**2, axis=1)) +
+                np.sqrt(np.sum((this_stem_start + this_stem_end - other_stem_start - other_stem_end)**2, axis=1)))
+
+    def nearest(self, other_angle, next_stem_length = 1):
+        '''
+        The stat in this list with the smallest diff to other_angle.
+
+        :returns: A tuple (AngleStat, diff)
+        '''
+        if not len(self):
+            raise ValueError("Cannot find the nearest stat in an empty list.")
+        diffs = self.diff(other_angle, next_stem_length)
+        i = np.argmin(diffs)
+        return self[i], diffs[i]
+
+class AngleStatTable(object):
+    '''
+    A columnar storage of angle stats.
+
+    Behaves like a defaultdict `(dim1, dim2, ang_type)`: list of AngleStats.
+    Like in the dictionary returned by get_angle_stats in earlier versions, every stat is
+    available under the key (dim1, dim2, ang_type) and (dim2, dim1, -ang_type).
+    The stats themselves are stored only once in a numpy structured array (`data`),
+    strings are stored in a string pool (`strings`), lists of sequences in a pool
+    of tuples (`seq_lists`) and AngleStat objects are created on demand.
+
+    Keys can be assigned and deleted like in a dictionary, and `table[key] += stats`
+    works. The values of keys that were never assigned are read-only AngleStatLists,
+    so `table[key].append(stat)` only works for assigned (or missing) keys.
+    '''
+    dtype = np.dtype([("pdb_name", np.int32), ("dim1", np.int32), ("dim2", np.int32),
+                      ("u", float), ("v", float), ("t", float),
+                      ("r1", float), ("u1", float), ("v1", float),
+                      ("ang_type", np.int32), ("define", np.int32, (4,)), ("define_len", np.int8),
+                      ("seqs", np.int32)])
+
+    def __init__(self, angle_stats=()):
+        '''
+        :param angle_stats: An iterable of AngleStat objects.
+        '''
+        self.strings = []
+        self.seq_lists = []
+        def pooler(pool):
+            ids = {}
+            def pooled(value):
+                if value not in ids:
+                    ids[value] = len(pool)
+                    pool.append(value)
+                return ids[value]
+            return pooled
+        pooled_string = pooler(self.strings)
+        pooled_seqs = pooler(self.seq_lists)
+
+        rows = []
+        index = c.defaultdict(list)
+        for i, stat in enumerate(angle_stats):
+            define = list(stat.define) + [0] * (4 - len(stat.define))
+            rows.append((pooled_string(stat.pdb_name), stat.dim1, stat.dim2,
+                         stat.u, stat.v, stat.t, stat.r1, stat.u1, stat.v1,
+                         stat.ang_type, define, len(stat.define), pooled_seqs(tuple(stat.seqs))))
+            index[(stat.dim1, stat.dim2, stat.ang_type)].append(i)
+            index[(stat.dim2, stat.dim1, -stat.ang_type)].append(i)
+        self.data = np.array(rows, dtype=self.dtype)
+        #: key: array of rows in self.data, for the keys that were never assigned
+        self._index = { key: np.array(val, dtype=np.intp) for key, val in index.items() }
+        #: key: list of AngleStats, for assigned keys
+        self._assigned = {}
+        self._stats = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_stats"] = {}
+        return state
+
+    def stat(self, row):
+        '''
+        The AngleStat stored in the given row of self.data.
+
+        Every AngleStat is only created once.
+        '''
+        row = int(row)
+        try:
+            return self._stats[row]
+        except KeyError:
+            pass
+        record = self.data[row]
+        stat = AngleStat(self.strings[record["pdb_name"]], int(record["dim1"]), int(record["dim2"]),
+                         float(record["u"]), float(record["v"]), float(record["t"]),
+                         float(record["r1"]), float(record["u1"]), float(record["v1"]),
+                         int(record["ang_type"]),
+                         [ int(d) for d in record["define"][:record["define_len"]] ],
+                         list(self.seq_lists[record["seqs"]]))
+        self._stats[row] = stat
+        return stat
+
+    def __getitem__(self, key):
+        """
+        Like for a defaultdict, an empty list is inserted and returned for missing keys.
+        """
+        try:
+            return self._assigned[key]
+        except KeyError:
+            pass
+        if key in self._index:
+            return AngleStatList(self, self._index[key])
+        self._assigned[key] = []
+        return self._assigned[key]
+
+    def __setitem__(self, key, angle_stats):
+        self._index.pop(key, None)
+        self._assigned[key] = angle_stats
+
+    def __delitem__(self, key):
+        if key in self._assigned:
+            del self._assigned[key]
+        else:
+            del self._index[key]
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __contains__(self, key):
+        return key in self._index or key in self._assigned
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._index) + len(self._assigned)
+
+    def keys(self):
+        return list(self._index.keys()) + list(self._assigned.keys())
+
+    def values(self):
+        return [ self[key] for key in self.keys() ]
+
+    def items(self):
+        return [ (key, self[key]) for key in self.keys() ]
+
+def _angle_stat_params(angle_stats):
+    '''
+    :param angle_stats: An AngleStatList or a list of AngleStats
+    :returns: An array of shape N x 6, with the columns u, v, t, r1, u1, v1
+    '''
+    if isinstance(angle_stats, AngleStatList):
+        return angle_stats.params()
+    return np.array([ [d.u, d.v, d.t, d.r1, d.u1, d.v1] for d in angle_stats ])
+
 class RandomAngleStats():
     '''
     Store all of the angle stats.
@@ -348,10 +567,7 @@ class RandomAngleStats():
         import scipy.stats as ss
         for key1,key2,key3 in list(discrete_angle_stats.keys()):
             dims = (key1, key2, key3)
-            data = []
-
-            for d in discrete_angle_stats[(key1,key2,key3)]:
-                data += [[d.u, d.v, d.t, d.r1, d.u1, d.v1]]
+            data = _angle_stat_params(discrete_angle_stats[(key1,key2,key3)])
 
             '''
             if len(data) < 3:
@@ -359,7 +575,7 @@ class RandomAngleStats():
             '''
 
             try:
-                self.cont_stats[dims] = self.create_random_function(np.array(data))
+                self.cont_stats[dims] = self.create_random_function(data)
             except np.linalg.LinAlgError as lae:
                 print("Singular matrix, dimensions:", dims, file=sys.stderr)
 
@@ -411,10 +627,7 @@ class ContinuousAngleStats():
         import scipy.stats as ss
         for key1,key2,key3 in list(discrete_angle_stats.keys()):
             dims = (key1, key2, key3)
-            data = []
-
-            for d in discrete_angle_stats[(key1,key2,key3)]:
-                data += [[d.u, d.v, d.t, d.r1, d.u1, d.v1]]
+            data = _angle_stat_params(discrete_angle_stats[(key1,key2,key3)])
 
             '''
             if len(data) < 2:
@@ -425,7 +638,7 @@ class ContinuousAngleStats():
                 continue
 
             try:
-                self.cont_stats[dims] = ss.gaussian_kde(np.array(data).T)
+                self.cont_stats[dims] = ss.gaussian_kde(data.T)
             except np.linalg.LinAlgError as lae:
                 print("Singular matrix, dimensions:", dims, file=sys.stderr)
 
@@ -462,6 +675,133 @@ class ConstructionStats:
     conf_stats = None
 
 
+#: Bump this, whenever the pickled representation of the stats tables changes.
+STATS_CACHE_VERSION = 4
+
+#: Absolute filename: (cache key, dictionary table name: pickled table) for the stats files
+#: loaded by this process. Every table is pickled separately, so it is unpickled only when
+#: it is needed and callers never share (and modify) the same table object.
+_pickled_stats_tables = {}
+
+def read_stats_file(filename):
+    '''
+    Read all statistics from a stats file in a single pass.
+
+    The tables are the same as the ones returned by get_angle_stats,
+    get_stem_stats, get_fiveprime_stats, get_threeprime_stats and get_loop_stats.
+
+    :param filename: The name of the stats file.
+    :returns: A dictionary with the keys "angle", "stem", "5prime", "3prime"
+              and "loop". The angle stats are stored in an AngleStatTable,
+              all other stats in defaultdicts.
+    '''
+    tables = { key: c.defaultdict(list) for key in ["stem", "5prime", "3prime", "loop"] }
+    angle_stats = []
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('angle'):
+                angle_stat = AngleStat()
+                angle_stat.parse_line(line)
+                if len(angle_stat.define) > 0 and angle_stat.define[0] == 1:
+                    continue
+                angle_stats.append(angle_stat)
+            elif line.startswith('stem'):
+                stem_stat = StemStat(line)
+                tables["stem"][(stem_stat.bp_length, stem_stat.bp_length)].append(stem_stat)
+            else:
+                for key in ["5prime", "3prime", "loop"]:
+                    if line.startswith(key):
+                        loop_stat = LoopStat(line)
+                        tables[key][loop_stat.bp_length].append(loop_stat)
+                        break
+    tables["angle"] = AngleStatTable(angle_stats)
+    return tables
+
+def _stats_cache_filename(filename, cache_dir):
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, "{}.py{}.stats_cache".format(path_hash, sys.version_info[0]))
+
+def _stats_cache_key(filename):
+    stat = os.stat(filename)
+    return (STATS_CACHE_VERSION, os.path.abspath(filename), stat.st_size, stat.st_mtime)
+
+def _read_stats_cache(cache_filename, key):
+    """
+    :returns: The cached tables or None, if the cache does not exist or is stale.
+    """
+    try:
+        with open(cache_filename, "rb") as f:
+            if pickle.load(f) != key:
+                return None
+            return pickle.load(f)
+    except Exception as e:
+        if os.path.exists(cache_filename):
+            log.info("Ignoring unreadable stats cache %s: %s", cache_filename, e)
+        return None
+
+def _write_stats_cache(cache_filename, key, tables):
+    """
+    Write the cache to a temporary file first and move it into place afterwards,
+    so concurrently starting processes never see a half-written cache.
+    """
+    try:
+        cache_dir = os.path.dirname(cache_filename)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+            pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(f.name, cache_filename)
+    except (IOError, OSError) as e:
+        log.info("Could not write stats cache %s: %s", cache_filename, e)
+
+def _load_pickled_stats_tables(filename):
+    '''
+    :returns: A dictionary table name: pickled table, see _pickled_stats_tables
+    '''
+    key = _stats_cache_key(filename)
+    memo = _pickled_stats_tables.get(key[1])
+    if memo is not None and memo[0] == key:
+        return memo[1]
+    cache_dir = cbc.Configuration.stats_cache_dir
+    pickled_tables = None
+    if cache_dir is not None:
+        cache_filename = _stats_cache_filename(filename, cache_dir)
+        pickled_tables = _read_stats_cache(cache_filename, key)
+    if pickled_tables is None:
+        pickled_tables = { name: pickle.dumps(table, pickle.HIGHEST_PROTOCOL)
+                           for name, table in read_stats_file(filename).items() }
+        if cache_dir is not None:
+            _write_stats_cache(cache_filename, key, pickled_tables)
+    _pickled_stats_tables[key[1]] = (key, pickled_tables)
+    return pickled_tables
+
+def load_stats_tables(filename=cbc.Configuration.stats_file, use_cache=True):
+    '''
+    Like read_stats_file, but parse every stats file only once per process.
+
+    The parsed tables are kept in memory and, if cbc.Configuration.stats_cache_dir
+    is set (it is None by default), in a binary cache in that directory.
+    Both are keyed by the absolute path, size and modification time of the
+    stats file and are renewed, whenever one of them changes.
+    Every call returns new table objects.
+
+    :param filename: The name of the stats file.
+    :param use_cache: If False, always parse the stats file.
+    :returns: See read_stats_file
+    '''
+    if not use_cache:
+        return read_stats_file(filename)
+    return { name: pickle.loads(pickled_table)
+             for name, pickled_table in _load_pickled_stats_tables(filename).items() }
+
+def _load_stats_table(filename, name):
+    '''
+    Like `load_stats_tables(filename)[name]`, but unpickle only the requested table.
+    '''
+    return pickle.loads(_load_pickled_stats_tables(filename)[name])
+
 def get_angle_stats(filename=cbc.Configuration.stats_file, refresh=False):
     '''
     Load the statistics about inter the helix-helix orientations from a file.
@@ -490,44 +830,14 @@ def get_angle_stats(filename=cbc.Configuration.stats_file, refresh=False):
     The azimuth is always defined with respect to the coordinate system defined
     by the stem1 helix axis vector and it's twist vector (the one adjacent to the
     bulge element).
+
+    :returns: An AngleStatTable, which behaves like a dictionary
+              `(dim1, dim2, ang_type)`: list of AngleStats.
     '''
     if ConstructionStats.angle_stats != None and not refresh:
         return ConstructionStats.angle_stats
 
-    '''
-    import pickle
-    ConstructionStats.angle_stats = pickle.load(open('fess/stats/angle_stats.pickle', 'r'))
-
-    print >>sys.stderr, "done loading stats"
-    return ConstructionStats.angle_stats
-
-    '''
-    ConstructionStats.angle_stats = c.defaultdict(list)
-    #DefaultDict(DefaultDict([]))
-
-    f = open(filename, 'r')
-
-    count = 0
-    for line in f:
-        line=line.strip()
-        if line.startswith('angle'):
-            angle_stat = AngleStat()
-            angle_stat.parse_line(line)
-
-            if len(angle_stat.define) > 0 and angle_stat.define[0] == 1:
-                continue
-
-            ConstructionStats.angle_stats[(angle_stat.dim1, angle_stat.dim2, angle_stat.ang_type)] += [angle_stat]
-            ConstructionStats.angle_stats[(angle_stat.dim2, angle_stat.dim1, -angle_stat.ang_type)] += [angle_stat]
-            count += 1
-
-    f.close()
-
-    '''
-    pickle.dump(ConstructionStats.angle_stats, open('fess/stats/angle_stats.pickle','w'))
-    '''
-
-    #print >>sys.stderr, "done loading stats"
+    ConstructionStats.angle_stats = _load_stats_table(filename, "angle")
     return ConstructionStats.angle_stats
 
 def get_angle_stat_dims(s1, s2, angle_type, min_entries=1):
@@ -574,25 +884,9 @@ def get_stem_stats(filename=cbc.Configuration.stats_file, refresh=False):
     if ConstructionStats.stem_stats != None and not refresh:
         return ConstructionStats.stem_stats
 
-    ConstructionStats.stem_stats = c.defaultdict(list)
-
-    f = open(filename, 'r')
-    #print("Opening file", filename)
-    for line in f:
-        if line.strip().find('stem') == 0:
-            stem_stat = StemStat(line)
-            '''
-            if stem_stat.define[0] == 1:
-                continue
-            '''
-
-            ConstructionStats.stem_stats[(stem_stat.bp_length, stem_stat.bp_length)] += [stem_stat]
-
-    f.close()
-
+    ConstructionStats.stem_stats = _load_stats_table(filename, "stem")
     return ConstructionStats.stem_stats
 
-
 def get_fiveprime_stats(filename=cbc.Configuration.stats_file, refresh=False):
     '''
     Load the statistics from the file.
@@ -606,17 +900,7 @@ def get_fiveprime_stats(filename=cbc.Configuration.stats_file, refresh=False):
     if ConstructionStats.fiveprime_stats != None and not refresh:
         return ConstructionStats.fiveprime_stats
 
-    ConstructionStats.fiveprime_stats = c.defaultdict(list)
-
-    f = open(filename, 'r')
-
-    for line in f:
-        if line.strip().find('5prime') == 0:
-            fiveprime_stat = LoopStat(line)
-            ConstructionStats.fiveprime_stats[fiveprime_stat.bp_length] += [fiveprime_stat]
-
-    f.close()
-
+    ConstructionStats.fiveprime_stats = _load_stats_table(filename, "5prime")
     return ConstructionStats.fiveprime_stats
 
 def get_threeprime_stats(filename=cbc.Configuration.stats_file, refresh=False):
@@ -632,17 +916,7 @@ def get_threeprime_stats(filename=cbc.Configuration.stats_file, refresh=False):
     if ConstructionStats.threeprime_stats != None and not refresh:
         return ConstructionStats.threeprime_stats
 
-    ConstructionStats.threeprime_stats = c.defaultdict(list)
-
-    f = open(filename, 'r')
-
-    for line in f:
-        if line.strip().find('3prime') == 0:
-            threeprime_stat = LoopStat(line)
-            ConstructionStats.threeprime_stats[threeprime_stat.bp_length] += [threeprime_stat]
-
-    f.close()
-
+    ConstructionStats.threeprime_stats = _load_stats_table(filename, "3prime")
     return ConstructionStats.threeprime_stats
 
 def get_loop_stats(filename=cbc.Configuration.stats_file, refresh=False):
@@ -658,18 +932,60 @@ def get_loop_stats(filename=cbc.Configuration.stats_file, refresh=False):
     if ConstructionStats.loop_stats != None and not refresh:
         return ConstructionStats.loop_stats
 
-    ConstructionStats.loop_stats = c.defaultdict(list)
+    ConstructionStats.loop_stats = _load_stats_table(filename, "loop")
+    return ConstructionStats.loop_stats
 
-    f = open(filename, 'r')
+class DimensionIndex(object):
+    '''
+    An index over the keys of a stats dictionary, to find the keys closest to
+    the dimensions of an element.
 
-    for line in f:
-        if line.strip().find('loop') == 0:
-            loop_stat = LoopStat(line)
-            ConstructionStats.loop_stats[loop_stat.bp_length] += [loop_stat]
+    Keys are either integers (loop stats) or tuples `(dim1, dim2, ang_type)` (angle stats).
+    '''
+    def __init__(self, keys):
+        keys_by_type = c.defaultdict(list)
+        for key in keys:
+            if isinstance(key, tuple):
+                keys_by_type[key[-1]].append(key)
+            else:
+                keys_by_type[None].append(key)
+        #: ang_type: (list of keys, array of key dimensions)
+        self._keys = {}
+        for ang_type, type_keys in keys_by_type.items():
+            key_dims = np.array([ key[:-1] if isinstance(key, tuple) else (key,) for key in type_keys ],
+                                dtype=float)
+            self._keys[ang_type] = (type_keys, key_dims)
+
+    def nearest(self, dims, ang_type=None):
+        '''
+        Iterate over pairs `(dist, key)` in the order of increasing euclidean distance
+        between dims and the dimensions of the key, with ties broken by the key.
+        This is the order of get_angle_stat_dims and get_one_d_stat_dims.
 
-    f.close()
+        The keys are sorted lazily in chunks of increasing size, so only the
+        keys that are actually consumed have to be sorted.
 
-    return ConstructionStats.loop_stats
+        :param dims: A tuple `(dim1, dim2)` for angle stats or `(dim,)` for loop stats.
+        :param ang_type: The angle type for angle stats or None for loop stats.
+        '''
+        try:
+            keys, key_dims = self._keys[ang_type]
+        except KeyError:
+            return
+        dists = np.sqrt(np.sum((key_dims - np.asarray(dims, dtype=float))**2, axis=1))
+        remaining = np.arange(len(keys))
+        chunk_size = 8
+        while len(remaining):
+            if len(remaining) > chunk_size:
+                remaining_dists = dists[remaining]
+                threshold = np.partition(remaining_dists, chunk_size - 1)[chunk_size - 1]
+                in_chunk = remaining_dists <= threshold
+                chunk, remaining = remaining[in_chunk], remaining[~in_chunk]
+            else:
+                chunk, remaining = remaining, remaining[:0]
+            for dist, key in sorted( (float(dists[i]), keys[i]) for i in chunk ):
+                yield dist, key
+            chunk_size *= 2
 
 class ClusteredAngleStats(object):
     def __init__(self, filename):
@@ -693,6 +1009,7 @@ class ClusteredAngleStats(object):
         #: A dict `(dim1, dim2, ang_type)` : list of lists.
         #: Each value is a list of clusters, and each cluster is a list.
         self._stats_dict = c.defaultdict(list)
+        self._dimension_index = None
         lastkey=None
         with open(filename) as f:
             for line in f:
@@ -715,34 +1032,101 @@ class ClusteredAngleStats(object):
 
                     assert lastkey == (angle_stat.dim1, angle_stat.dim2, angle_stat.ang_type) or lastkey == (angle_stat.dim2, angle_stat.dim1, -angle_stat.ang_type)
                     self._stats_dict[lastkey][-1].append(angle_stat)
+        self._build_indexes()
+
+    def _build_indexes(self):
+        #: `(pdb_name, define, key)`: (cluster index, stat) for the first occurrence of every stat.
+        #: The cluster index is the one of the first cluster containing a stat equal to it.
+        self._cluster_lookup = {}
+        #: key: array of cluster sizes
+        self._cluster_sizes = {}
+        #: key: (all stats of all clusters, start and length of every non-empty cluster)
+        self._representatives = {}
+        for key, clusters in self._stats_dict.items():
+            sizes = np.array([ len(cluster) for cluster in clusters ], dtype=int)
+            starts = np.cumsum(sizes) - sizes
+            self._cluster_sizes[key] = sizes
+            self._representatives[key] = ([ stat for cluster in clusters for stat in cluster ],
+                                          starts[sizes > 0], sizes[sizes > 0])
+            stats = self._representatives[key][0]
+            first_equal = self._first_equal_clusters(stats, np.repeat(np.arange(len(clusters)), sizes))
+            for stat, i in zip(stats, first_equal):
+                self._cluster_lookup.setdefault((stat.pdb_name, tuple(stat.define), key), (int(i), stat))
+
+    @staticmethod
+    def _first_equal_clusters(stats, cluster_indices, chunk_size=256):
+        """
+        For every stat, the index of the first cluster containing a stat equal to it.
+
+        Equality is tested like `stat in cluster`, which calls AngleStat.__eq__
+        of the stat looked up, i.e. np.allclose(stat, member). The relative
+        tolerance is therefore scaled by the parameters of the cluster member.
+
+        :param stats: A list of the stats of all clusters.
+        :param cluster_indices: The cluster index of every stat.
+        """
+        dims = np.array([ (stat.dim1, stat.dim2) for stat in stats ]).reshape((-1, 2))
+        params = np.array([ (stat.u, stat.v, stat.t, stat.r1, stat.u1, stat.v1) for stat in stats ],
+                          dtype=float).reshape((-1, 6))
+        first_equal = np.empty(len(stats), dtype=int)
+        for start in range(0, len(stats), chunk_size):
+            stop = min(start + chunk_size, len(stats))
+            equal = (np.all(dims[start:stop, np.newaxis] == dims[np.newaxis], axis=2) &
+                     np.all(np.abs(params[start:stop, np.newaxis] - params[np.newaxis]) <=
+                            1e-8 + 1e-5 * np.abs(params[np.newaxis]), axis=2))
+            # `in` finds a stat in its own cluster by identity, even if it contains NaNs.
+            equal[np.arange(stop - start), np.arange(start, stop)] = True
+            first_equal[start:stop] = cluster_indices[np.argmax(equal, axis=1)]
+        return first_equal
 
     def __getitem__(self, key):
         """
         Returns a list of stats with only one randomly choosen stat for each cluster.
         """
-        return [ rand.choice(x) for x in self._stats_dict[key] ]
+        try:
+            stats, starts, sizes = self._representatives[key]
+        except KeyError:
+            return []
+        choices = starts + np.minimum((nr.random(len(sizes)) * sizes).astype(int), sizes - 1)
+        return [ stats[i] for i in choices ]
+
     def keys(self):
         return list(self._stats_dict.keys())
 
-    def lookup_stat(self, stat):
-        key = (stat.dim1, stat.dim2, stat.ang_type)
-        clusters = self._stats_dict[key]
-        total_length=sum(len(cluster) for cluster in clusters)
-        cluster_length=-1
-        num_clusters=len(clusters)
-        for cluster in clusters:
-            if stat in cluster:
-                cluster_length=len(cluster)
-                break
-        return cluster_length, total_length, num_clusters
-    def cluster_of(self, stat):
-        key = (stat.dim1, stat.dim2, stat.ang_type)
-        clusters = self._stats_dict[key]
-        for i, cluster in enumerate(clusters):
+    def _find_cluster(self, stat, key):
+        """
+        The index of the first cluster for key containing a stat equal to stat, or -1.
+
+        Stats from the clustered file (or stats with the same pdb_name, define and values)
+        are found in the precomputed lookup table,
+        all other stats by comparing them to all stats for the key.
+        """
+        try:
+            i, candidate = self._cluster_lookup[(stat.pdb_name, tuple(stat.define), key)]
+        except KeyError:
+            pass
+        else:
+            # AngleStat.__eq__ only depends on these values.
+            values = (stat.dim1, stat.dim2, stat.u, stat.v, stat.t, stat.r1, stat.u1, stat.v1)
+            if candidate is stat or (values == (candidate.dim1, candidate.dim2, candidate.u, candidate.v,
+                                                candidate.t, candidate.r1, candidate.u1, candidate.v1)
+                                     and not np.any(np.isnan(values[2:]))):
+                return i
+        for i, cluster in enumerate(self._stats_dict.get(key, [])):
             if stat in cluster:
                 return i
         return -1
 
+    def lookup_stat(self, stat):
+        key = (stat.dim1, stat.dim2, stat.ang_type)
+        sizes = self._cluster_sizes.get(key, np.zeros(0, dtype=int))
+        i = self._find_cluster(stat, key)
+        cluster_length = -1 if i == -1 else int(sizes[i])
+        return cluster_length, int(np.sum(sizes)), len(sizes)
+
+    def cluster_of(self, stat):
+        return self._find_cluster(stat, (stat.dim1, stat.dim2, stat.ang_type))
+
     def get_angle_stat_dims(self, dim0, dim1, ang_type):
         """
         Returns a list of pairs,`(dist, key)` ordered by increasing distance of the key to the query key.
@@ -751,28 +1135,73 @@ class ClusteredAngleStats(object):
         :param dim2: dim2 of the query key
         :param ang_type: angle_type of the query key.
         """
-        available_stats = []
-        for (k1,k2,k3) in list(self.keys()):
-            if k3 == ang_type:
-               dist = m.sqrt((k1 - dim0) ** 2 + (k2 - dim1) ** 2)
-               available_stats += [(dist, (k1,k2,k3))]
+        return list(self.dimension_index.nearest((dim0, dim1), ang_type))
 
-        available_stats.sort()
-        return available_stats
+    @property
+    def dimension_index(self):
+        """
+        A DimensionIndex over the keys.
+        """
+        if self._dimension_index is None:
+            self._dimension_index = DimensionIndex(self.keys())
+        return self._dimension_index
+
+def _stats_table_property(name):
+    """
+    An attribute holding a stats table. Setting it clears the caches of the ConformationStats.
+    """
+    attribute = "_" + name
+    def get_table(self):
+        return getattr(self, attribute)
+    def set_table(self, table):
+        setattr(self, attribute, table)
+        self.clear_caches()
+    return property(get_table, set_table)
 
 class ConformationStats(object):
+    angle_stats = _stats_table_property("angle_stats")
+    stem_stats = _stats_table_property("stem_stats")
+    fiveprime_stats = _stats_table_property("fiveprime_stats")
+    threeprime_stats = _stats_table_property("threeprime_stats")
+    loop_stats = _stats_table_property("loop_stats")
+
     def __init__(self, stats_file=cbc.Configuration.stats_file, clustered_angle_stats_file=None):
         if clustered_angle_stats_file is None:
-            self.angle_stats = get_angle_stats(stats_file, refresh=True)
+            self.angle_stats = ConstructionStats.angle_stats = _load_stats_table(stats_file, "angle")
         else:
             self.angle_stats = ClusteredAngleStats(clustered_angle_stats_file)
-        self.stem_stats = get_stem_stats(stats_file, refresh=True)
-        self.fiveprime_stats = get_fiveprime_stats(stats_file, refresh=True)
-        self.threeprime_stats = get_threeprime_stats(stats_file, refresh=True)
-        self.loop_stats = get_loop_stats(stats_file, refresh=True)
+        self.stem_stats = ConstructionStats.stem_stats = _load_stats_table(stats_file, "stem")
+        self.fiveprime_stats = ConstructionStats.fiveprime_stats = _load_stats_table(stats_file, "5prime")
+        self.threeprime_stats = ConstructionStats.threeprime_stats = _load_stats_table(stats_file, "3prime")
+        self.loop_stats = ConstructionStats.loop_stats = _load_stats_table(stats_file, "loop")
 
         self.constrained_stats = c.defaultdict(list)
 
+    def clear_caches(self):
+        """
+        Forget the indexes and memoized results of sample_stats.
+
+        This happens automatically, whenever one of the stats tables is
+        reassigned, but has to be called after modifying a table in place.
+        """
+        #: id(stats): (stats, DimensionIndex)
+        self._dimension_indexes = {}
+        #: (table name, dims, ang_type, min_entries): tuple of stats
+        self._sampled = {}
+
+    def _dimension_index(self, stats):
+        try:
+            indexed_stats, index = self._dimension_indexes[id(stats)]
+        except KeyError:
+            indexed_stats = None
+        if indexed_stats is not stats:
+            if isinstance(stats, ClusteredAngleStats):
+                index = stats.dimension_index
+            else:
+                index = DimensionIndex(stats.keys())
+            self._dimension_indexes[id(stats)] = (stats, index)
+        return index
+
     def constrain_stats(self, constraint_file):
         '''
         Constrain the statistics for certain regions of the molecule. This 
@@ -789,6 +1218,10 @@ class ConformationStats(object):
         '''
         Return a set of statistics compatible with this element.
 
+        The results for loops and angles are memoized per element dimensions
+        (see clear_caches) and copied on every call, so the returned list
+        can be modified by the caller.
+
         :param bg: The graph representation we're using.
         :param elem: The name of the element
         :return: A list of compatible statistics
@@ -806,39 +1239,44 @@ class ConformationStats(object):
             else:
                 raise LookupError("No stats for element {} with dimensions {}. Stats keys are {}".format(elem, dims[0], sorted(stats.keys())))
         elif elem[0] == 'i' or elem[0] == 'm':
+            table = "angle_stats"
             stats = self.angle_stats
 
             ang_type = bg.get_angle_type(elem)
             try:
-                if isinstance(stats, ClusteredAngleStats):
-                    dims = stats.get_angle_stat_dims(dims[0], dims[1], ang_type)
-                else: # assert isinstance(stats, defaultdict)
-                    dims = get_angle_stat_dims(dims[0], dims[1], 
-                                               ang_type, min_entries=min_entries)
+                dims = (dims[0], dims[1])
             except IndexError:
                 print("Error in sample_stats:", file=sys.stderr)
                 print("elem:", elem, "dims:", dims, "ang_type:", ang_type, file=sys.stderr)
                 raise
         elif elem[0] == 'h':
-            dims = dims[0]
+            dims = (dims[0],)
+            table = "loop_stats"
             stats = self.loop_stats
-            dims = get_one_d_stat_dims(dims, stats)
+            ang_type = None
         elif elem[0] == 't':
-            dims = dims[0]
+            dims = (dims[0],)
+            table = "threeprime_stats"
             stats = self.threeprime_stats
-            dims = get_one_d_stat_dims(dims, stats)
-
+            ang_type = None
         elif elem[0] == 'f':
-            dims = dims[0]
+            dims = (dims[0],)
+            table = "fiveprime_stats"
             stats = self.fiveprime_stats
-            dims = get_one_d_stat_dims(dims, stats)
+            ang_type = None
+
+        # Clustered stats return a different representative per cluster every time.
+        memoize = not isinstance(stats, ClusteredAngleStats)
+        memo_key = (table, dims, ang_type, min_entries)
+        if memoize and memo_key in self._sampled:
+            return list(self._sampled[memo_key])
 
         all_stats = []
-        for dim in dims:
+        for dist, key in self._dimension_index(stats).nearest(dims, ang_type):
             if len(all_stats) > min_entries:
-                continue
+                break
 
-            all_stats += stats[dim[-1]]
+            all_stats += stats[key]
 
         if len(all_stats) == 0:
             msg = "No statistics for bulge {} with dims {}".format(elem, dims)
@@ -846,7 +1284,8 @@ class ConformationStats(object):
                 msg+=" and ang_type {}".format(ang_type)
             raise LookupError(msg)
 
-
+        if memoize:
+            self._sampled[memo_key] = tuple(all_stats)
         return all_stats
 
 class FilteredConformationStats(ConformationStats):
@@ -0,0 +1,165 @@
+"""
+Read-only tables of (average) atom positions in a compact binary format.
+
+A table consists of two files with a common basename:
+`<basename>.npy` contains one float32 row `(x, y, z)` per position and
+`<basename>.index` contains one identifier per line, in the same order.
+Identifiers consist of space separated fields, e.g. `"0 A C1*"`.
+
+The files are only read, when the table is accessed for the first time,
+and the positions are memory-mapped.
+"""
+
+from __future__ import print_function, division
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import os
+
+import numpy as np
+
+__all__ = ["AtomPositionTable", "write_atom_position_table"]
+
+class AtomPositionTable(object):
+    def __init__(self, basename, missing_message=None):
+        """
+        A read-only mapping from identifiers to positions (arrays of 3 floats).
+
+        :param basename: The filename of the table without the extensions ".npy" and ".index"
+        :param missing_message: The message of the IOError raised on first access,
+                                if the files of the table do not exist.
+        """
+        self.basename = basename
+        self.missing_message = missing_message
+        self._positions = None
+        self._rows = None
+        self._children = None
+
+    def exists(self):
+        """
+        Whether the files of the table exist.
+        """
+        return os.path.exists(self.basename + ".npy") and os.path.exists(self.basename + ".index")
+
+    def _load(self):
+        if self._rows is None:
+            if self.missing_message is not None and not self.exists():
+                raise IOError(self.missing_message)
+            positions = np.load(self.basename + ".npy", mmap_mode="r")
+            with open(self.basename + ".index") as f:
+                identifiers = f.read().splitlines()
+            if positions.shape != (len(identifiers), 3):
+                raise ValueError("The atom position table {} is corrupt: {} identifiers but positions "
+                                 "of shape {}".format(self.basename, len(identifiers), positions.shape))
+            self._positions = positions
+            self._rows = { identifier: row for row, identifier in enumerate(identifiers) }
+        return self._rows
+
+    def __getitem__(self, identifier):
+        row = self._load()[identifier]
+        return np.array(self._positions[row], dtype=float)
+
+    def get(self, identifier, default=None):
+        try:
+            return self[identifier]
+        except KeyError:
+            return default
+
+    def __contains__(self, identifier):
+        return identifier in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def keys(self):
+        return list(self._load().keys())
+
+    def items(self):
+        return [ (identifier, self[identifier]) for identifier in self._load() ]
+
+    def _child_fields(self):
+        """
+        A dictionary prefix: list of the following fields, for all prefixes
+        of the identifiers that end with a space (including the empty prefix).
+        """
+        if self._children is None:
+            children = {}
+            known = set()
+            for identifier in sorted(self._load()):
+                fields = identifier.split(" ")
+                for level in range(len(fields)):
+                    prefix = "".join(field + " " for field in fields[:level])
+                    children.setdefault(prefix, [])
+                    if (prefix, fields[level]) not in known:
+                        known.add((prefix, fields[level]))
+                        children[prefix].append(fields[level])
+            self._children = children
+        return self._children
+
+    def nested(self, key_types, fields=()):
+        """
+        A view of the table as nested mapping, where every level corresponds to
+        one field of the identifiers.
+
+        E.g. `table.nested([int, str, str])[0]["A"]["C1*"] == table["0 A C1*"]`
+        and `table.nested([str, str], [0])["A"]["C1*"] == table["0 A C1*"]`
+
+        Creating the view does not read the table.
+
+        :param key_types: For every (remaining) field of the identifiers, the type of
+                          the keys at the corresponding level.
+        :param fields: The leading fields of the identifiers in the view.
+        """
+        return _NestedView(self, "".join("{} ".format(field) for field in fields), list(key_types))
+
+class _NestedView(object):
+    def __init__(self, table, prefix, key_types):
+        self._table = table
+        self._prefix = prefix
+        self._key_types = key_types
+
+    def __getitem__(self, key):
+        if len(self._key_types) == 1:
+            return self._table[self._prefix + str(key)]
+        prefix = "{}{} ".format(self._prefix, key)
+        if prefix not in self._table._child_fields():
+            raise KeyError(key)
+        return _NestedView(self._table, prefix, self._key_types[1:])
+
+    def __contains__(self, key):
+        if len(self._key_types) == 1:
+            return self._prefix + str(key) in self._table
+        return "{}{} ".format(self._prefix, key) in self._table._child_fields()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._table._child_fields().get(self._prefix, []))
+
+    def keys(self):
+        key_type = self._key_types[0]
+        return [ key_type(field) for field in self._table._child_fields().get(self._prefix, []) ]
+
+    def items(self):
+        return [ (key, self[key]) for key in self.keys() ]
+
+def write_atom_position_table(basename, positions):
+    """
+    Write a table readable by AtomPositionTable.
+
+    :param basename: The filename without the extensions ".npy" and ".index"
+    :param positions: A dictionary identifier: position (3 floats).
+                      Identifiers must not contain newlines.
+    """
+    identifiers = sorted(positions.keys())
+    table = np.array([ positions[identifier] for identifier in identifiers ],
+                     dtype=np.float32).reshape((-1, 3))
+    np.save(basename + ".npy", table)
+    with open(basename + ".index", "w") as f:
+        for identifier in identifiers:
+            f.write(str(identifier) + "\n")
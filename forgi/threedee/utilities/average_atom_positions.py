@@ -0,0 +1,19 @@
+"""
+The average positions of the atoms in loop residues, relative to the element's coordinate system.
+
+`avg_atom_poss[identifier]` is an array of 3 coordinates, where the identifier is
+`"<element type> <dimensions> <connection type> <residue index> <atom name>"`,
+e.g. `avg_atom_poss["h 9 -1 0 7 C4'"]`.
+
+The positions are stored in the data file
+forgi/threedee/data/average_atom_positions.npy/.index
+(see forgi.threedee.utilities.atom_position_table), which is read on first access.
+It is created with `examples/average_atom_positions.py`.
+"""
+import forgi
+import forgi.threedee.utilities.atom_position_table as ftuat
+
+_basename = forgi.data_file("threedee/data/average_atom_positions")
+avg_atom_poss = ftuat.AtomPositionTable(_basename,
+        "The average atom positions for loops ({}.npy/.index) are not installed. "
+        "Create them with examples/average_atom_positions.py.".format(_basename))
@@ -1,235 +1,15 @@
-import collections as co
-avg_stem_vres_atom_coords = [co.defaultdict(dict), co.defaultdict(dict)]
+"""
+The average positions of the atoms in stem residues, relative to the virtual residue.
 
-avg_stem_vres_atom_coords[0]['A']['C1*'] = [2.12270781518,6.58104298144,-4.83654584851]
-avg_stem_vres_atom_coords[0]['A']['C3*'] = [4.25852091724,6.53821364579,-5.54487863872]
-avg_stem_vres_atom_coords[0]['A']["C3'"] = [-8.49620567226,-4.51396459456,-4.99013420271]
-avg_stem_vres_atom_coords[0]['A']["C5'"] = [-8.6020840789,-4.81968850321,-5.28179289442]
-avg_stem_vres_atom_coords[0]['A']['O6'] = [-12.1596410248,-7.65636193484,-4.3675011811]
-avg_stem_vres_atom_coords[0]['A']['O4'] = [-9.92100150742,-5.72336527525,-0.0670873552605]
-avg_stem_vres_atom_coords[0]['A']['O2'] = [-8.66253203604,-5.70001150147,-2.92007580792]
-avg_stem_vres_atom_coords[0]['A']['O4*'] = [2.15584329611,6.22028587462,-6.16448477314]
-avg_stem_vres_atom_coords[0]['A']['C5*'] = [3.72627902152,5.43852668461,-7.66598995504]
-avg_stem_vres_atom_coords[0]['A']['C8'] = [1.66418085844,4.03011360742,-4.43745510485]
-avg_stem_vres_atom_coords[0]['A']['C4*'] = [3.40483987776,6.46222658875,-6.7069277957]
-avg_stem_vres_atom_coords[0]['A']['C2'] = [0.202085635147,5.78326181632,-1.02085961272]
-avg_stem_vres_atom_coords[0]['A']['C6'] = [0.246994641316,3.67638619415,-1.33056256794]
-avg_stem_vres_atom_coords[0]['A']['C5'] = [0.762712841136,3.91937857035,-2.54299219015]
-avg_stem_vres_atom_coords[0]['A']['C4'] = [0.946206234754,5.14175901957,-2.86630381261]
-avg_stem_vres_atom_coords[0]['A']['P'] = [3.39873385852,2.79420828587,-7.93175536817]
-avg_stem_vres_atom_coords[0]['A']["C4'"] = [-8.74331858884,-4.62233114443,-5.17364256466]
-avg_stem_vres_atom_coords[0]['A']['C2*'] = [3.40770469098,7.17742740167,-4.55362140207]
-avg_stem_vres_atom_coords[0]['A']['N1'] = [-0.0282168423228,4.6496678905,-0.577058925934]
-avg_stem_vres_atom_coords[0]['A']['N2'] = [-12.2281041246,-7.70777944268,-4.76981503622]
-avg_stem_vres_atom_coords[0]['A']['N3'] = [0.68325266157,6.12942645594,-2.14053624198]
-avg_stem_vres_atom_coords[0]['A']['N4'] = [-7.12642932632,-5.73928535645,-5.81849063264]
-avg_stem_vres_atom_coords[0]['A']['N6'] = [0.219211619577,2.72959319623,-0.839476924855]
-avg_stem_vres_atom_coords[0]['A']['N7'] = [1.25961700589,3.26033188038,-3.54273082823]
-avg_stem_vres_atom_coords[0]['A']['O5*'] = [3.67591489148,4.29978093203,-7.22968290287]
-avg_stem_vres_atom_coords[0]['A']['N9'] = [1.57082746051,5.2626935351,-4.09420000102]
-avg_stem_vres_atom_coords[0]['A']["O5'"] = [-8.55661917819,-5.00814871036,-5.17065748704]
-avg_stem_vres_atom_coords[0]['A']['O3*'] = [5.38385458559,7.25247120146,-5.80790219811]
-avg_stem_vres_atom_coords[0]['A']["O3'"] = [-8.21035119147,-4.36208367634,-5.06852769779]
-avg_stem_vres_atom_coords[0]['C']['C1*'] = [2.09478019318,6.57414575332,-4.8458906993]
-avg_stem_vres_atom_coords[0]['C']['C3*'] = [4.23356487518,6.53220950341,-5.57241673802]
-avg_stem_vres_atom_coords[0]['C']["C3'"] = [-9.68270654802,-1.29411990433,-4.47303719224]
-avg_stem_vres_atom_coords[0]['C']["C5'"] = [-9.82407532334,-1.60752740698,-4.81424141383]
-avg_stem_vres_atom_coords[0]['C']['O6'] = [-13.7046000587,-3.12025075208,-3.7594356012]
-avg_stem_vres_atom_coords[0]['C']['O4'] = [-11.8682971172,-4.5401296108,-3.94354756687]
-avg_stem_vres_atom_coords[0]['C']['O2'] = [0.869587989444,6.56897806885,-2.39990266557]
-avg_stem_vres_atom_coords[0]['C']['O4*'] = [2.11559815358,6.17637380955,-6.16604723921]
-avg_stem_vres_atom_coords[0]['C']['C5*'] = [3.6880643738,5.41190310123,-7.68369413803]
-avg_stem_vres_atom_coords[0]['C']['C8'] = [-12.5255728195,-3.60937888594,-3.79994039765]
-avg_stem_vres_atom_coords[0]['C']['C4*'] = [3.3604623143,6.44182014066,-6.72232559651]
-avg_stem_vres_atom_coords[0]['C']['C2'] = [0.655962054472,5.26669390019,-2.83671918869]
-avg_stem_vres_atom_coords[0]['C']['C6'] = [1.27663729384,3.93580677675,-4.50454104834]
-avg_stem_vres_atom_coords[0]['C']['C5'] = [0.968330236945,2.95326766593,-3.82327585441]
-avg_stem_vres_atom_coords[0]['C']['C4'] = [0.485374866561,3.15718721024,-2.59909553041]
-avg_stem_vres_atom_coords[0]['C']['N9'] = [-12.5320627471,-3.57538879531,-3.89615705201]
-avg_stem_vres_atom_coords[0]['C']["C4'"] = [-9.94936536666,-1.38661053401,-4.7061995322]
-avg_stem_vres_atom_coords[0]['C']['C2*'] = [3.388137301,7.18643971867,-4.57895568687]
-avg_stem_vres_atom_coords[0]['C']['N1'] = [1.13147185655,5.09155457428,-4.03921579694]
-avg_stem_vres_atom_coords[0]['C']['N2'] = [-13.7322001823,-3.07964885408,-4.17402373486]
-avg_stem_vres_atom_coords[0]['C']['N3'] = [0.340740844705,4.28024742408,-2.13586863654]
-avg_stem_vres_atom_coords[0]['C']['N4'] = [0.584832235094,2.41311383969,-1.80607828649]
-avg_stem_vres_atom_coords[0]['C']['N6'] = [-11.4199163437,-3.98346810295,-3.44721270891]
-avg_stem_vres_atom_coords[0]['C']['N7'] = [-12.5845357542,-3.584789428,-3.72174481443]
-avg_stem_vres_atom_coords[0]['C']['O5*'] = [3.67362964483,4.26192452217,-7.24303027737]
-avg_stem_vres_atom_coords[0]['C']['P'] = [3.11476098642,2.74785713035,-7.87022331234]
-avg_stem_vres_atom_coords[0]['C']["O5'"] = [-9.80816622606,-1.79464613036,-4.68352685647]
-avg_stem_vres_atom_coords[0]['C']['O3*'] = [5.35906869699,7.25587462306,-5.85593908962]
-avg_stem_vres_atom_coords[0]['C']["O3'"] = [-9.33896889303,-1.14045953721,-4.54331876343]
-avg_stem_vres_atom_coords[0]['U']['C1*'] = [2.09136420036,6.40570082144,-4.75129293097]
-avg_stem_vres_atom_coords[0]['U']['C3*'] = [4.17484673244,6.40658871551,-5.4834371547]
-avg_stem_vres_atom_coords[0]['U']["C3'"] = [-9.85463388903,-0.314643954744,-4.03469073882]
-avg_stem_vres_atom_coords[0]['U']["C5'"] = [-10.0502270454,-0.673710660773,-4.3523154211]
-avg_stem_vres_atom_coords[0]['U']['O6'] = [-12.0658054822,-1.18917838801,-2.20293804189]
-avg_stem_vres_atom_coords[0]['U']['O4'] = [0.834737891341,2.27356049299,-1.87774680329]
-avg_stem_vres_atom_coords[0]['U']['O2'] = [0.950217371177,6.40325167363,-2.25211917337]
-avg_stem_vres_atom_coords[0]['U']['O4*'] = [2.1179370902,6.03203325332,-6.05923774154]
-avg_stem_vres_atom_coords[0]['U']['C5*'] = [3.65953555329,5.31663211449,-7.58186051422]
-avg_stem_vres_atom_coords[0]['U']['C8'] = [-13.010707415,-1.72986993495,-3.43107040979]
-avg_stem_vres_atom_coords[0]['U']['C4*'] = [3.32418821052,6.3102670911,-6.61409368329]
-avg_stem_vres_atom_coords[0]['U']['C2'] = [0.958962977074,5.30513160369,-2.74765094203]
-avg_stem_vres_atom_coords[0]['U']['C6'] = [1.64447634545,4.00040528153,-4.45574056065]
-avg_stem_vres_atom_coords[0]['U']['C5'] = [1.37834644025,2.98564015192,-3.82569259076]
-avg_stem_vres_atom_coords[0]['U']['C4'] = [0.868595888518,3.07240487817,-2.57350038699]
-avg_stem_vres_atom_coords[0]['U']['P'] = [3.39358123288,2.87482141993,-7.89984278962]
-avg_stem_vres_atom_coords[0]['U']["C4'"] = [-10.1688112343,-0.441047708723,-4.24305617011]
-avg_stem_vres_atom_coords[0]['U']['C2*'] = [3.34045130583,7.01538532146,-4.48731289388]
-avg_stem_vres_atom_coords[0]['U']['N1'] = [1.45348301386,5.14489558232,-3.9632985381]
-avg_stem_vres_atom_coords[0]['U']['N2'] = [-12.0985130621,-0.929442719657,-2.77541958886]
-avg_stem_vres_atom_coords[0]['U']['N3'] = [0.695156492471,4.24690315799,-2.12542774309]
-avg_stem_vres_atom_coords[0]['U']['N4'] = [-14.5574867625,-0.537518408268,-1.68034966835]
-avg_stem_vres_atom_coords[0]['U']['N6'] = [-14.5375813522,-1.78295669959,-4.6657357479]
-avg_stem_vres_atom_coords[0]['U']['N7'] = [-13.0600635046,-1.66306185186,-3.36066589853]
-avg_stem_vres_atom_coords[0]['U']['O5*'] = [3.63528540454,4.19233199263,-7.18644838588]
-avg_stem_vres_atom_coords[0]['U']['N9'] = [-13.0066824841,-1.70008260133,-3.55272067994]
-avg_stem_vres_atom_coords[0]['U']["O5'"] = [-10.004913128,-0.852071041925,-4.21106380862]
-avg_stem_vres_atom_coords[0]['U']['O3*'] = [5.25185225971,7.13332383598,-5.75078893575]
-avg_stem_vres_atom_coords[0]['U']["O3'"] = [-9.51058523181,-0.164008045428,-4.12461849857]
-avg_stem_vres_atom_coords[0]['G']['C1*'] = [2.07583674796,6.65918035121,-4.82748551882]
-avg_stem_vres_atom_coords[0]['G']['C3*'] = [4.20833217502,6.56129508868,-5.50635857715]
-avg_stem_vres_atom_coords[0]['G']["C3'"] = [-8.47806724006,0.0109240773482,-2.60686674381]
-avg_stem_vres_atom_coords[0]['G']["C5'"] = [-8.66107260513,-0.349529134912,-2.9369515027]
-avg_stem_vres_atom_coords[0]['G']['O6'] = [0.0595279091364,3.17106954567,-0.679587982341]
-avg_stem_vres_atom_coords[0]['G']['O4'] = [-10.4208158898,-2.60859345242,-3.16779802829]
-avg_stem_vres_atom_coords[0]['G']['O2'] = [-10.106522849,-1.56246491298,-1.06928501131]
-avg_stem_vres_atom_coords[0]['G']['O4*'] = [2.13057683253,6.2307787734,-6.1328989503]
-avg_stem_vres_atom_coords[0]['G']['C5*'] = [3.70969453143,5.36624291094,-7.57602483565]
-avg_stem_vres_atom_coords[0]['G']['C8'] = [1.49698624378,4.20659193415,-4.27944862146]
-avg_stem_vres_atom_coords[0]['G']['C4*'] = [3.37952530641,6.43201150202,-6.66821514163]
-avg_stem_vres_atom_coords[0]['G']['C2'] = [-0.0101377324084,6.21225741019,-0.960093723668]
-avg_stem_vres_atom_coords[0]['G']['C6'] = [0.00596712872922,3.99913399395,-1.17344417252]
-avg_stem_vres_atom_coords[0]['G']['C5'] = [0.521501147596,4.21810663839,-2.37765640615]
-avg_stem_vres_atom_coords[0]['G']['C4'] = [0.712300730835,5.39704903345,-2.7345048855]
-avg_stem_vres_atom_coords[0]['G']['P'] = [3.14935192846,2.86926733123,-7.69988675773]
-avg_stem_vres_atom_coords[0]['G']["C4'"] = [-8.76626403925,-0.0968373557376,-2.81791334781]
-avg_stem_vres_atom_coords[0]['G']['C2*'] = [3.35023662141,7.25461693527,-4.55588215645]
-avg_stem_vres_atom_coords[0]['G']['N1'] = [-0.237950268466,5.07270383506,-0.51619934952]
-avg_stem_vres_atom_coords[0]['G']['N2'] = [-0.0164860618128,7.4002596049,-0.15801597536]
-avg_stem_vres_atom_coords[0]['G']['N3'] = [0.471742997266,6.42832797054,-2.079630641]
-avg_stem_vres_atom_coords[0]['G']['N4'] = [-9.92197823241,-0.578691090029,1.20206610701]
-avg_stem_vres_atom_coords[0]['G']['N6'] = [-12.4868387277,-3.95427733532,-1.05271649721]
-avg_stem_vres_atom_coords[0]['G']['N7'] = [1.08535155332,3.5032949672,-3.36718207877]
-avg_stem_vres_atom_coords[0]['G']['O5*'] = [3.61513218109,4.29609218331,-7.19143432177]
-avg_stem_vres_atom_coords[0]['G']['N9'] = [1.4113587403,5.43801852544,-3.97785988372]
-avg_stem_vres_atom_coords[0]['G']["O5'"] = [-8.67207010359,-0.540071269579,-2.85534456927]
-avg_stem_vres_atom_coords[0]['G']['O3*'] = [5.33357657378,7.24641162546,-5.78538021141]
-avg_stem_vres_atom_coords[0]['G']["O3'"] = [-8.12025405377,0.160729592782,-2.68066841331]
-avg_stem_vres_atom_coords[1]['A']['C1*'] = [-2.02184584719,6.71939572581,4.82048375548]
-avg_stem_vres_atom_coords[1]['A']['C3*'] = [-4.17255844535,6.72863688536,5.46315049651]
-avg_stem_vres_atom_coords[1]['A']["C3'"] = [-0.229326671521,-2.15006530946,0.837564271685]
-avg_stem_vres_atom_coords[1]['A']["C5'"] = [-0.0114546741745,-2.46164172881,1.10391598039]
-avg_stem_vres_atom_coords[1]['A']['O6'] = [-0.871108609926,-3.15366595091,0.117966208147]
-avg_stem_vres_atom_coords[1]['A']['O4'] = [5.53957276862,-4.49081841142,-1.03508526675]
-avg_stem_vres_atom_coords[1]['A']['O2'] = [1.09654656488,-3.94587790831,-0.746351771245]
-avg_stem_vres_atom_coords[1]['A']['O4*'] = [-2.09051024147,6.35971703119,6.13377444041]
-avg_stem_vres_atom_coords[1]['A']['C5*'] = [-3.71343944056,5.5773278492,7.55762363037]
-avg_stem_vres_atom_coords[1]['A']['C8'] = [-1.85674853747,4.23633873524,4.31937029557]
-avg_stem_vres_atom_coords[1]['A']['C4*'] = [-3.34559983423,6.61449565917,6.64309411528]
-avg_stem_vres_atom_coords[1]['A']['C2'] = [-0.285774925005,5.95022467001,0.926019287505]
-avg_stem_vres_atom_coords[1]['A']['C6'] = [-0.433574679349,3.85033339415,1.21343055282]
-avg_stem_vres_atom_coords[1]['A']['C5'] = [-0.977749329463,4.11170976788,2.40907395865]
-avg_stem_vres_atom_coords[1]['A']['C4'] = [-1.11776137102,5.33777757765,2.7374049093]
-avg_stem_vres_atom_coords[1]['A']['P'] = [-3.58060019612,3.04919432763,7.67216207436]
-avg_stem_vres_atom_coords[1]['A']["C4'"] = [0.0476914426263,-2.24897022093,1.03341657875]
-avg_stem_vres_atom_coords[1]['A']['C2*'] = [-3.28082171035,7.35339175965,4.51071250542]
-avg_stem_vres_atom_coords[1]['A']['N1'] = [-0.09107689773,4.81102031704,0.47976040031]
-avg_stem_vres_atom_coords[1]['A']['N2'] = [-0.997138901296,-2.87625689855,0.875347377529]
-avg_stem_vres_atom_coords[1]['A']['N3'] = [-0.787771156854,6.31325477536,2.03119035571]
-avg_stem_vres_atom_coords[1]['A']['N4'] = [-4.2863048439,-3.04680958254,-0.961929817634]
-avg_stem_vres_atom_coords[1]['A']['N6'] = [-0.25355811502,2.84133414213,0.79291185348]
-avg_stem_vres_atom_coords[1]['A']['N7'] = [-1.45727108254,3.45324234649,3.43046475194]
-avg_stem_vres_atom_coords[1]['A']['O5*'] = [-3.61504939168,4.47310028467,7.1300579985]
-avg_stem_vres_atom_coords[1]['A']['N9'] = [-1.69713685207,5.46357850837,3.99234938679]
-avg_stem_vres_atom_coords[1]['A']["O5'"] = [-0.00354475879723,-2.5861618337,0.994160578488]
-avg_stem_vres_atom_coords[1]['A']['O3*'] = [-5.28022282525,7.47544318163,5.70815345511]
-avg_stem_vres_atom_coords[1]['A']["O3'"] = [-0.51139066365,-2.08224232288,0.924283065008]
-avg_stem_vres_atom_coords[1]['C']['C1*'] = [-1.95534717748,6.69165516858,4.88018328282]
-avg_stem_vres_atom_coords[1]['C']['C3*'] = [-4.1364616796,6.74715988685,5.48927653144]
-avg_stem_vres_atom_coords[1]['C']["C3'"] = [-2.38704462224,-0.435283850393,2.32760942475]
-avg_stem_vres_atom_coords[1]['C']["C5'"] = [-2.22787722422,-0.764074036042,2.63216921076]
-avg_stem_vres_atom_coords[1]['C']['O6'] = [-1.09693179758,0.121870988307,2.21406402054]
-avg_stem_vres_atom_coords[1]['C']['O4'] = [-1.11974081995,-0.843669037,1.64890910327]
-avg_stem_vres_atom_coords[1]['C']['O2'] = [-0.900009935096,6.63553627743,2.44568222667]
-avg_stem_vres_atom_coords[1]['C']['O4*'] = [-2.05657378845,6.29670733397,6.19159995798]
-avg_stem_vres_atom_coords[1]['C']['C5*'] = [-3.73948566321,5.56247929521,7.60148386408]
-avg_stem_vres_atom_coords[1]['C']['C8'] = [-1.2943869198,-2.07567806709,1.31430678691]
-avg_stem_vres_atom_coords[1]['C']['C4*'] = [-3.32159485449,6.6003344759,6.68703184388]
-avg_stem_vres_atom_coords[1]['C']['C2'] = [-1.11694027894,5.35575314039,2.79512575273]
-avg_stem_vres_atom_coords[1]['C']['C6'] = [-1.90521788521,4.06056931011,4.40341600571]
-avg_stem_vres_atom_coords[1]['C']['C5'] = [-1.61597352024,3.06422330409,3.73207461521]
-avg_stem_vres_atom_coords[1]['C']['C4'] = [-1.0545198672,3.24228972532,2.54440924518]
-avg_stem_vres_atom_coords[1]['C']['P'] = [-3.71047126905,2.94078567116,7.61972691354]
-avg_stem_vres_atom_coords[1]['C']["C4'"] = [-2.15918067281,-0.531387006802,2.53193458587]
-avg_stem_vres_atom_coords[1]['C']['C2*'] = [-3.20706905862,7.36939297606,4.55219161646]
-avg_stem_vres_atom_coords[1]['C']['N1'] = [-1.66825544975,5.20601410122,3.96200483326]
-avg_stem_vres_atom_coords[1]['C']['N2'] = [-1.18781604531,0.48516454557,2.39217724195]
-avg_stem_vres_atom_coords[1]['C']['N3'] = [-0.820079719155,4.35510883721,2.10469867199]
-avg_stem_vres_atom_coords[1]['C']['N4'] = [-0.727015943647,2.43339429076,1.84628728085]
-avg_stem_vres_atom_coords[1]['C']['N6'] = [-1.60792756628,-4.46141295907,0.0733923570627]
-avg_stem_vres_atom_coords[1]['C']['N7'] = [-1.29579469875,-2.06331281109,1.27628386374]
-avg_stem_vres_atom_coords[1]['C']['O5*'] = [-3.67878098975,4.4415800005,7.15086901491]
-avg_stem_vres_atom_coords[1]['C']['N9'] = [-1.32070183793,-2.01214122314,1.37115958922]
-avg_stem_vres_atom_coords[1]['C']["O5'"] = [-2.23293972644,-0.963878491521,2.53557799664]
-avg_stem_vres_atom_coords[1]['C']['O3*'] = [-5.24129055436,7.52783985834,5.72692111918]
-avg_stem_vres_atom_coords[1]['C']["O3'"] = [-2.66540794358,-0.292173692027,2.37642967544]
-avg_stem_vres_atom_coords[1]['U']['C1*'] = [-2.07506286284,6.57465753914,4.74115258382]
-avg_stem_vres_atom_coords[1]['U']['C3*'] = [-4.18189621844,6.58190525091,5.43808070791]
-avg_stem_vres_atom_coords[1]['U']["C3'"] = [-0.0212557304422,-1.9760889145,-0.147410802487]
-avg_stem_vres_atom_coords[1]['U']["C5'"] = [0.188601790313,-2.2287309103,0.0568898084401]
-avg_stem_vres_atom_coords[1]['U']['O6'] = [-0.720463082451,-2.32253011389,-1.04761199432]
-avg_stem_vres_atom_coords[1]['U']['O4'] = [-0.846102085106,2.3800361084,1.83930634575]
-avg_stem_vres_atom_coords[1]['U']['O2'] = [-1.01274322416,6.51759347399,2.21409004236]
-avg_stem_vres_atom_coords[1]['U']['O4*'] = [-2.11504813654,6.21467904066,6.04536339756]
-avg_stem_vres_atom_coords[1]['U']['C5*'] = [-3.68133072202,5.47712521357,7.52830333025]
-avg_stem_vres_atom_coords[1]['U']['C8'] = [0.974101245853,-3.24212754674,-1.47355772665]
-avg_stem_vres_atom_coords[1]['U']['C4*'] = [-3.33845046492,6.48369671514,6.58325961369]
-avg_stem_vres_atom_coords[1]['U']['C2'] = [-1.18916398224,5.3810722064,2.6326254102]
-avg_stem_vres_atom_coords[1]['U']['C6'] = [-1.92394842482,4.09830075343,4.3230930117]
-avg_stem_vres_atom_coords[1]['U']['C5'] = [-1.65147947973,3.07332076455,3.69699745116]
-avg_stem_vres_atom_coords[1]['U']['C4'] = [-1.11270701364,3.14270948115,2.45631722847]
-avg_stem_vres_atom_coords[1]['U']['N9'] = [0.954484152588,-3.21988322629,-1.43152329869]
-avg_stem_vres_atom_coords[1]['U']["C4'"] = [0.215563482118,-2.05938456595,-0.0163137382108]
-avg_stem_vres_atom_coords[1]['U']['C2*'] = [-3.32923910476,7.18652398475,4.45987314939]
-avg_stem_vres_atom_coords[1]['U']['N1'] = [-1.7126591864,5.23756359323,3.83697213438]
-avg_stem_vres_atom_coords[1]['U']['N2'] = [-0.69408599444,-2.39272682376,-0.849755701402]
-avg_stem_vres_atom_coords[1]['U']['N3'] = [-0.919658623594,4.31267939745,2.01420069555]
-avg_stem_vres_atom_coords[1]['U']['N4'] = [-0.695340546574,-2.70603159757,0.857478930558]
-avg_stem_vres_atom_coords[1]['U']['N6'] = [2.49238966702,-3.89149441851,-1.88468592082]
-avg_stem_vres_atom_coords[1]['U']['N7'] = [0.965126723374,-3.21575103139,-1.48746538044]
-avg_stem_vres_atom_coords[1]['U']['O5*'] = [-3.59616135997,4.38156177004,7.13663310874]
-avg_stem_vres_atom_coords[1]['U']['P'] = [-3.57342679215,3.01556314511,7.70111000534]
-avg_stem_vres_atom_coords[1]['U']["O5'"] = [0.178368011593,-2.35380064637,-0.0305976923501]
-avg_stem_vres_atom_coords[1]['U']["O3*"] = [-5.26918257958,7.31758522008,5.69253443021]
-avg_stem_vres_atom_coords[1]['U']["O3'"] = [-0.249282222353,-1.88070864439,-0.077073979247]
-avg_stem_vres_atom_coords[1]['G']['C1*'] = [-2.0558300502,6.84586807802,4.80171646225]
-avg_stem_vres_atom_coords[1]['G']["C3*"] = [-4.21553512502,6.7581120147,5.41497370588]
-avg_stem_vres_atom_coords[1]['G']["C3'"] = [-3.07072356975,-0.326618322975,1.27717971199]
-avg_stem_vres_atom_coords[1]['G']["C5'"] = [-2.95185024707,-0.614671235186,1.55024972097]
-avg_stem_vres_atom_coords[1]['G']['O6'] = [-0.158639150459,3.24612792344,0.671539241808]
-avg_stem_vres_atom_coords[1]['G']['O4'] = [-2.25093528003,-1.85061093117,-0.243370334805]
-avg_stem_vres_atom_coords[1]['G']['O2'] = [-3.2895481063,-1.28539048267,0.672160296686]
-avg_stem_vres_atom_coords[1]['G']['O4*'] = [-2.14010852455,6.43792244907,6.10545261088]
-avg_stem_vres_atom_coords[1]['G']['C5*'] = [-3.76164165775,5.55784832355,7.48856446807]
-avg_stem_vres_atom_coords[1]['G']['C8'] = [-1.81866386825,4.37899823535,4.23700098943]
-avg_stem_vres_atom_coords[1]['G']['C4*'] = [-3.41066407338,6.6318886452,6.6023789448]
-avg_stem_vres_atom_coords[1]['G']['C2'] = [-0.429620280463,6.32853157503,0.917378602555]
-avg_stem_vres_atom_coords[1]['G']['C6'] = [-0.467546022091,4.11172728243,1.15112107176]
-avg_stem_vres_atom_coords[1]['G']['C5'] = [-1.01403150346,4.35631463732,2.34477211042]
-avg_stem_vres_atom_coords[1]['G']['C4'] = [-1.20592587501,5.54678757239,2.68740763655]
-avg_stem_vres_atom_coords[1]['G']['N9'] = [-1.71569905813,5.60773405548,3.92634503222]
-avg_stem_vres_atom_coords[1]['G']["C4'"] = [-2.87891880936,-0.41830553899,1.45630313778]
-avg_stem_vres_atom_coords[1]['G']["C2*"] = [-3.32773161269,7.44327822872,4.49058937015]
-avg_stem_vres_atom_coords[1]['G']['N1'] = [-0.198056840275,5.17572730467,0.488011524092]
-avg_stem_vres_atom_coords[1]['G']['N2'] = [-0.0378395254629,7.47621904542,0.114480003816]
-avg_stem_vres_atom_coords[1]['G']['N3'] = [-0.93990182634,6.56835871014,2.02696730641]
-avg_stem_vres_atom_coords[1]['G']['N4'] = [-3.96635432918,-1.04190013281,1.00704642414]
-avg_stem_vres_atom_coords[1]['G']['N6'] = [-1.27508203762,-2.2604116099,1.34688667395]
-avg_stem_vres_atom_coords[1]['G']['N7'] = [-1.38795610249,3.65412667057,3.3380777742]
-avg_stem_vres_atom_coords[1]['G']['O5*'] = [-3.58347724427,4.51687251733,7.13146921155]
-avg_stem_vres_atom_coords[1]['G']['P'] = [-3.63182718961,3.1108669607,7.61008354]
-avg_stem_vres_atom_coords[1]['G']["O5'"] = [-2.92177486209,-0.763287361786,1.46618905814]
-avg_stem_vres_atom_coords[1]['G']['O3*'] = [-5.34937573434,7.45451557562,5.65983038868]
-avg_stem_vres_atom_coords[1]['G']["O3'"] = [-3.31296079838,-0.218382731865,1.34505001615]
+`avg_stem_vres_atom_coords[side][residue][atom_name]` is an array of 3 coordinates,
+e.g. `avg_stem_vres_atom_coords[0]['A']['C1*']`.
+
+The positions are stored in the data file
+forgi/threedee/data/average_stem_vres_atom_positions.npy/.index
+(see forgi.threedee.utilities.atom_position_table), which is read on first access.
+"""
+import forgi
+import forgi.threedee.utilities.atom_position_table as ftuat
+
+_positions = ftuat.AtomPositionTable(forgi.data_file("threedee/data/average_stem_vres_atom_positions"))
+avg_stem_vres_atom_coords = [ _positions.nested([str, str], [side]) for side in range(2) ]
@@ -20,6 +20,7 @@ import math
 
 import logging
 log = logging.getLogger(__name__)
+import forgi.threedee.utilities.average_atom_positions as ftua
 import forgi.threedee.utilities.average_stem_vres_atom_positions as ftus
 import forgi.utilities.debug as fud
 import forgi.threedee.utilities.my_math as ftum
@@ -38,8 +39,6 @@ try:
 except:
   def profile(x):
     return x
-else:
-  import forgi.threedee.utilities.average_atom_positions as ftua #Takes forever if executed within a decorated method.
 
 def stem_stem_orientation(cg, s1, s2):
     '''
@@ -885,6 +884,70 @@ def virtual_res_3d_pos_core(coords, twists, i, stem_len, stem_inv=None):
             u * m.cos(ang + ang_offset) + v * m.sin(ang + ang_offset),
             u * m.cos(ang - ang_offset) + v * m.sin(ang - ang_offset))
 
+def virtual_res_3d_pos_array(coords, twists, i, stem_len, stem_inv):
+    '''
+    The vectorized version of `virtual_res_3d_pos_core`.
+
+    Every row of the input arrays describes one virtual residue, so
+    the coordinates, twists and inverse basis of a stem are repeated
+    for each of its virtual residues.
+
+    :param coords: An Nx2x3 array with the start and end of the stem.
+    :param twists: An Nx2x3 array with the twists of the stem.
+    :param i: An array of length N with the position of the virtual residue in the stem.
+    :param stem_len: An array of length N with the length of the stem.
+    :param stem_inv: An Nx3x3 array with the inverse of the transposed stem basis.
+    :return: An Nx4x3 array. For each virtual residue the point on the stem axis,
+             followed by the vector pointing towards the residue and the
+             vectors pointing to the left and right.
+    '''
+    i = np.asarray(i, dtype=float)
+    stem_len = np.asarray(stem_len)
+    single = (stem_len == 1)
+    # The divisor is irrelevant for stems of length 1. Avoid division by 0.
+    divisor = np.where(single, 1., stem_len - 1.)
+
+    stem_vec = coords[:, 1] - coords[:, 0]
+    vres_stem_pos = coords[:, 0] + np.where(single, 0., i / divisor)[:, np.newaxis] * stem_vec
+
+    # the angle of the second twist with respect to the first
+    t2 = np.einsum('nij,nj->ni', stem_inv, twists[:, 1])
+    ang = np.arctan2(t2[:, 2], t2[:, 1])
+    ang = np.where(ang < 0, ang + 2 * m.pi, ang)
+
+    # calculated from an ideal length 30 helix
+    average_ang_per_nt = 0.636738030735
+    expected_ang = (stem_len - 1) * average_ang_per_nt
+    expected_dev = np.array(expected_ang, dtype=float)
+    # Repeated subtraction (like in virtual_res_3d_pos_core) for identical rounding.
+    too_large = (expected_dev - (2 * m.pi) > 0)
+    while np.any(too_large):
+        expected_dev[too_large] -= 2 * m.pi
+        too_large = (expected_dev - (2 * m.pi) > 0)
+
+    smaller = ang < expected_dev
+    forward = np.where(smaller, 2 * m.pi + ang - expected_dev, ang - expected_dev)
+    backward = np.where(smaller, expected_dev - ang, 2 * m.pi + expected_dev - ang)
+    ang = np.where(forward < backward, expected_ang + forward, expected_ang - backward)
+    ang = np.where(single, 0., (ang / divisor) * i)
+
+    # the basis vectors for the helix along which the
+    # virtual residues will residue
+    u = twists[:, 0]
+    v = np.cross(stem_vec, twists[:, 0])
+    v_mag = np.sqrt(np.einsum('ij,ij->i', v, v))
+    if np.any(v_mag == 0):
+        raise ValueError("Cannot normalize zero- vector!")
+    v = v / v_mag[:, np.newaxis]
+
+    ang_offset = 0.9
+    out = np.empty((len(i), 4, 3))
+    out[:, 0] = vres_stem_pos
+    # equation for a circle in 3-space
+    for j, offset in enumerate([0, ang_offset, -ang_offset]):
+        out[:, j + 1] = (u * np.cos(ang + offset)[:, np.newaxis] +
+                         v * np.sin(ang + offset)[:, np.newaxis])
+    return out
 
 def virtual_res_3d_pos(bg, stem, i, stem_inv=None, stem_length=None):
     if stem_length is None:
@@ -1106,6 +1169,12 @@ def junction_virtual_atom_distance(bg, bulge):
     return cuv.magnitude(bg.virtual_atoms(pos1)[a1]-bg.virtual_atoms(pos2)[a2])
 
 
+#: The virtual residues of several stems, stored in contiguous arrays.
+#: The i'th virtual residue of stem s is found in row `offsets[s] + i`.
+#: `v3dposs` has the shape Nx4x3 (position, vec, vec_l, vec_r), `bases`
+#: and `invs` have the shape Nx3x3.
+VirtualResidueArrays = col.namedtuple("VirtualResidueArrays", ["offsets", "v3dposs", "bases", "invs"])
+
 def add_virtual_residues(bg, stem):
     '''
     Create all of the virtual residues and the associated
@@ -1119,23 +1188,73 @@ def add_virtual_residues(bg, stem):
     :param bg: The CoarseGrainRNA bulge graph containing the stem
     :param stem: The name of the stem to be included
     '''
-    stem_vec = bg.coords[stem][1] - bg.coords[stem][0]
-    stem_basis = cuv.create_orthonormal_basis(stem_vec, bg.get_twists(stem)[0])
-    stem_inv = nl.inv(stem_basis.transpose())
-
-    bg.bases[stem] = stem_basis
-    bg.stem_invs[stem] = stem_inv
-
-    for i in range(bg.stem_length(stem)):
-        vpos = virtual_res_3d_pos(bg, stem, i, stem_inv=stem_inv)
-        vbasis = virtual_res_basis(bg, stem, i, vec=vpos[1])
-        vinv = nl.inv(vbasis.transpose())
-
-        bg.vposs[stem][i] = vpos[0]
-        bg.vvecs[stem][i] = vpos[1]
-        bg.v3dposs[stem][i] = vpos
-        bg.vbases[stem][i] = vbasis
-        bg.vinvs[stem][i] = vinv
+    add_virtual_residues_batch(bg, [stem])
+
+def add_virtual_residues_batch(bg, stems):
+    '''
+    Create the virtual residues and the associated bases and inverses
+    for all given stems in one go.
+
+    The results are stored in contiguous arrays (`bg.vres_arrays`, see
+    `VirtualResidueArrays`). The entries of the dictionaries `bg.vposs`, `bg.vvecs`,
+    `bg.v3dposs`, `bg.vbases` and `bg.vinvs` are views into these arrays.
+
+    If all stems are already part of `bg.vres_arrays`, a copy of these arrays
+    with the rows of the stems replaced becomes the new `bg.vres_arrays`.
+    The arrays are never modified in place, so values taken from the
+    dictionaries before the recomputation do not change.
+    Otherwise new arrays are created, which replace `bg.vres_arrays` only if
+    they contain all of its stems.
+
+    :param bg: The CoarseGrainRNA
+    :param stems: A list of stem names
+    :returns: The `VirtualResidueArrays` holding the virtual residues of the stems.
+    '''
+    stems = list(stems)
+    lengths = np.array([bg.stem_length(stem) for stem in stems], dtype=int)
+    coords = np.array([bg.coords[stem] for stem in stems], dtype=float).reshape(-1, 2, 3)
+    twists = np.array([bg.get_twists(stem) for stem in stems], dtype=float).reshape(-1, 2, 3)
+
+    stem_vecs = coords[:, 1] - coords[:, 0]
+    stem_bases = cuv.create_orthonormal_bases(stem_vecs, twists[:, 0])
+    stem_invs = nl.inv(stem_bases.transpose(0, 2, 1))
+
+    # One row per virtual residue
+    stem_index = np.repeat(np.arange(len(stems)), lengths)
+    vres_i = np.concatenate([np.arange(l) for l in lengths] + [np.zeros(0, dtype=int)])
+    v3dposs = virtual_res_3d_pos_array(coords[stem_index], twists[stem_index],
+                                       vres_i, lengths[stem_index], stem_invs[stem_index])
+    vbases = cuv.create_orthonormal_bases(stem_vecs[stem_index], v3dposs[:, 1])
+    vinvs = nl.inv(vbases.transpose(0, 2, 1))
+
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(int)
+    old = getattr(bg, "vres_arrays", None)
+    if old is not None and all(stem in old.offsets for stem in stems):
+        arrays = VirtualResidueArrays(dict(old.offsets), old.v3dposs.copy(),
+                                      old.bases.copy(), old.invs.copy())
+        rows = np.concatenate([old.offsets[stem] + np.arange(l)
+                               for stem, l in zip(stems, lengths)] + [np.zeros(0, dtype=int)])
+        arrays.v3dposs[rows] = v3dposs
+        arrays.bases[rows] = vbases
+        arrays.invs[rows] = vinvs
+        bg.vres_arrays = arrays
+    else:
+        arrays = VirtualResidueArrays(dict(zip(stems, starts)), v3dposs, vbases, vinvs)
+        if old is None or all(stem in arrays.offsets for stem in old.offsets):
+            bg.vres_arrays = arrays
+
+    for j, stem in enumerate(stems):
+        bg.bases[stem] = stem_bases[j]
+        bg.stem_invs[stem] = stem_invs[j]
+        start = arrays.offsets[stem]
+        for i in range(lengths[j]):
+            row = start + i
+            bg.vposs[stem][i] = arrays.v3dposs[row, 0]
+            bg.vvecs[stem][i] = arrays.v3dposs[row, 1]
+            bg.v3dposs[stem][i] = tuple(arrays.v3dposs[row])
+            bg.vbases[stem][i] = arrays.bases[row]
+            bg.vinvs[stem][i] = arrays.invs[row]
+    return arrays
 
 
 # TODO: This should probably use pos_to_spos to reduce code duplication.
@@ -1785,14 +1904,11 @@ class VirtualAtomsLookup(object):
         :param position: The position of the residue in the RNA (starting with 1)
         """
         #Find out the stem for which we have to calculate virtual atom positions
-        for key, value in list(self.cg.defines.items()):
-            if len(value)<2:
-                pass #For multiloops of length 0, value is []
-            elif position>=value[0] and position<=value[1]:
-                return self._getitem_for_element(key, position)
-            elif len(value)==4 and position>=value[2] and position<=value[3]:
-                return self._getitem_for_element(key, position)
-        assert False, "No return for pos {}".format(position)
+        try:
+            key = self.cg.get_node_from_residue_num(position)
+        except LookupError:
+            assert False, "No return for pos {}".format(position)
+        return self._getitem_for_element(key, position)
     @profile
     def keys(self):
         k=set()
@@ -1813,7 +1929,6 @@ class VirtualAtomsLookup(object):
         """
         if d[0]=="s":
             return self._getitem_for_stem(d, pos) #Use virtual residues for stems.
-        import forgi.threedee.utilities.average_atom_positions as ftua
         e_coords=dict()
         origin, basis = element_coord_system(self.cg, d)
         if d[0] == 'i' or d[0] == 'm':
@@ -1839,7 +1954,7 @@ class VirtualAtomsLookup(object):
                 if "." in aname:
                     _,_,aname=aname.partition(".")
                 try:
-                    e_coords[aname] = origin + ftuv.change_basis(np.array(ftua.avg_atom_poss[identifier]), ftuv.standard_basis, basis )
+                    e_coords[aname] = origin + ftuv.change_basis(ftua.avg_atom_poss[identifier], ftuv.standard_basis, basis )
                 except KeyError as ke:
                     #warnings.warn("KeyError in virtual_atoms. No coordinates found for: {}".format(ke))
                     pass
@@ -1866,6 +1981,151 @@ class VirtualAtomsLookup(object):
             atoms[aname] = spos_to_pos(self.cg, d, i, spos)
 
         return atoms
+#: The result of `all_virtual_atoms`. All four fields are arrays with one entry per atom.
+VirtualAtoms = col.namedtuple("VirtualAtoms", ["coords", "residues", "atom_names", "elements"])
+
+#: (side, residue, atom_names) -> (atom_names, array of positions in the virtual residue's
+#: coordinate system). Filled on demand by `_stem_vres_atom_table`
+_stem_vres_atom_tables = {}
+
+def _virtual_atom_names(cg, pos, given_atom_names, sidechain, loop=False):
+    """
+    The atom names used for the residue at pos, in the same order as by VirtualAtomsLookup.
+
+    For loops, sidechain atoms are prefixed with the residue type (e.g. "A.N1"),
+    as this is how they are stored in the average atom positions.
+    """
+    if given_atom_names is not None:
+        return given_atom_names
+    if not sidechain:
+        return ftup.nonsidechain_atoms
+    residue = cg.seq[pos-1]
+    if loop:
+        return ftup.nonsidechain_atoms + [ residue+"."+x for x in ftup.side_chain_atoms[residue] ]
+    return ftup.nonsidechain_atoms + ftup.side_chain_atoms[residue]
+
+def _stem_vres_atom_table(side, residue, atom_names):
+    """
+    The average positions of the given atoms relative to a virtual residue,
+    as one array (atom names without duplicates).
+    """
+    key = (side, residue, tuple(atom_names))
+    try:
+        return _stem_vres_atom_tables[key]
+    except KeyError:
+        pass
+    names = []
+    sposs = []
+    for aname in atom_names:
+        if aname in names:
+            continue
+        if "'" in aname:
+            aname_star=aname[:-1]+"*"
+        else:
+            aname_star=aname
+        sposs.append(ftus.avg_stem_vres_atom_coords[side][residue][aname_star])
+        names.append(aname)
+    table = (names, np.array(sposs, dtype=float).reshape((-1, 3)))
+    _stem_vres_atom_tables[key] = table
+    return table
+
+def all_virtual_atoms(cg, given_atom_names=None, sidechain=True, elements=None):
+    '''
+    Get the virtual atoms of the whole molecule (or of some elements) at once.
+
+    The positions are the same as the ones returned by `virtual_atoms`, but
+    instead of one change of basis per atom, every virtual residue (for stems)
+    and every loop element contributes one coordinate system and all atoms are
+    placed with a single stacked matrix product.
+
+    :param cg: The coarse grain structure.
+    :param given_atom_names: A list of atom names or None (use all atoms)
+    :param sidechain: Whether or not to include the sidechain atoms
+                      (only used if given_atom_names is None)
+    :param elements: A list of coarse grain element names or None (all elements).
+                     Every residue is only placed by the element returned by
+                     `cg.get_node_from_residue_num`, like in `virtual_atoms`.
+    :returns: A VirtualAtoms namedtuple with the fields `coords` (a Nx3 array),
+              `residues` (the residue numbers), `atom_names` and `elements`
+              (the names of the coarse grain elements). The atoms are sorted by
+              residue number, the atoms of one residue are in the order of the
+              keys of `virtual_atoms(cg)[residue]`.
+    '''
+    if elements is None:
+        elements = list(cg.defines.keys())
+    origins = []
+    bases = []
+    local_coords = []
+    frame_indices = []
+    residues = []
+    atom_names = []
+    atom_elements = []
+
+    def add_atoms(d, pos, names, sposs):
+        local_coords.append(sposs)
+        frame_indices.append(np.ones(len(names), dtype=int)*(len(origins)-1))
+        residues.append(np.ones(len(names), dtype=int)*pos)
+        atom_names.extend(names)
+        atom_elements.extend([d]*len(names))
+
+    for d in elements:
+        if not cg.defines[d]:
+            continue
+        if d[0] == "s":
+            if d not in cg.v3dposs or not cg.v3dposs[d] or d not in cg.vbases:
+                add_virtual_residues(cg, d)
+            for i in range(cg.stem_length(d)):
+                (vpos, vvec, vvec_l, vvec_r) = cg.v3dposs[d][i]
+                origins.append(vpos + vvec)
+                bases.append(cg.vbases[d][i])
+                for side, pos in enumerate([cg.defines[d][0]+i, cg.defines[d][3]-i]):
+                    if cg.get_node_from_residue_num(pos) != d:
+                        continue
+                    residue = cg.seq[pos-1]
+                    names, sposs = _stem_vres_atom_table(side, residue,
+                                          _virtual_atom_names(cg, pos, given_atom_names, sidechain))
+                    add_atoms(d, pos, names, sposs)
+        else:
+            origin, basis = element_coord_system(cg, d)
+            origins.append(origin)
+            bases.append(basis)
+            if d[0] == 'i' or d[0] == 'm':
+                conn_type = cg.connection_type(d, cg.connections(d))
+            else:
+                conn_type = 0
+            dims = " ".join(map(str, cg.get_node_dimensions(d)))
+            for i, pos in enumerate(cg.define_residue_num_iterator(d)):
+                if cg.get_node_from_residue_num(pos) != d:
+                    # Residues shared by overlapping defines belong to one element only.
+                    continue
+                names = []
+                sposs = []
+                for aname in _virtual_atom_names(cg, pos, given_atom_names, sidechain, loop=True):
+                    identifier = "%s %s %d %d %s" % (d[0], dims, conn_type, i, aname)
+                    if "." in aname:
+                        _,_,aname=aname.partition(".")
+                    if aname in names:
+                        continue
+                    try:
+                        sposs.append(ftua.avg_atom_poss[identifier])
+                    except KeyError:
+                        continue
+                    names.append(aname)
+                add_atoms(d, pos, names, np.array(sposs, dtype=float).reshape((-1, 3)))
+
+    if not atom_names:
+        return VirtualAtoms(np.zeros((0,3)), np.zeros(0, dtype=int),
+                            np.array([], dtype=str), np.array([], dtype=str))
+    local_coords = np.concatenate(local_coords)
+    frame_indices = np.concatenate(frame_indices)
+    residues = np.concatenate(residues)
+    # change_basis(spos, standard_basis, basis) == np.dot(spos, basis) for every atom
+    coords = (np.einsum('ij,ijk->ik', local_coords, np.array(bases)[frame_indices]) +
+              np.array(origins)[frame_indices])
+    order = np.argsort(residues, kind="mergesort") #stable, keeps the atom order.
+    return VirtualAtoms(coords[order], residues[order],
+                        np.array(atom_names)[order], np.array(atom_elements)[order])
+
 """def add_atoms(coords, twists, define, side, seq, new_coords):
     stem_len = define[1] - define[0] + 1
 
@@ -1924,6 +2184,21 @@ def element_distance(cg, l1, l2):
                                        cg.coords[l2][1])
     return ftuv.vec_distance(i1, i2)
 
+def element_distances(cg, elements1, elements2=None):
+    '''
+    The distance between the two closest points of all pairs of elements
+    (like element_distance), calculated in one go.
+
+    :param elements1: A sequence of element names
+    :param elements2: A sequence of element names or None (use elements1)
+    :returns: An array of shape len(elements1) x len(elements2)
+    '''
+    if elements2 is None:
+        elements2 = elements1
+    segs1 = cg.coords[list(elements1)].reshape((-1, 2, 3))
+    segs2 = cg.coords[list(elements2)].reshape((-1, 2, 3))
+    return ftuv.line_segment_distances(segs1, segs2)[0]
+
 def get_basepair_center(cg, pos):
     """
     The center of a basepair, as defined in doi: 10.1261/rna.305307
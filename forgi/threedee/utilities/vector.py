@@ -175,6 +175,38 @@ def create_orthonormal_basis(vec1, vec2=None, vec3=None):
 
     return np.array([vec1, vec2, vec3])
 
+def create_orthonormal_bases(vecs1, vecs2):
+    '''
+    The vectorized version of `create_orthonormal_basis(vec1, vec2)`.
+
+    :param vecs1: An Nx3 array of vectors.
+    :param vecs2: An Nx3 array of vectors. Each of them has to be orthogonal
+                  to the corresponding vector in vecs1.
+    :return: An Nx3x3 array. The i'th entry is the basis created
+             from vecs1[i] and vecs2[i]
+    '''
+    vecs1 = np.asarray(vecs1, dtype=float)
+    vecs2 = np.asarray(vecs2, dtype=float)
+    mags1 = np.sqrt(np.einsum('ij,ij->i', vecs1, vecs1))
+    mags2 = np.sqrt(np.einsum('ij,ij->i', vecs2, vecs2))
+    if np.any(mags1 == 0):
+        raise ZeroDivisionError("vec 1 {} has magnitude 0.".format(vecs1[np.argmin(mags1)]))
+    if np.any(mags2 == 0):
+        raise ZeroDivisionError("vec 2 {} has magnitude 0.".format(vecs2[np.argmin(mags2)]))
+    vecs1 = vecs1 / mags1[:, np.newaxis]
+    vecs2 = vecs2 / mags2[:, np.newaxis]
+    angles = np.arccos(np.clip(np.einsum('ij,ij->i', vecs1, vecs2), -1., 1.))
+    not_normal = np.round(angles, 8) != round(math.pi/2, 8)
+    if np.any(not_normal):
+        i = np.nonzero(not_normal)[0][0]
+        raise ValueError("vec2 {} is not normal to vec1 {}! Angle is {} rad ({} degrees)".format(vecs2[i], vecs1[i], angles[i], math.degrees(angles[i])))
+    vecs3 = np.cross(vecs1, vecs2)
+    mags3 = np.sqrt(np.einsum('ij,ij->i', vecs3, vecs3))
+    if np.any(mags3 == 0):
+        raise ZeroDivisionError("vec 3 has magnitude 0.")
+    vecs3 /= mags3[:, np.newaxis]
+    return np.stack([vecs1, vecs2, vecs3], axis=1)
+
 """
 # Code used for comparing the fastes method of creating an orthonormal basis:
 def create_orthonormal_basis1(vec1, vec2=None, vec3=None):
@@ -260,6 +292,19 @@ def spherical_polar_to_cartesian(vec):
 
     return np.array([x, y, z])
 
+def spherical_polar_to_cartesian_array(vecs):
+    '''
+    Like spherical_polar_to_cartesian, but for an array of polar coordinates.
+
+    :param vecs: An array of shape N x 3, containing (r, u, v) in every row.
+    :return: An array of shape N x 3 of cartesian coordinates.
+    '''
+    vecs = np.asarray(vecs, dtype=float)
+    r, u, v = vecs[...,0], vecs[...,1], vecs[...,2]
+    return np.stack([r * np.sin(u) * np.cos(v),
+                     r * np.sin(u) * np.sin(v),
+                     r * np.cos(u)], axis=-1)
+
 def get_standard_basis(dim):
     '''
     Get a standard basis for the given dimension.
@@ -836,6 +881,105 @@ def line_segment_distance(s1_p0, s1_p1, s2_p0, s2_p1):
 
     return (s1_p0 + sc * u, s2_p0 + tc * v)
 
+def _line_segment_parameters(s1_p0, s1_p1, s2_p0, s2_p1):
+    '''
+    The array version of the branches in line_segment_distance.
+
+    All arguments are arrays of points (shape ...x3), which are broadcast against each other.
+
+    :returns: A tuple (sc, tc, u, v). The closest points are s1_p0 + sc * u and s2_p0 + tc * v
+    '''
+    u = s1_p1 - s1_p0
+    v = s2_p1 - s2_p0
+    w = s1_p0 - s2_p0
+
+    a = np.sum(u*u, axis=-1)
+    b = np.sum(u*v, axis=-1)
+    c = np.sum(v*v, axis=-1)
+    d = np.sum(u*w, axis=-1)
+    e = np.sum(v*w, axis=-1)
+    a, b, c, d, e = np.broadcast_arrays(a, b, c, d, e)
+
+    D = a*c - b*b
+
+    SMALL_NUM = 0.000001
+
+    # compute the line parameters of the two closest points
+    parallel = D < SMALL_NUM
+    sN = np.where(parallel, 0.0, b*e - c*d)
+    sD = np.where(parallel, 1.0, D)
+    tN = np.where(parallel, e, a*e - b*d)
+    tD = np.where(parallel, c, D)
+    s_low = ~parallel & (sN < 0.0)
+    s_high = ~parallel & ~s_low & (sN > sD)
+    sN = np.where(s_low, 0.0, np.where(s_high, sD, sN))
+    tN = np.where(s_low, e, np.where(s_high, e + b, tN))
+    tD = np.where(s_low | s_high, c, tD)
+
+    t_low = tN < 0.0
+    t_high = ~t_low & (tN > tD)
+    # recompute sc for the visible edge
+    edge_sN = np.where(t_low, -d, -d + b)
+    tN = np.where(t_low, 0.0, np.where(t_high, tD, tN))
+    t_edge = t_low | t_high
+    edge_low = t_edge & (edge_sN < 0.0)
+    edge_high = t_edge & ~edge_low & (edge_sN > a)
+    edge_mid = t_edge & ~edge_low & ~edge_high
+    sN = np.where(edge_low, 0.0, np.where(edge_high, sD, np.where(edge_mid, edge_sN, sN)))
+    sD = np.where(edge_mid, a, sD)
+
+    # finally do the division to get sc and tc
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sc = np.where(np.abs(sN) < SMALL_NUM, 0.0, sN / sD)
+        tc = np.where(np.abs(tN) < SMALL_NUM, 0.0, tN / tD)
+    return sc, tc, u, v
+
+def _segment_stacks(segs1, segs2, paired):
+    segs1 = np.asarray(segs1, dtype=float)
+    segs2 = np.asarray(segs2, dtype=float)
+    if paired:
+        if len(segs1) != len(segs2):
+            raise ValueError("For paired segments, both stacks need the same length. "
+                             "Found {} and {}".format(len(segs1), len(segs2)))
+        return segs1[:, 0], segs1[:, 1], segs2[:, 0], segs2[:, 1]
+    return (segs1[:, np.newaxis, 0], segs1[:, np.newaxis, 1],
+            segs2[np.newaxis, :, 0], segs2[np.newaxis, :, 1])
+
+def line_segment_distances(segs1, segs2, paired=False):
+    '''
+    The array version of line_segment_distance for many segments at once.
+
+    :param segs1: An array of shape (M x 2 x 3): Start and end points of M segments.
+    :param segs2: An array of shape (K x 2 x 3)
+    :param paired: If True, M has to equal K and only the segments
+                   segs1[i] and segs2[i] are compared.
+    :returns: A tuple (distances, sc, tc) of arrays of shape (M x K), or (M,) if paired.
+              The closest points are segs1[i,0] + sc[i,j] * (segs1[i,1]-segs1[i,0]) and
+              segs2[j,0] + tc[i,j] * (segs2[j,1]-segs2[j,0])
+    '''
+    s1_p0, s1_p1, s2_p0, s2_p1 = _segment_stacks(segs1, segs2, paired)
+    sc, tc, u, v = _line_segment_parameters(s1_p0, s1_p1, s2_p0, s2_p1)
+    diff = (s1_p0 + sc[..., np.newaxis] * u) - (s2_p0 + tc[..., np.newaxis] * v)
+    return np.sqrt(np.sum(diff * diff, axis=-1)), sc, tc
+
+def elements_closer_than_array(segs1, segs2, distance, paired=False):
+    '''
+    The array version of elements_closer_than for many segments at once.
+
+    :param segs1: An array of shape (M x 2 x 3): Start and end points of M segments.
+    :param segs2: An array of shape (K x 2 x 3)
+    :param distance: The cutoff distance
+    :param paired: See line_segment_distances
+    :returns: A boolean array of shape (M x K), or (M,) if paired.
+    '''
+    s1_p0, s1_p1, s2_p0, s2_p1 = _segment_stacks(segs1, segs2, paired)
+    distances, _, _ = line_segment_distances(segs1, segs2, paired)
+    w = s1_p0 - s2_p0
+    lenw = np.sqrt(np.sum(w*w, axis=-1))
+    len1 = np.sqrt(np.sum((s1_p1 - s1_p0)**2, axis=-1))
+    len2 = np.sqrt(np.sum((s2_p1 - s2_p0)**2, axis=-1))
+    return (lenw < distance) | (~(lenw > len1 + len2 + distance) & (distances < distance))
+
 def closest_point_on_seg(seg_a, seg_b, circ_pos):
     '''
     Closest point between a line segment and a point.
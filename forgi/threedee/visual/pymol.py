@@ -616,6 +616,26 @@ class PymolPrinter:
         elif elem_name[0] == 'f':
             return 'cyan'
 
+    def stem_closest_points(self, cg):
+        '''
+        The closest points between all pairs of stems (like cuv.line_segment_distance),
+        calculated in one go.
+
+        @param cg: The coarse grain structure
+        @return: A dictionary (stem1, stem2): (point on stem1, point on stem2)
+        '''
+        stems = list(cg.stem_iterator())
+        if not stems:
+            return {}
+        segs = cg.coords[stems].reshape((-1, 2, 3))
+        _, sc, tc = cuv.line_segment_distances(segs, segs)
+        directions = segs[:, 1] - segs[:, 0]
+        closest_points = {}
+        for (i, s1), (j, s2) in it.permutations(enumerate(stems), 2):
+            closest_points[(s1, s2)] = (segs[i, 0] + sc[i, j] * directions[i],
+                                        segs[j, 0] + tc[i, j] * directions[j])
+        return closest_points
+
     def add_dashed(self, point1, point2, width=0.3):
         '''
         Add a dashed line from point1 to point2.
@@ -719,12 +739,12 @@ class PymolPrinter:
         if self.encompassing_stems:
             self.add_encompassing_cylinders(cg, 7.)
 
+        if self.max_stem_distances > 0 or self.stem_stem_orientations is not None:
+            stem_closest_points = self.stem_closest_points(cg)
+
         if self.max_stem_distances > 0:
             for (s1, s2) in it.permutations(cg.stem_iterator(), r=2):
-                (i1, i2) = cuv.line_segment_distance(cg.coords[s1][0],
-                                                     cg.coords[s1][1],
-                                                     cg.coords[s2][0],
-                                                     cg.coords[s2][1])
+                (i1, i2) = stem_closest_points[(s1, s2)]
                 if cuv.magnitude(i2 - i1) < self.max_stem_distances:
                     #self.add_segment(i1, i2, 'cyan', 0.3, s1 + " " + s2, key=key)
                     self.add_segment(i1, i2, 'cyan', 0.3, key=key)
@@ -798,10 +818,7 @@ class PymolPrinter:
 
                 s1_vec = cg.coords[s1][1] - cg.coords[s1][0]
                 s2_vec = cg.coords[s2][1] - cg.coords[s2][0]
-                (i1, i2) = cuv.line_segment_distance(cg.coords[s1][0],
-                                                     cg.coords[s1][1],
-                                                     cg.coords[s2][0],
-                                                     cg.coords[s2][1])
+                (i1, i2) = stem_closest_points[(s1, s2)]
                 i_vec = i2 - i1
 
                 #i_rej will be orthogonal to s1_vec in the direction
@@ -23,6 +23,7 @@ class observedDict(dict):
         self.on_change(key)
     def __delitem__(self, key):
         super(observedDict, self).__delitem__(key)
+        self.on_change(key)
     def clear(self):
         for key in list(self.keys()):
             self.on_change(key)
@@ -38,8 +39,12 @@ class observedDict(dict):
     def pop (self, k, x=None):         
         if k in self:
             self.on_change(k)
-        return super(observedDict, self).pop(self, k, x)
+        return super(observedDict, self).pop(k, x)
     def popitem (self):
-        key, value = super(observedDict, self).popitem(self)
+        key, value = super(observedDict, self).popitem()
         self.on_change(key)
         return key, value 
+    def __reduce__(self):
+        # The default reduction of dict subclasses restores the items (via __setitem__)
+        # before the instance attributes, i.e. before on_change exists.
+        return (self.__class__, (dict(self), self.on_change))
@@ -1150,6 +1150,33 @@ AAAACCGGGCCUUUUACCCCAAAUUGGAA
     def test_get_node_from_residue_num(self):
         bg = fgb.BulgeGraph('test/forgi/data/telomerase.cg')
 
+        for d in bg.defines:
+            for r in bg.define_residue_num_iterator(d):
+                self.assertEqual(bg.get_node_from_residue_num(r), d)
+        with self.assertRaises(LookupError):
+            bg.get_node_from_residue_num(bg.seq_length + 1)
+        with self.assertRaises(LookupError):
+            bg.get_node_from_residue_num(0)
+
+    def test_get_node_from_residue_num_after_define_change(self):
+        bg = fgb.BulgeGraph(dotbracket_str='((..))..((..))')
+        self.assertEqual(bg.get_node_from_residue_num(7), "m0")
+        bg.relabel_node("m0", "m5")
+        self.assertEqual(bg.get_node_from_residue_num(7), "m5")
+        del bg.defines["m5"]
+        with self.assertRaises(LookupError):
+            bg.get_node_from_residue_num(7)
+        bg.from_dotbracket('(((...)))')
+        self.assertEqual(bg.get_node_from_residue_num(5), "h0")
+
+    def test_get_node_from_residue_num_seq_id(self):
+        bg = fgb.BulgeGraph(dotbracket_str='((..))..((..))')
+        bg.seq_ids = [(' ', i + 100, ' ') for i in range(14)]
+        self.assertEqual(bg.get_node_from_residue_num(106, seq_id=True), "m0")
+        self.assertEqual(bg.seq_id_to_pos((' ', 106, ' ')), 7)
+        bg.seq_ids += [(' ', 200, ' ')]
+        self.assertEqual(bg.seq_id_to_pos(200), 15)
+
     def test_get_connected_nucleotides(self):
         db = '((..((..))..))'
         bg = fgb.BulgeGraph(dotbracket_str=db)
@@ -1572,6 +1599,15 @@ GCGCGGCACCGUCCGCGGAACAAACGG
         (mi, mx) = bg.min_max_bp_distance('s4', 's7')
         self.assertEqual(mi, 18)
         self.assertEqual(mx, 24)
+
+    def test_min_max_bp_distance_like_networkx(self):
+        import networkx as nx
+        bg = fgb.BulgeGraph(dotbracket_str='((..[[..))..((..]]..))..')
+        dists = nx.floyd_warshall(bg.to_networkx())
+        for e1, e2 in it.product(bg.defines, bg.defines):
+            nx_dists = [ dists[f1][f2] for f1 in set(bg.defines[e1]) for f2 in set(bg.defines[e2]) ]
+            if nx_dists:
+                self.assertEqual(bg.min_max_bp_distance(e1, e2), (min(nx_dists), max(nx_dists)))
     def test_global_pos_to_stem_pos(self):
         db = '...((((((((...))))))))...'
         bg = fgb.BulgeGraph()
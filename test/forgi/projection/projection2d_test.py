@@ -6,7 +6,8 @@ from future.builtins.disabled import (apply, cmp, coerce, execfile,
                              file, int, raw_input, reduce, reload,
                              str, xrange, Exception)
 
-import unittest, sys
+import unittest, sys, warnings, time
+import itertools as it
 import numpy as np
 import numpy.testing as nptest
 import networkx as nx
@@ -186,6 +187,32 @@ class Projection2DTestWithData(unittest.TestCase):
         self.assertEqual(self.proj2.get_cyclebasis_len(), 2)
         self.assertAlmostEqual(self.proj2.get_longest_arm_length()[0], 20.5730384435)
  
+class Projection2DLargeGraphTest(unittest.TestCase):
+    def setUp(self):
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/3D0U_A.cg')
+        self.proj=fpp.Projection2D(cg, [0.3, 0.5, 0.8])
+        points=[ tuple(point) for point in np.random.RandomState(1).uniform(-100, 100, (300, 2)) ]
+        graph=nx.Graph()
+        for p1, p2 in zip(points, points[1:]):
+            graph.add_edge(p1, p2, attr_dict={"label": "s0"})
+        self.proj._proj_graph=graph
+        self.points=points
+
+    def test_condense_tiny_cutoff(self):
+        # The spatial index used to have cells of the size of the cutoff,
+        # which made this take forever.
+        start=time.time()
+        self.proj.condense(10**-11)
+        self.assertLess(time.time()-start, 10)
+        self.assertEqual(sorted(self.proj.proj_graph.nodes()), sorted(self.points))
+
+    def test_condense_points_like_pairwise_search(self):
+        self.proj.condense_points(2)
+        nodes=self.proj.proj_graph.nodes()
+        self.assertLess(len(nodes), 300)
+        for n1, n2 in it.combinations(nodes, 2):
+            self.assertGreaterEqual(ftuv.vec_distance(n1, n2), 2)
+
 class Projection2DTestOnCondensedProjection(unittest.TestCase):
     def setUp(self):
         cg = ftmc.from_pdb('test/forgi/threedee/data/1y26_two_chains.pdb')
@@ -288,3 +315,116 @@ class Projection2DHelperfunctionsTests(unittest.TestCase):
     print(a_rast)
     nptest.assert_array_equal(a_rast, np.array([[0,12],[0,13], [0,13], [-10,2], [-11,2], [-11,2]]))
 
+
+class BresenhamLinesTest(unittest.TestCase):
+  def test_bresenham_lines_like_bresenham(self):
+    starts = np.array([[0,0],[0,0],[3,4],[5,-2],[-3,7],[2,2],[0,0]])
+    ends = np.array([[10,3],[3,10],[-6,1],[5,8],[4,7],[2,2],[-5,-5]])
+    line_indices, pixels = fpp.bresenham_lines(starts, ends)
+    expected = [ (i, p) for i in range(len(starts))
+                 for p in fpp.bresenham(tuple(starts[i]), tuple(ends[i])) ]
+    self.assertEqual([ (i, tuple(p)) for i, p in zip(line_indices, pixels) ],
+                     [ (i, tuple(p)) for i, p in expected ])
+
+class ProjectionBatchTest(unittest.TestCase):
+  def setUp(self):
+    self.cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+    rng = np.random.RandomState(1)
+    self.directions = rng.normal(size=(10,3))
+    self.rotations = rng.uniform(-180, 180, 10)
+  def test_rasterize_like_projection2d(self):
+    batch = fpp.ProjectionBatch(self.cg, self.directions)
+    boxes = batch.get_bounding_squares() + np.array([5, 30, 0, 30])
+    images, steplengths = batch.rasterize(40, boxes, self.rotations, warn=False)
+    self.assertEqual(images.shape, (10, 40, 40))
+    for i, direction in enumerate(self.directions):
+      proj = fpp.Projection2D(self.cg, direction)
+      self.assertEqual(proj.longest_axis, batch.longest_axes[i])
+      img, steplength = proj.rasterize(40, boxes[i], warn=False, rotate=self.rotations[i])
+      self.assertEqual(steplength, steplengths[i])
+      nptest.assert_array_equal(images[i], img)
+  def test_bounding_squares_like_projection2d(self):
+    batch = fpp.ProjectionBatch(self.cg, self.directions)
+    squares = batch.get_bounding_squares(margin=3)
+    for i, direction in enumerate(self.directions):
+      proj = fpp.Projection2D(self.cg, direction)
+      nptest.assert_array_equal(squares[i], proj.get_bounding_square(margin=3))
+
+class Projection2DRasterizeTest(unittest.TestCase):
+  def setUp(self):
+    cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+    self.proj = fpp.Projection2D(cg, [1.,2.,3.])
+    self.box = np.array(self.proj.get_bounding_square(margin=5))
+  def test_rasterize_like_bresenham(self):
+    img, steplength = self.proj.rasterize(70, self.box, rotate=30, warn=False)
+    expected = np.zeros((70,70))
+    for start, end in self.proj._coords.values():
+      start, end = fpp.rasterized_2d_coordinates(np.array([start, end]), steplength,
+                                                 self.box[[0,2]], 30)
+      for x, y in fpp.bresenham(tuple(start), tuple(end)):
+        if 0<=x<70 and 0<=y<70:
+          expected[x,y] = 1
+    nptest.assert_array_equal(img, expected)
+  def test_rasterize_warns_once(self):
+    with warnings.catch_warnings(record=True) as w:
+      warnings.simplefilter("always")
+      self.proj.rasterize(70, self.box/3)
+    self.assertEqual(len(w), 1)
+  def test_rasterize_supersample(self):
+    img, _ = self.proj.rasterize(70, self.box)
+    img_aa, _ = self.proj.rasterize(70, self.box, supersample=3)
+    self.assertEqual(img_aa.shape, (70,70))
+    self.assertTrue(np.all((img_aa>=0) & (img_aa<=1)))
+    self.assertTrue(np.any((img_aa>0) & (img_aa<1)))
+    # Only pixels close to a line of the normal image are hit.
+    near_line = np.zeros((72,72), dtype=bool)
+    for dx, dy in it.product(range(3), repeat=2):
+      near_line[dx:dx+70,dy:dy+70] |= img>0
+    self.assertFalse(np.any((img_aa>0) & ~near_line[1:71,1:71]))
+
+class Projection2DCondensedDescriptorsTest(unittest.TestCase):
+  # Values calculated with the per-element projection of earlier versions.
+  # Changes in the last bit of the coordinates can change the projection graph.
+  def setUp(self):
+    self.cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/3D0U_A.cg')
+  def test_condensed_descriptors_like_earlier_versions(self):
+    for direction, total_length, cycles, branchpoints, max_path in [
+          ([0.3, 0.5, 0.8], 186.2255481965456, 4, 5, 139.45102700826152),
+          ([1., 2., 3.], 186.8853155156999, 4, 6, 145.54748495219752),
+          ([0., 0., 1.], 220.39585486503827, 2, 4, 194.852540313217) ]:
+      proj = fpp.Projection2D(self.cg, direction)
+      proj.condense(5)
+      self.assertAlmostEqual(proj.get_total_length(), total_length)
+      self.assertEqual(proj.get_cyclebasis_len(), cycles)
+      self.assertEqual(proj.get_branchpoint_count(), branchpoints)
+      self.assertAlmostEqual(proj.get_maximal_path_length(), max_path)
+
+class Projection2DGraphTest(unittest.TestCase):
+  def setUp(self):
+    cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+    self.proj = fpp.Projection2D(cg, [1.,2.,3.])
+  def test_overlapping_box_pairs(self):
+    rng = np.random.RandomState(2)
+    starts = rng.uniform(0, 100, (40,2))
+    segments = np.stack([starts, starts+rng.normal(scale=10, size=(40,2))], axis=1)
+    expected = [ (i, j) for i, j in it.combinations(range(40), 2)
+                 if np.all(np.max(segments[i], axis=0)>=np.min(segments[j], axis=0)) and
+                    np.all(np.max(segments[j], axis=0)>=np.min(segments[i], axis=0)) ]
+    self.assertEqual(fpp._overlapping_box_pairs(segments), expected)
+  def test_crossing_points_like_all_pairs(self):
+    expected = {}
+    for key1, key2 in it.combinations(self.proj._coords, 2):
+      for cr in ftuv.seg_intersect(self.proj._coords[key1], self.proj._coords[key2]):
+        expected.setdefault(key1, []).append((tuple(cr), key2))
+        expected.setdefault(key2, []).append((tuple(cr), key1))
+    crossing = { key: [ (tuple(cr), other) for cr, other in value ]
+                 for key, value in self.proj.crossingPoints.items() }
+    self.assertEqual(crossing, expected)
+    self.assertGreater(len(crossing), 0)
+  def test_condense_points_leaves_no_close_points(self):
+    self.proj.condense_points(5)
+    nodes = self.proj.proj_graph.nodes()
+    self.assertGreater(len(nodes), 1)
+    for node1, node2 in it.combinations(nodes, 2):
+      self.assertGreaterEqual(ftuv.vec_distance(node1, node2), 5)
+    self.assertEqual(self.proj.proj_graph.selfloop_edges(), [])
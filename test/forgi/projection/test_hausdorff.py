@@ -1,5 +1,6 @@
 
 import unittest, math
+import itertools as it
 import numpy as np
 import numpy.testing as nptest
 import forgi.projection.hausdorff as fph
@@ -72,6 +73,26 @@ class TestOffsetbasedIteration(unittest.TestCase):
         self.assertEqual(np.max(img2), 1)
         self.assertEqual(np.min(img2), 1," - ".join(map(str,np.transpose(np.where(img2==0)))))
 
+    def test_offsets_order_of_ties(self):
+        self.assertEqual([ dd for dd, norm in it.islice(fph.offsets(), 13) ],
+                         [(0, 0), (-1, 0), (0, -1), (0, 1), (1, 0),
+                          (-1, -1), (-1, 1), (1, -1), (1, 1),
+                          (-2, 0), (0, -2), (0, 2), (2, 0)])
+        # Like earlier versions (Python >= 3.6): A stable sort by norm of the offsets
+        # in the order of dx and dy, up to and beyond the boundaries (norm 25 and 49),
+        # where the earlier versions grew their list of offsets.
+        r = 60
+        expected = sorted(((dx, dy) for dx in range(-r, r+1) for dy in range(-r, r+1)
+                           if fph.norm((dx, dy)) < r), key=fph.norm)
+        self.assertEqual([ dd for dd, norm in it.islice(fph.offsets(), len(expected)) ], expected)
+
+    def test_offsets_with_skip(self):
+        for skip in [0, 3, 25, 2000]:
+            dd, norm = next(fph.offsets(skip))
+            self.assertGreaterEqual(dd[0]**2+dd[1]**2, skip)
+            self.assertEqual(dd[0]**2+dd[1]**2, min(x**2+y**2 for x in range(-50, 51) 
+                                                    for y in range(-50, 51) if x**2+y**2>=skip))
+
 class TestHausdorffDistances(unittest.TestCase):
     def setUp(self):
         img=np.zeros((80,80))
@@ -106,6 +127,23 @@ class TestHausdorffDistances(unittest.TestCase):
         #Make sure no wrapping is done
         dist=fph.hausdorff_helperdist([75,10],self.img)
         self.assertEqual(dist,62)
+    def test_hausdorff_helperdistance_like_brute_force(self):
+        rng = np.random.RandomState(4)
+        for density in [0.001, 0.01, 0.2]:
+            img = rng.rand(90,70)<density
+            img[50,3] = True
+            points = np.transpose(np.where(img))
+            for p in [(0,0), (45,35), (89,69), (-5,20), (95,-3)]:
+                dists = np.sqrt(np.sum((points-np.array(p))**2, axis=1))
+                self.assertEqual(fph.hausdorff_helperdist(p, img), np.min(dists))
+                self.assertEqual(fph.hausdorff_helperdist(p, img, skip=4), 
+                                 np.min(dists[dists>=2]))
+                # The first offset further away than cutoff is still tested.
+                cutoff = np.min(dists)-1.5
+                if cutoff>1.5:
+                    self.assertEqual(fph.hausdorff_helperdist(p, img, cutoff), float("inf"))
+    def test_hausdorff_helperdistance_empty_image(self):
+        self.assertEqual(fph.hausdorff_helperdist([3,3], np.zeros((10,10))), float("inf"))
     def test_hausdorff_distance(self):
         self.assertEqual(fph.hausdorff_distance(self.img, self.img2),10)
         self.assertEqual(fph.hausdorff_distance(self.img, self.img),0)
@@ -116,6 +154,41 @@ class TestHausdorffDistances(unittest.TestCase):
         self.assertEqual(fph.modified_hausdorff_distance(self.img, self.img),0)
         self.assertEqual(fph.modified_hausdorff_distance(self.img2, self.img2),0)
 
+    def test_distance_transform(self):
+        dt=fph.distance_transform(self.img)
+        for x,y in [[10,10], [10,15], [8,8], [75,10]]:
+            self.assertEqual(dt[x,y], fph.hausdorff_helperdist([x,y],self.img))
+        self.assertEqual(np.max(fph.distance_transform(np.zeros((5,5)))), float("inf"))
+    def test_edt_distances_like_spiral_search(self):
+        for i in range(10):
+            img=np.random.random((40,40))<0.05
+            img2=np.random.random((40,40))<0.05
+            img[0,0]=img2[39,39]=True
+            self.assertEqual(fph.hausdorff_distance_edt(img, img2),
+                             fph.hausdorff_distance_new(img, img2))
+            self.assertAlmostEqual(fph.modified_hausdorff_distance_edt(img, img2),
+                                   max(np.mean([ fph.hausdorff_helperdist([x,y], img)
+                                                 for x,y in np.transpose(np.where(img2)) ]),
+                                       np.mean([ fph.hausdorff_helperdist([x,y], img2)
+                                                 for x,y in np.transpose(np.where(img)) ])))
+    def test_edt_distances_cutoff(self):
+        self.assertEqual(fph.hausdorff_distance_edt(self.img, self.img2, 9.5), float("inf"))
+        self.assertEqual(fph.hausdorff_distance_edt(self.img, self.img2, 10), 10)
+        self.assertEqual(fph.modified_hausdorff_distance_edt(self.img, self.img2, 5), float("inf"))
+
+    def test_reference_image_in_distance_functions(self):
+        ref=fph.ReferenceImage(self.img2)
+        self.assertEqual(len(ref), 80)
+        nptest.assert_equal(ref.distance_transform, fph.distance_transform(self.img2))
+        for distance in [fph.hausdorff_distance, fph.hausdorff_distance_new,
+                         fph.modified_hausdorff_distance, fph.tp_fp_distance]:
+            self.assertEqual(distance(ref, self.img), distance(self.img2, self.img))
+            self.assertEqual(distance(self.img, ref), distance(self.img, self.img2))
+        self.assertEqual(fph.hausdorff_helperdist([10,15], ref),
+                         fph.hausdorff_helperdist([10,15], self.img2))
+        self.assertEqual(fph.get_longest_img_diameter(ref, 10),
+                         fph.get_longest_img_diameter(self.img2, 10))
+
 class TestHelperFunctions(unittest.TestCase):
     def setUp(self):
         self.img = np.zeros((10,10))
@@ -200,3 +273,19 @@ class TestDistanceCgToImg(unittest.TestCase):
         self.assertLessEqual(distance, 3)
         #self.assertLessEqual(abs(params[1]-45), 5)
         nptest.assert_allclose(params[0], fph.to_polar([2,0,-1.2])[1:], atol=5)
+
+class TestParallelGlobalSearch(unittest.TestCase):
+    def setUp(self):
+        self.cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        ref_proj = fpp.Projection2D(self.cg, [1., 1., 1.], project_virtual_atoms=False)
+        self.scale = 150
+        self.ref_img, _ = ref_proj.rasterize(40, bounding_square=fph.get_box(ref_proj, self.scale), warn=False)
+    def test_parallel_like_serial(self):
+        serial = fph.globally_minimal_distance(self.ref_img, self.scale, self.cg, start_points=20, 
+                                               local_maxiter=2, virtual_atoms=False)
+        parallel = fph.globally_minimal_distance(self.ref_img, self.scale, self.cg, start_points=20, 
+                                                 local_maxiter=2, virtual_atoms=False, num_workers=2)
+        self.assertEqual(serial[0], parallel[0])
+        nptest.assert_equal(serial[1], parallel[1])
+        for p1, p2 in zip(serial[2], parallel[2]):
+            nptest.assert_equal(p1, p2)
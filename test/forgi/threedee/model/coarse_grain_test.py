@@ -195,6 +195,24 @@ class CoarseGrainTest(tfgb.GraphVerification):
             nptest.assert_allclose(cg1.coords[key][1],cg2.coords[key][1])
         nptest.assert_allclose(cg1.project_from, cg2.project_from)
 
+    def test_to_and_from_binary_file(self):
+        cg1 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        cg1.project_from=np.array([1,2,3.5])
+        with tf.NamedTemporaryFile(suffix=".cgb") as f:
+            cg1.to_binary_file(f.name)
+            cg2 = ftmc.CoarseGrainRNA(f.name)
+        self.assertEqual(cg1.defines, cg2.defines)
+        self.assertEqual(cg1.edges, cg2.edges)
+        self.assertEqual(cg1.longrange, cg2.longrange)
+        self.assertEqual(cg1.seq, cg2.seq)
+        self.assertEqual(cg1.seq_ids, cg2.seq_ids)
+        self.assertEqual(cg1.name, cg2.name)
+        nptest.assert_equal(cg1.coords.get_array(), cg2.coords.get_array())
+        nptest.assert_equal(cg1.twists.get_array(), cg2.twists.get_array())
+        nptest.assert_equal(cg1.project_from, cg2.project_from)
+        self.assertEqual(cg1.to_cg_string().splitlines()[0], cg2.to_cg_string().splitlines()[0])
+        self.assertEqual(cg1.get_coord_str(), cg2.get_coord_str())
+
     def test_get_bulge_angle_stats_core(self):
         cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1y26.cg')
         self.check_graph_integrity(cg)
@@ -499,7 +517,21 @@ class TestVirtualAtoms(unittest.TestCase):
         cg.coords["s0"] = cg.coords["s0"][0] + (cg.coords["s0"][1]-cg.coords["s0"][0])*0.5, cg.coords["s0"][1] #Stay orthogonal to twists
         va_new = cg.virtual_atoms(1)["C1'"]
         self.assertTrue(np.any(np.not_equal(va_old, va_new)), msg="A stale virtual atom position was used.")
-        
+
+    def test_virtual_atom_caching_only_moved_elements(self):
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1y26.cg')
+        stem_atoms = cg.virtual_atoms(cg.defines["s1"][0])
+        other_atoms = cg.virtual_atoms(1)
+        cg.coords["s1"] = cg.coords["s1"][0] + 1, cg.coords["s1"][1] + 1
+        self.assertIsNot(cg.virtual_atoms(cg.defines["s1"][0]), stem_atoms)
+        self.assertIs(cg.virtual_atoms(1), other_atoms)
+
+    def test_element_physical_distance_caching(self):
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1y26.cg')
+        dist = cg.element_physical_distance("s0", "s1")
+        cg.coords["s1"] = cg.coords["s1"][0] + 10, cg.coords["s1"][1] + 10
+        self.assertNotAlmostEqual(cg.element_physical_distance("s0", "s1"), dist)
+
 class RotationTranslationTest(unittest.TestCase):
     def setUp(self):
         self.cg1 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1y26.cg')
@@ -50,3 +50,16 @@ class TestGyration(unittest.TestCase):
         self.assertAlmostEqual(ftmd.anisotropy(planar), 0.25, places=2)
         
 
+
+class TestBatchDescriptors(unittest.TestCase):
+    def test_batch_descriptors_like_single(self):
+        linear = np.array([[1., 1., 1.], [0., 0., 0.], [-1., -1., -1.], [-2,-2,-2]])
+        other = np.array([[0.,0,1], [0,1,0], [1,0,0], [-1,0.5,0]])
+        descriptors = ftmd.batch_descriptors(np.array([linear, other]))
+        for i, coords in enumerate([linear, other]):
+            self.assertAlmostEqual(descriptors["rog"][i], ftmd.radius_of_gyration(coords))
+            self.assertAlmostEqual(descriptors["anisotropy"][i], ftmd.anisotropy(coords))
+            self.assertAlmostEqual(descriptors["asphericity"][i], ftmd.asphericity(coords))
+            g_tensor = ftmd.gyration_tensor(coords)
+            for j in range(3):
+                self.assertAlmostEqual(descriptors["eigenvalues"][i,j], g_tensor[j,j])
@@ -61,6 +61,18 @@ class CoordinateStorageTest(unittest.TestCase):
     def test_get_direction(self):
         self.cs["s1"]=[-1,-1,-2],[1,2,4]
         nptest.assert_almost_equal(self.cs.get_direction("s1"), [2,3,6])
+    def test_version(self):
+        v1 = self.cs.version("s1")
+        v2 = self.cs.version("s2")
+        self.cs["s1"]=[1,2,3],[4,5,6]
+        self.assertGreater(self.cs.version("s1"), v1)
+        self.assertEqual(self.cs.version("s2"), v2)
+        v1 = self.cs.version("s1")
+        self.cs.rotate(np.eye(3))
+        self.assertGreater(self.cs.version("s1"), v1)
+        self.assertGreater(self.cs.version("s2"), v2)
+        with self.assertRaises(KeyError):
+            self.cs.version("s3")
 class CoordinateStorageTest2(unittest.TestCase):
     def setUp(self):
         self.cs = CoordinateStorage(["s1","s2"])
@@ -0,0 +1,87 @@
+import unittest, os, shutil, tempfile
+import numpy as np
+import numpy.testing as nptest
+import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.model.ensemble as ftme
+import forgi.threedee.model.descriptors as ftmd
+
+class TestMemmapTrajectory(unittest.TestCase):
+    def setUp(self):
+        self.filenames = ['test/forgi/threedee/data/1GID_A.cg',
+                          'test/forgi/threedee/data/1GID_A_sampled.cg',
+                          'test/forgi/threedee/data/1GID_A.cg']
+        self.tmpdir = tempfile.mkdtemp()
+        self.memmap_filename = os.path.join(self.tmpdir, "trajectory.npy")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_memmap_ensemble_like_in_memory_ensemble(self):
+        ens = ftme.ensemble_from_filenames(self.filenames)
+        mm_ens = ftme.ensemble_from_filenames(self.filenames, self.memmap_filename)
+        self.assertEqual(len(mm_ens), 3)
+        for descriptor in ftme.Ensemble.AVAILABLE_DESCRIPTORS:
+            nptest.assert_almost_equal(mm_ens.get_descriptor(descriptor), ens.get_descriptor(descriptor))
+        nptest.assert_almost_equal(mm_ens[1:3].get_descriptor("rog"), ens[1:3].get_descriptor("rog"))
+        nptest.assert_almost_equal(mm_ens[1].get_ordered_virtual_residue_poss(),
+                                   ens[1].get_ordered_virtual_residue_poss())
+
+    def test_reopen_trajectory(self):
+        ftme.ensemble_from_filenames(self.filenames, self.memmap_filename)
+        trajectory = ftme.MemmapTrajectory(self.memmap_filename)
+        cg = ftmc.CoarseGrainRNA(self.filenames[1])
+        self.assertEqual(len(trajectory), 3)
+        self.assertEqual(trajectory.coords.shape, (3, len(cg.coords), 2, 3))
+        self.assertEqual(trajectory[1].defines, cg.defines)
+        for key in cg.coords:
+            nptest.assert_equal(trajectory[1].coords[key], cg.coords[key])
+        for key in cg.twists:
+            nptest.assert_equal(trajectory[-2].twists[key], cg.twists[key])
+
+    def test_frames_are_independent(self):
+        ftme.ensemble_from_filenames(self.filenames, self.memmap_filename)
+        trajectory = ftme.MemmapTrajectory(self.memmap_filename)
+        cg0 = trajectory[0]
+        cg0.coords["s0"] = cg0.coords["s0"][0] + 10, cg0.coords["s0"][1] + 10
+        cg = ftmc.CoarseGrainRNA(self.filenames[0])
+        nptest.assert_equal(trajectory[0].coords["s0"], cg.coords["s0"])
+        nptest.assert_equal(trajectory.template.coords["s0"], cg.coords["s0"])
+
+class TestEnsembleDescriptors(unittest.TestCase):
+    def setUp(self):
+        self.cgs = [ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg'),
+                    ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A_sampled.cg')]
+        self.ens = ftme.Ensemble(self.cgs)
+
+    def test_get_descriptor_like_single_cg(self):
+        nptest.assert_almost_equal(self.ens.get_descriptor("rog"),
+                                   [ cg.radius_of_gyration() for cg in self.cgs ])
+        nptest.assert_almost_equal(self.ens.get_descriptor("anisotropy"),
+                                   [ ftmd.anisotropy(cg.get_ordered_stem_poss()) for cg in self.cgs ])
+        nptest.assert_almost_equal(self.ens.get_descriptor("asphericity"),
+                                   [ ftmd.asphericity(cg.get_ordered_stem_poss()) for cg in self.cgs ])
+
+    def test_get_descriptor_for_domain_is_cached(self):
+        domain = ["s0", "s1", "i0"]
+        rog = self.ens.get_descriptor("rog", domain)
+        nptest.assert_almost_equal(rog, [ ftmd.radius_of_gyration(cg.get_poss_for_domain(domain, "vres"))
+                                          for cg in self.cgs ])
+        self.assertIs(self.ens.get_descriptor("rog", ["i0", "s1", "s0"]), rog)
+        nptest.assert_almost_equal(self.ens[1:2].get_descriptor("rog", domain), rog[1:2])
+
+class TestParallelLoading(unittest.TestCase):
+    def setUp(self):
+        self.filenames = ['test/forgi/threedee/data/1GID_A.cg',
+                          'test/forgi/threedee/data/1GID_A_sampled.cg'] * 3
+
+    def test_iter_load_cgs_keeps_order(self):
+        cgs = list(ftme.iter_load_cgs(self.filenames, num_workers=2, chunksize=1))
+        self.assertEqual(len(cgs), len(self.filenames))
+        for fn, cg in zip(self.filenames, cgs):
+            nptest.assert_equal(cg.coords.get_array(), ftmc.CoarseGrainRNA(fn).coords.get_array())
+
+    def test_descriptors_from_filenames(self):
+        descriptors = ftme.descriptors_from_filenames(self.filenames, num_workers=2, chunksize=2)
+        ens = ftme.ensemble_from_filenames(self.filenames)
+        for descriptor in ftme.Ensemble.AVAILABLE_DESCRIPTORS:
+            nptest.assert_almost_equal(descriptors[descriptor], ens.get_descriptor(descriptor))
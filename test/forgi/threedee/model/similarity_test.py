@@ -3,8 +3,9 @@ import forgi.threedee.model.similarity as ftme
 import forgi.utilities.debug as fud
 import forgi.threedee.utilities.graph_pdb as ftug 
 import unittest
-import unittest, os, math
+import unittest, os, math, shutil, tempfile
 import numpy as np
+import numpy.testing as nptest
 import forgi.threedee.utilities.vector as ftuv
 
 import forgi.utilities.debug as fud
@@ -61,6 +62,37 @@ class CompareTest(unittest.TestCase):
         self.assertAlmostEqual(mcc, mcc_n)
         self.assertAlmostEqual(mcc_n, 1.0)
 
+    def test_adjacency_correlation_batch_like_evaluate(self):
+        cg1 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        cg2 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A_sampled.cg')
+        acc = ftme.AdjacencyCorrelation(cg1)
+        cgs = [cg2, cg1, cg2]
+        batch = acc.evaluate_batch(cgs)
+        for i, cg in enumerate(cgs):
+            cm = acc.evaluate(cg)
+            for key in ["tp", "tn", "fp", "fn"]:
+                self.assertEqual(batch[key][i], cm[key])
+            self.assertAlmostEqual(batch["mcc"][i], ftme.mcc(cm))
+
+    def test_adjacency_correlation_evaluate_coordinates(self):
+        cg1 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        cg2 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A_sampled.cg')
+        acc = ftme.AdjacencyCorrelation(cg1)
+        elements = list(cg2.coords)
+        coords = cg2.coords.get_array().reshape((1, -1, 2, 3))
+        cm = acc.evaluate_coordinates(coords, elements)
+        self.assertEqual(cm["tp"][0], acc.evaluate(cg2)["tp"])
+        self.assertAlmostEqual(cm["mcc"][0], ftme.mcc(acc.evaluate(cg2)))
+        with self.assertRaises(ValueError):
+            acc.evaluate_coordinates(coords[:, :-1])
+
+    def test_adjacency_correlation_without_coordinates(self):
+        cg = ftmc.CoarseGrainRNA()
+        cg.from_dotbracket("((((...))))....((((....))))..((((...))))")
+        ac = ftme.AdjacencyCorrelation(cg)
+        self.assertEqual(ac.get_interactions(cg), set())
+        self.assertEqual(ac.evaluate(cg), {"tp": 0, "tn": 1, "fp": 0, "fn": 0})
+
     def test_cg_rmsd(self):
         cg1 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
         cg2 = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A_sampled.cg')
@@ -74,6 +106,42 @@ class CompareTest(unittest.TestCase):
         self.assertAlmostEqual(ftme.cg_rmsd(cg1,cg2), 25.170088934277373)
 
 
+class TestRMSDMatrix(unittest.TestCase):
+    def setUp(self):
+        self.cgs = [ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg'),
+                    ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A_sampled.cg')]
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rmsd_matrix_like_rmsd(self):
+        np.random.seed(1)
+        coords = np.random.random((7, 10, 3))
+        coords[3] = -coords[2] #A reflection
+        expected = [ ftme.rmsd(coords[i], coords[j]) for i in range(7) for j in range(i+1, 7) ]
+        nptest.assert_almost_equal(ftme.rmsd_matrix(coords), expected)
+        nptest.assert_almost_equal(ftme.rmsd_matrix(coords, tile_size=3), expected)
+        nptest.assert_almost_equal(ftme.rmsd_matrix(coords, tile_size=2, num_workers=2), expected)
+
+    def test_cg_rmsd_matrix(self):
+        cgs = self.cgs * 2
+        rmsds = ftme.cg_rmsd_matrix(cgs, tile_size=1)
+        nptest.assert_almost_equal(rmsds, [ ftme.cg_rmsd(cgs[i], cgs[j])
+                                            for i in range(4) for j in range(i+1, 4) ])
+        nptest.assert_almost_equal(rmsds[1], 0)
+
+    def test_rmsd_matrix_without_pairs(self):
+        self.assertEqual(ftme.cg_rmsd_matrix([]).shape, (0,))
+        self.assertEqual(ftme.rmsd_matrix(np.zeros((0, 10, 3))).shape, (0,))
+        self.assertEqual(ftme.rmsd_matrix(np.ones((1, 10, 3))).shape, (0,))
+
+    def test_cg_rmsd_matrix_memmap(self):
+        filename = os.path.join(self.tmpdir, "rmsd.npy")
+        rmsds = ftme.cg_rmsd_matrix(self.cgs, memmap_filename=filename)
+        nptest.assert_almost_equal(np.load(filename), [ftme.cg_rmsd(*self.cgs)])
+        nptest.assert_almost_equal(rmsds, [ftme.cg_rmsd(*self.cgs)])
+
 class TestRMSD(unittest.TestCase):
     '''
     Test some of the rmsd-type functions.
@@ -0,0 +1,72 @@
+import unittest
+import itertools as it
+import numpy as np
+import forgi.threedee.model.coarse_grain as ftmc
+import forgi.threedee.model.spatial_index as ftmsi
+import forgi.threedee.utilities.vector as ftuv
+
+class TestSegmentGrid(unittest.TestCase):
+    def setUp(self):
+        self.cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+
+    def all_pairs_within(self, distance):
+        pairs = set()
+        for n1, n2 in it.combinations(sorted(self.cg.coords), 2):
+            if ftuv.elements_closer_than(self.cg.coords[n1][0], self.cg.coords[n1][1],
+                                         self.cg.coords[n2][0], self.cg.coords[n2][1], distance):
+                pairs.add((n1, n2))
+        return pairs
+
+    def test_pairs_within_like_all_pairs(self):
+        for cell_size in [None, 3., 50.]:
+            grid = ftmsi.SegmentGrid(self.cg.coords, cell_size)
+            for distance in [5., 15., 25.]:
+                self.assertEqual(grid.pairs_within(distance), self.all_pairs_within(distance))
+
+    def test_without_coordinates(self):
+        cg = ftmc.CoarseGrainRNA()
+        cg.from_dotbracket("((((...))))....((((....))))")
+        grid = ftmsi.SegmentGrid(cg.coords)
+        self.assertEqual(len(grid), 0)
+        self.assertEqual(grid.pairs_within(25.), set())
+
+    def test_elements_near(self):
+        grid = ftmsi.SegmentGrid(self.cg.coords)
+        point = self.cg.coords["s0"][0]
+        near = grid.elements_near(point, 10.)
+        self.assertIn("s0", near)
+        for elem in self.cg.coords:
+            p0, p1 = self.cg.coords[elem]
+            if elem in near:
+                self.assertLess(ftuv.vec_distance(point, ftuv.closest_point_on_seg(p0, p1, point)), 10.)
+            else:
+                self.assertGreaterEqual(ftuv.vec_distance(point, ftuv.closest_point_on_seg(p0, p1, point)), 10.)
+
+    def test_sync_after_moving_elements(self):
+        grid = ftmsi.SegmentGrid(self.cg.coords)
+        self.assertEqual(grid.sync(self.cg.coords), [])
+        p0, p1 = (np.copy(p) for p in self.cg.coords["h0"])
+        self.cg.coords["h0"] = p0 + 100., p1 + 100.
+        self.assertEqual(grid.sync(self.cg.coords), ["h0"])
+        self.assertEqual(grid.pairs_within(20.), self.all_pairs_within(20.))
+        self.assertIn("h0", grid.elements_near(p0 + 100., 1.))
+        self.assertNotIn("h0", grid.elements_near(p0, 1.))
+
+    def test_candidates_in_box_with_many_cells(self):
+        # Points in a grid with tiny cells
+        grid = ftmsi.SegmentGrid(cell_size=10**-6)
+        for elem in self.cg.coords:
+            grid.update(elem, (self.cg.coords[elem][0], self.cg.coords[elem][0]))
+        z = np.median([ self.cg.coords[elem][0][2] for elem in self.cg.coords ])
+        lower = np.array([-1000., -1000., -1000.])
+        upper = np.array([1000., 1000., z])
+        expected = set( elem for elem in self.cg.coords if self.cg.coords[elem][0][2] <= z )
+        self.assertLess(len(expected), len(self.cg.coords))
+        self.assertEqual(grid.candidates(lower, upper), expected)
+
+    def test_remove(self):
+        grid = ftmsi.SegmentGrid(self.cg.coords)
+        grid.remove("s0")
+        self.assertNotIn("s0", grid)
+        self.assertEqual(len(grid), len(self.cg.coords) - 1)
+        self.assertNotIn("s0", grid.elements_near(self.cg.coords["s0"][0], 10.))
@@ -1,6 +1,8 @@
 
-import unittest
+import unittest, os, shutil, tempfile, pickle
+import collections as c
 
+import forgi.config as cbc
 import forgi.threedee.model.coarse_grain as ftmc
 import forgi.threedee.model.stats as ftms
 import forgi.threedee.utilities.vector as ftuv
@@ -9,6 +11,305 @@ import forgi.utilities.debug as fud
 
 import math
 import numpy as np
+import numpy.testing as nptest
+
+class TestStatsLoading(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.stats_file = os.path.join(self.tmpdir, "real.stats")
+        shutil.copy('test/forgi/threedee/data/real.stats', self.stats_file)
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+        self.old_cache_dir = cbc.Configuration.stats_cache_dir
+        cbc.Configuration.stats_cache_dir = self.cache_dir
+
+    def tearDown(self):
+        cbc.Configuration.stats_cache_dir = self.old_cache_dir
+        shutil.rmtree(self.tmpdir)
+
+    def assert_tables_equal(self, tables1, tables2):
+        self.assertEqual(sorted(tables1.keys()), sorted(tables2.keys()))
+        for key in tables1:
+            self.assertEqual([ vars(stat) for stat in tables1[key] ],
+                             [ vars(stat) for stat in tables2[key] ])
+
+    def test_read_stats_file(self):
+        counts = c.Counter()
+        with open(self.stats_file) as f:
+            for line in f:
+                if line.strip():
+                    counts[line.split()[0]] += 1
+        tables = ftms.read_stats_file(self.stats_file)
+        for key in ["stem", "5prime", "3prime", "loop"]:
+            self.assertEqual(sum(len(stats) for stats in tables[key].values()), counts[key])
+        # Angle stats are stored in both orientations
+        self.assertEqual(sum(len(tables["angle"][key]) for key in tables["angle"].keys()),
+                         2 * counts["angle"])
+
+        stem, = [ stat for stat in tables["stem"][(5, 5)] if stat.pdb_name == "1F27_A" ]
+        self.assertAlmostEqual(stem.phys_length, 12.188)
+        self.assertAlmostEqual(stem.twist_angle, 2.29699218429)
+        self.assertEqual(stem.define, [1, 5, 14, 18])
+        loop, = [ stat for stat in tables["loop"][8] if stat.pdb_name == "1F27_A" ]
+        self.assertAlmostEqual(loop.phys_length, 16.1321906521)
+        self.assertAlmostEqual(loop.u, 2.0697873667)
+        self.assertAlmostEqual(loop.v, -0.0625903532583)
+        self.assertEqual(loop.define, [6, 13])
+        angle, = [ stat for stat in tables["angle"][(3, 6, 1)]
+                   if stat.pdb_name == "3NVI_E" and abs(stat.u - 2.24673344695) < 1e-8 ]
+        self.assertAlmostEqual(angle.r1, 19.6494150219)
+        self.assertEqual(angle.define, [4, 6, 15, 20])
+        self.assertEqual(angle.seqs, ["CUGAC", "GCGUGAUG"])
+
+    def test_load_stats_tables_keeps_tables_in_memory(self):
+        tables = ftms.load_stats_tables(self.stats_file)
+        shutil.rmtree(self.cache_dir)
+        loaded = ftms.load_stats_tables(self.stats_file)
+        self.assertFalse(os.path.exists(self.cache_dir))
+        self.assertIsNot(loaded["stem"], tables["stem"])
+        for key in tables:
+            self.assert_tables_equal(loaded[key], tables[key])
+        loaded["stem"][(5, 5)].append(ftms.StemStat("stem 1XXX_A 5 12.188 2.29699218429 1 5 14 18"))
+        self.assertEqual(len(ftms.get_stem_stats(self.stats_file, refresh=True)[(5, 5)]),
+                         len(tables["stem"][(5, 5)]))
+
+    def test_load_stats_tables_uses_cache(self):
+        tables = ftms.load_stats_tables(self.stats_file)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        ftms._pickled_stats_tables.clear()
+        cached = ftms.load_stats_tables(self.stats_file)
+        self.assertIsNot(cached["stem"], tables["stem"])
+        for key in tables:
+            self.assert_tables_equal(cached[key], tables[key])
+
+    def test_load_stats_tables_invalidates_cache(self):
+        ftms.load_stats_tables(self.stats_file)
+        with open(self.stats_file, "a") as f:
+            f.write("stem 1XXX_A 99 12.188 2.29699218429 1 5 14 18\n")
+        tables = ftms.load_stats_tables(self.stats_file)
+        self.assertIn((99, 99), tables["stem"])
+        self.assertIn((99, 99), ftms.load_stats_tables(self.stats_file)["stem"])
+
+    def test_load_stats_tables_ignores_broken_cache(self):
+        ftms.load_stats_tables(self.stats_file)
+        cache_file, = os.listdir(self.cache_dir)
+        with open(os.path.join(self.cache_dir, cache_file), "wb") as f:
+            f.write(b"garbage")
+        ftms._pickled_stats_tables.clear()
+        tables = ftms.load_stats_tables(self.stats_file)
+        self.assert_tables_equal(tables["stem"], ftms.read_stats_file(self.stats_file)["stem"])
+
+class TestAngleStatTable(unittest.TestCase):
+    def setUp(self):
+        self.stats = []
+        with open('test/forgi/threedee/data/real.stats') as f:
+            for line in f:
+                if line.startswith("angle"):
+                    stat = ftms.AngleStat()
+                    stat.parse_line(line)
+                    self.stats.append(stat)
+        self.table = ftms.AngleStatTable(self.stats)
+
+    def test_stats_available_in_both_orientations(self):
+        for stat in self.stats[:100]:
+            stats1 = [ vars(s) for s in self.table[(stat.dim1, stat.dim2, stat.ang_type)] ]
+            stats2 = [ vars(s) for s in self.table[(stat.dim2, stat.dim1, -stat.ang_type)] ]
+            self.assertIn(vars(stat), stats1)
+            self.assertIn(vars(stat), stats2)
+
+    def test_stats_are_created_once(self):
+        key = (1, 1, -1)
+        stat = self.table[key][0]
+        self.assertIs(stat, self.table[key][0])
+        self.assertIn(stat, self.table[(1, 1, 1)])
+
+    def test_missing_key(self):
+        self.assertNotIn((500, 500, 1), self.table)
+        self.assertEqual(len(self.table[(500, 500, 1)]), 0)
+        self.assertIn((500, 500, 1), self.table)
+        self.table[(501, 501, 1)].append(self.stats[0])
+        self.assertEqual(list(self.table[(501, 501, 1)]), [self.stats[0]])
+
+    def test_modify(self):
+        key = (1, 1, -1)
+        old_stats = list(self.table[key])
+        self.table[key] += [self.stats[0]]
+        self.assertEqual(list(self.table[key]), old_stats + [self.stats[0]])
+        self.table[key] = [self.stats[1]]
+        self.assertEqual(list(self.table[key]), [self.stats[1]])
+        del self.table[key]
+        self.assertNotIn(key, self.table)
+        self.assertNotIn(key, self.table.keys())
+        del self.table[(1, 1, 1)]
+        self.assertNotIn((1, 1, 1), self.table)
+        with self.assertRaises(KeyError):
+            del self.table[(1, 1, 1)]
+        self.assertEqual(len(self.table), len(self.table.keys()))
+        table = pickle.loads(pickle.dumps(self.table))
+        self.assertEqual(sorted(table.keys()), sorted(self.table.keys()))
+
+    def test_seqs(self):
+        stats = []
+        for seqs in [[], [""], ["", "ACG"], ["AC", "G"]]:
+            stat = ftms.AngleStat("1XXX_A", 1, 2, 0.1, 0.2, 0.3, 4., 0.5, 0.6, 1, [1, 2, 3, 4], seqs)
+            stats.append(stat)
+        table = ftms.AngleStatTable(stats)
+        self.assertEqual([ stat.seqs for stat in table[(1, 2, 1)] ],
+                         [[], [""], ["", "ACG"], ["AC", "G"]])
+
+    def test_diff_like_angle_stat_diff(self):
+        stats = self.table[(1, 2, 1)]
+        other = self.stats[0]
+        nptest.assert_allclose(stats.diff(other, 2), [ stat.diff(other, 2) for stat in stats ])
+        nearest, dist = stats.nearest(other, 2)
+        self.assertAlmostEqual(dist, min(stat.diff(other, 2) for stat in stats))
+        self.assertAlmostEqual(nearest.diff(other, 2), dist)
+
+    def test_params(self):
+        stats = self.table[(1, 2, 1)]
+        nptest.assert_equal(stats.params(), [ [s.u, s.v, s.t, s.r1, s.u1, s.v1] for s in stats ])
+
+    def test_pickle(self):
+        stat = self.table[(1, 1, -1)][0]
+        table = pickle.loads(pickle.dumps(self.table))
+        self.assertEqual(sorted(table.keys()), sorted(self.table.keys()))
+        self.assertEqual(vars(table[(1, 1, -1)][0]), vars(stat))
+
+class TestDimensionIndex(unittest.TestCase):
+    def setUp(self):
+        self.angle_stats = ftms.get_angle_stats('test/forgi/threedee/data/real.stats', refresh=True)
+        self.loop_stats = ftms.get_loop_stats('test/forgi/threedee/data/real.stats', refresh=True)
+
+    def test_nearest_like_get_angle_stat_dims(self):
+        index = ftms.DimensionIndex(self.angle_stats.keys())
+        for dims in [(0, 1), (1, 1), (3, 5), (7, 1000), (30, 2)]:
+            for ang_type in [1, -1, 4, -5]:
+                self.assertEqual(list(index.nearest(dims, ang_type)),
+                                 ftms.get_angle_stat_dims(dims[0], dims[1], ang_type))
+
+    def test_nearest_like_get_one_d_stat_dims(self):
+        index = ftms.DimensionIndex(self.loop_stats.keys())
+        for dim in [0, 3, 6, 50]:
+            self.assertEqual(list(index.nearest((dim,))),
+                             ftms.get_one_d_stat_dims(dim, self.loop_stats))
+
+    def test_nearest_unknown_ang_type(self):
+        index = ftms.DimensionIndex(self.angle_stats.keys())
+        self.assertEqual(list(index.nearest((1, 1), 17)), [])
+
+    def test_sample_stats_is_memoized(self):
+        cs = ftms.ConformationStats('test/forgi/threedee/data/real.stats')
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        stats = cs.sample_stats(cg, "i0")
+        self.assertGreater(len(stats), 10)
+        self.assertEqual(cs.sample_stats(cg, "i0"), stats)
+        self.assertGreater(len(cs.sample_stats(cg, "i0", min_entries=100)), len(stats))
+        self.assertGreater(len(cs.sample_stats(cg, "h0", min_entries=100)), 100)
+
+    def test_sample_stats_result_can_be_modified(self):
+        cs = ftms.ConformationStats('test/forgi/threedee/data/real.stats')
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        stats = cs.sample_stats(cg, "h0")
+        expected = list(stats)
+        stats.pop()
+        stats.append(None)
+        self.assertEqual(cs.sample_stats(cg, "h0"), expected)
+
+    def test_sample_stats_after_reassigning_stats(self):
+        cs = ftms.ConformationStats('test/forgi/threedee/data/real.stats')
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        cs.sample_stats(cg, "h0")
+        loop_stat = ftms.LoopStat("loop 1XXX_A 3 10.0 1.0 1.0 1 5")
+        cs.loop_stats = {3: [loop_stat]}
+        self.assertEqual(cs.sample_stats(cg, "h0"), [loop_stat])
+
+class TestClusteredAngleStats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "clustered.stats")
+        angle_stats = ftms.get_angle_stats('test/forgi/threedee/data/real.stats', refresh=True)
+        self.keys = [(1, 1, -1), (1, 2, 1), (2, 3, -1)]
+        with open(self.filename, "w") as f:
+            for key in self.keys:
+                stats = [ stat for stat in angle_stats[key] if (stat.dim1, stat.dim2, stat.ang_type) == key ]
+                for i, start in enumerate(range(0, 12, 4)):
+                    f.write("# Cluster {} for ({}, {}, {}):\n".format(i, *key))
+                    for stat in stats[start:start + 1 + i]:
+                        f.write(str(stat) + "\n")
+        self.stats = ftms.ClusteredAngleStats(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_getitem_returns_one_stat_per_cluster(self):
+        for key in self.keys:
+            for _ in range(10):
+                sampled = self.stats[key]
+                self.assertEqual([ self.stats.cluster_of(stat) for stat in sampled ], [0, 1, 2])
+        self.assertEqual(self.stats[(100, 100, 1)], [])
+
+    def test_getitem_samples_all_cluster_members(self):
+        sampled = set( id(self.stats[(1, 2, 1)][2]) for _ in range(100) )
+        self.assertEqual(len(sampled), 3)
+
+    def test_lookup_stat(self):
+        for key in self.keys:
+            for i, cluster in enumerate(self.stats._stats_dict[key]):
+                for stat in cluster:
+                    self.assertEqual(self.stats.cluster_of(stat), i)
+                    self.assertEqual(self.stats.lookup_stat(stat), (len(cluster), 6, 3))
+
+    def linear_cluster_of(self, stat):
+        for i, cluster in enumerate(self.stats._stats_dict[(stat.dim1, stat.dim2, stat.ang_type)]):
+            if stat in cluster:
+                return i
+        return -1
+
+    def test_cluster_of_like_linear_search(self):
+        for key in self.keys:
+            for cluster in self.stats._stats_dict[key]:
+                for stat in cluster:
+                    self.assertEqual(self.stats.cluster_of(stat), self.linear_cluster_of(stat))
+
+    def test_cluster_of_identical_stats_in_different_clusters(self):
+        # E.g. identical chains of one pdb: the first cluster with an equal stat is returned.
+        stat = self.stats._stats_dict[(1, 2, 1)][0][0]
+        with open(self.filename, "w") as f:
+            f.write("# Cluster 0 for (1, 2, 1):\n")
+            f.write(str(stat) + "\n")
+            f.write("# Cluster 1 for (1, 2, 1):\n")
+            f.write(str(stat).replace(stat.pdb_name, "OTHER_PDB") + "\n")
+        stats = ftms.ClusteredAngleStats(self.filename)
+        other = stats._stats_dict[(1, 2, 1)][1][0]
+        self.assertEqual(other.pdb_name, "OTHER_PDB")
+        self.assertEqual(stats.cluster_of(other), 0)
+        self.assertEqual(stats.lookup_stat(other), (1, 2, 2))
+
+    def test_lookup_stat_by_value(self):
+        stat = self.stats._stats_dict[(1, 2, 1)][1][0]
+        copy = ftms.AngleStat("other_pdb", stat.dim1, stat.dim2, stat.u, stat.v, stat.t,
+                              stat.r1, stat.u1, stat.v1, stat.ang_type, [1, 2, 3, 4])
+        self.assertEqual(self.stats.cluster_of(copy), 1)
+        self.assertEqual(self.stats.lookup_stat(copy), (2, 6, 3))
+        copy.u += 1
+        self.assertEqual(self.stats.cluster_of(copy), -1)
+        self.assertEqual(self.stats.lookup_stat(copy), (-1, 6, 3))
+        changed = ftms.AngleStat(stat.pdb_name, stat.dim1, stat.dim2, stat.u + 1, stat.v, stat.t,
+                                 stat.r1, stat.u1, stat.v1, stat.ang_type, stat.define)
+        self.assertEqual(self.stats.cluster_of(changed), -1)
+
+    def test_first_equal_clusters_asymmetric_tolerance(self):
+        # Only equal within the relative tolerance of the larger value.
+        # `stat in cluster` uses np.allclose(stat, member), scaled by the member.
+        small = ftms.AngleStat("PDB_A", 1, 2, 1e6, 0.5, 0.5, 10., 0.5, 0.5, 1, [1, 2, 3, 4])
+        large = ftms.AngleStat("PDB_B", 1, 2, 1e6 + 10.00005, 0.5, 0.5, 10., 0.5, 0.5, 1, [1, 2, 3, 4])
+        self.assertTrue(small in [large])
+        self.assertFalse(large in [small])
+        for stats in [[small, large], [large, small]]:
+            clusters = [[stat] for stat in stats]
+            first_equal = ftms.ClusteredAngleStats._first_equal_clusters(stats, np.arange(2))
+            linear = [ min(i for i, cluster in enumerate(clusters) if stat in cluster)
+                       for stat in stats ]
+            self.assertEqual(list(first_equal), linear)
 
 class TestStats(unittest.TestCase):
     '''
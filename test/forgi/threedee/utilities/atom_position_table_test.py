@@ -0,0 +1,82 @@
+import unittest, os, shutil, tempfile
+import numpy as np
+import numpy.testing as nptest
+import forgi.threedee.utilities.atom_position_table as ftuat
+import forgi.threedee.utilities.average_stem_vres_atom_positions as ftus
+
+class AtomPositionTableTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.basename = os.path.join(self.tmpdir, "positions")
+        self.positions = {"0 A C1*": [1., 2., 3.],
+                          "0 A P": [-1.5, 0.25, 100.],
+                          "1 G C1*": [0.1, 0.2, 0.3]}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_and_read(self):
+        ftuat.write_atom_position_table(self.basename, self.positions)
+        self.assertEqual(np.load(self.basename + ".npy").dtype, np.float32)
+        table = ftuat.AtomPositionTable(self.basename)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(sorted(table.keys()), sorted(self.positions.keys()))
+        for identifier, position in self.positions.items():
+            nptest.assert_allclose(table[identifier], position, rtol=1e-6)
+        self.assertNotIn("1 G P", table)
+        with self.assertRaises(KeyError):
+            table["1 G P"]
+
+    def test_missing_files(self):
+        table = ftuat.AtomPositionTable(self.basename, "Create the table first")
+        self.assertFalse(table.exists())
+        with self.assertRaisesRegexp(IOError, "Create the table first"):
+            table["0 A P"]
+        ftuat.write_atom_position_table(self.basename, self.positions)
+        self.assertTrue(table.exists())
+
+    def test_files_are_read_on_first_access(self):
+        table = ftuat.AtomPositionTable(self.basename)
+        ftuat.write_atom_position_table(self.basename, self.positions)
+        self.assertIn("0 A P", table)
+
+    def test_nested(self):
+        ftuat.write_atom_position_table(self.basename, self.positions)
+        nested = ftuat.AtomPositionTable(self.basename).nested([int, str, str])
+        nptest.assert_allclose(nested[0]["A"]["P"], [-1.5, 0.25, 100.])
+        self.assertEqual(sorted(nested.keys()), [0, 1])
+        self.assertEqual(len(nested), 2)
+        self.assertEqual(sorted(nested[0]["A"].keys()), ["C1*", "P"])
+        self.assertEqual([ key for key, _ in nested[0]["A"].items() ], ["C1*", "P"])
+        self.assertIn(0, nested)
+        self.assertIn("A", nested[0])
+        self.assertIn("P", nested[0]["A"])
+        self.assertNotIn(2, nested)
+        self.assertNotIn("G", nested[0])
+        self.assertNotIn("P", nested[1]["G"])
+        with self.assertRaises(KeyError):
+            nested[2]
+        with self.assertRaises(KeyError):
+            nested[0]["G"]
+        with self.assertRaises(KeyError):
+            nested[1]["G"]["P"]
+
+    def test_nested_with_fields(self):
+        table = ftuat.AtomPositionTable(self.basename)
+        nested = table.nested([str, str], [1])
+        ftuat.write_atom_position_table(self.basename, self.positions)
+        self.assertEqual(nested.keys(), ["G"])
+        nptest.assert_allclose(nested["G"]["C1*"], table["1 G C1*"])
+
+class AverageStemVresAtomPositionsTest(unittest.TestCase):
+    def test_structure(self):
+        self.assertEqual(len(ftus.avg_stem_vres_atom_coords), 2)
+        for side in range(2):
+            self.assertEqual(sorted(ftus.avg_stem_vres_atom_coords[side].keys()), ["A", "C", "G", "U"])
+            self.assertIn("C1*", ftus.avg_stem_vres_atom_coords[side]["A"])
+
+    def test_positions(self):
+        nptest.assert_allclose(ftus.avg_stem_vres_atom_coords[0]['A']['C1*'],
+                               [2.12270781518, 6.58104298144, -4.83654584851], rtol=1e-6)
+        nptest.assert_allclose(ftus.avg_stem_vres_atom_coords[1]['G']["O3'"],
+                               [-3.31296079838, -0.218382731865, 1.34505001615], rtol=1e-6)
@@ -6,6 +6,8 @@ class AverageAtomPositionsTest(unittest.TestCase):
     def setUp(self):
         pass
 
+    @unittest.skipUnless(ftua.avg_atom_poss.exists(),
+                         "The average atom positions for loops are not available.")
     def test_key1(self):
         key = "h 9 -1 0 7 C4'"
 
@@ -93,6 +93,46 @@ class TestGraphPDB(unittest.TestCase):
                   msg="global pos for (0,0,1) should be {}+{}={}, but is {} instead.".format(
                                                   vbasis[2], offset, vbasis[2]+offset, global_pos))
         
+    def test_add_virtual_residues_batch_like_core(self):
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        cg.add_all_virtual_residues()
+        for stem in cg.stem_iterator():
+            stem_len = cg.stem_length(stem)
+            for i in range(stem_len):
+                vres = ftug.virtual_res_3d_pos_core(cg.coords[stem], cg.twists[stem], i, stem_len)
+                vbasis = ftug.virtual_res_basis_core(cg.coords[stem], cg.twists[stem], i, stem_len, vres[1])
+                nptest.assert_almost_equal(cg.v3dposs[stem][i], vres)
+                nptest.assert_almost_equal(cg.vbases[stem][i], vbasis)
+                nptest.assert_almost_equal(cg.vinvs[stem][i], np.linalg.inv(vbasis.T))
+                row = cg.vres_arrays.offsets[stem] + i
+                nptest.assert_equal(cg.vres_arrays.v3dposs[row], cg.v3dposs[stem][i])
+
+    def test_add_virtual_residues_updates_arrays(self):
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        cg.add_all_virtual_residues()
+        cg.coords["s1"] = cg.coords["s1"][0] + 5, cg.coords["s1"][1] + 5
+        ftug.add_virtual_residues(cg, "s1")
+        arrays = cg.vres_arrays
+        row = arrays.offsets["s1"]
+        nptest.assert_equal(arrays.v3dposs[row][0], cg.vposs["s1"][0])
+        stem_len = cg.stem_length("s1")
+        vres = ftug.virtual_res_3d_pos_core(cg.coords["s1"], cg.twists["s1"], 0, stem_len)
+        nptest.assert_almost_equal(cg.vposs["s1"][0], vres[0])
+
+    def test_add_virtual_residues_keeps_old_values(self):
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        cg.add_all_virtual_residues()
+        arrays = cg.vres_arrays
+        old_vpos = cg.vposs["s1"][0]
+        old_copy = np.array(old_vpos)
+        old_row = np.array(arrays.v3dposs[arrays.offsets["s1"]])
+        cg.coords["s1"] = cg.coords["s1"][0] + 5, cg.coords["s1"][1] + 5
+        ftug.add_virtual_residues(cg, "s1")
+        self.assertIsNot(cg.vres_arrays, arrays)
+        nptest.assert_equal(old_vpos, old_copy)
+        nptest.assert_equal(arrays.v3dposs[arrays.offsets["s1"]], old_row)
+        nptest.assert_almost_equal(cg.vposs["s1"][0], old_copy + 5)
+
     def test_virtual_residue_atoms(self):
         cg = ftmc.from_pdb('test/forgi/threedee/data/1y26.pdb')
 
@@ -259,3 +299,65 @@ class TestAtomPosition_VirtualAtoms(unittest.TestCase):
 
 
 
+
+class TestAllVirtualAtoms(unittest.TestCase):
+    def setUp(self):
+        self.cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+
+    def compare_to_lookup(self, va, lookup):
+        i = 0
+        for r in sorted(set(va.residues)):
+            for aname, coords in lookup[r].items():
+                self.assertEqual(va.residues[i], r)
+                self.assertEqual(va.atom_names[i], aname)
+                self.assertEqual(va.elements[i], self.cg.get_node_from_residue_num(r))
+                nptest.assert_almost_equal(va.coords[i], coords)
+                i += 1
+        self.assertEqual(i, len(va.coords))
+
+    def test_all_virtual_atoms_stems_like_lookup(self):
+        stems = list(self.cg.stem_iterator())
+        for sidechain in [True, False]:
+            va = ftug.all_virtual_atoms(self.cg, sidechain=sidechain, elements=stems)
+            self.assertEqual(va.coords.shape[1], 3)
+            self.assertEqual(len(va.coords), len(va.residues))
+            self.compare_to_lookup(va, ftug.virtual_atoms(self.cg, sidechain=sidechain))
+
+    def test_all_virtual_atoms_given_atom_names(self):
+        va = ftug.all_virtual_atoms(self.cg, given_atom_names=["C1'"], elements=["s0"])
+        self.assertEqual(len(va.coords), 2*self.cg.stem_length("s0"))
+        self.assertEqual(set(va.atom_names), set(["C1'"]))
+
+    @unittest.skipUnless(ftug.ftua.avg_atom_poss.exists(),
+                         "The average atom positions for loops are not available.")
+    def test_all_virtual_atoms_whole_molecule(self):
+        va = ftug.all_virtual_atoms(self.cg)
+        self.assertEqual(set(va.residues), set(range(1, self.cg.seq_length+1)))
+        self.compare_to_lookup(va, ftug.virtual_atoms(self.cg))
+
+    def test_all_virtual_atoms_overlapping_defines(self):
+        # In 3pdr_X, t1 overlaps s0. The loop atom positions are replaced by
+        # zeros, because they are not needed for the bookkeeping under test.
+        class ZeroPositions(object):
+            def __getitem__(self, identifier):
+                return np.zeros(3)
+        self.cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/3pdr_X.cg')
+        avg_atom_poss = ftug.ftua.avg_atom_poss
+        ftug.ftua.avg_atom_poss = ZeroPositions()
+        try:
+            va = ftug.all_virtual_atoms(self.cg)
+            self.assertEqual(set(va.residues), set(range(1, self.cg.seq_length+1)))
+            self.compare_to_lookup(va, ftug.virtual_atoms(self.cg))
+            self.assertEqual(set(ftug.all_virtual_atoms(self.cg, elements=["t1"]).residues), set([161]))
+        finally:
+            ftug.ftua.avg_atom_poss = avg_atom_poss
+
+class TestElementDistances(unittest.TestCase):
+    def test_element_distances_like_element_distance(self):
+        cg = ftmc.CoarseGrainRNA('test/forgi/threedee/data/1GID_A.cg')
+        elements = sorted(cg.defines)
+        distances = ftug.element_distances(cg, elements, ["s0", "h1"])
+        self.assertEqual(distances.shape, (len(elements), 2))
+        for i, elem in enumerate(elements):
+            self.assertAlmostEqual(distances[i, 0], ftug.element_distance(cg, elem, "s0"))
+            self.assertAlmostEqual(distances[i, 1], ftug.element_distance(cg, elem, "h1"))
@@ -145,6 +145,46 @@ class TestVector(unittest.TestCase):
           for b in basis:
               self.assertAlmostEqual(ftuv.magnitude(b),1)
 
+    def test_create_orthonormal_bases(self):
+        vecs1 = np.array([[0.,0.,2.], [1.,1.,0.], [3.,0.,0.]])
+        vecs2 = np.array([[0.,3.6,0.], [1.,-1.,2.], [0.,0.,-1.]])
+        bases = ftuv.create_orthonormal_bases(vecs1, vecs2)
+        self.assertEqual(bases.shape, (3,3,3))
+        for i in range(3):
+            nptest.assert_almost_equal(bases[i], ftuv.create_orthonormal_basis(vecs1[i], vecs2[i]))
+        with self.assertRaises(ValueError):
+            ftuv.create_orthonormal_bases(vecs1, vecs1)
+
+    def test_line_segment_distances_like_scalar(self):
+        segs = np.array([[[0.,0.,0.], [1.,0.,0.]],
+                         [[0.,1.,0.], [1.,1.,0.]],   #Parallel to segment 0
+                         [[2.,2.,2.], [2.,2.,2.]],   #Zero length
+                         [[-1.,-1.,3.], [2.,0.,-4.]],
+                         [[5.,0.,0.], [6.,0.,0.]],   #On the same line as segment 0
+                         [[0.5,-1.,1.], [0.5,1.,1.]]])
+        segs = np.concatenate([segs, np.random.normal(size=(10,2,3))*3])
+        distances, sc, tc = ftuv.line_segment_distances(segs, segs)
+        closer = ftuv.elements_closer_than_array(segs, segs, 1.5)
+        for i in range(len(segs)):
+            for j in range(len(segs)):
+                i1, i2 = ftuv.line_segment_distance(segs[i,0], segs[i,1], segs[j,0], segs[j,1])
+                nptest.assert_almost_equal(segs[i,0] + sc[i,j] * (segs[i,1] - segs[i,0]), i1)
+                nptest.assert_almost_equal(segs[j,0] + tc[i,j] * (segs[j,1] - segs[j,0]), i2)
+                self.assertAlmostEqual(distances[i,j], ftuv.vec_distance(i1, i2))
+                self.assertEqual(closer[i,j], ftuv.elements_closer_than(segs[i,0], segs[i,1],
+                                                                        segs[j,0], segs[j,1], 1.5))
+
+    def test_line_segment_distances_paired(self):
+        segs1 = np.random.normal(size=(5,2,3))
+        segs2 = np.random.normal(size=(5,2,3))
+        distances, sc, tc = ftuv.line_segment_distances(segs1, segs2, paired=True)
+        self.assertEqual(distances.shape, (5,))
+        nptest.assert_almost_equal(distances, np.diag(ftuv.line_segment_distances(segs1, segs2)[0]))
+        nptest.assert_equal(ftuv.elements_closer_than_array(segs1, segs2, 1., paired=True),
+                            np.diag(ftuv.elements_closer_than_array(segs1, segs2, 1.)))
+        with self.assertRaises(ValueError):
+            ftuv.line_segment_distances(segs1, segs2[:3], paired=True)
+
     def test_spherical_coordinate_transforms(self):
         for vec in [np.array([0,0,1]), np.array([0,2,0]), np.array([3,0,0]), np.array([4,5,0]), np.array([6,0,7]), np.array([8,9,0.4])]:
             sphe=ftuv.spherical_cartesian_to_polar(vec)